@@ -0,0 +1,335 @@
+"""Hot/cold archival of order history.
+
+Paid orders older than ARCHIVE_AFTER_DAYS move, together with their KOTs
+and lines, from the live database into an archive database that every
+connection ATTACHes as ``archive``. The live orders/kot/order_items tables
+then only hold recent and open work, so the POS and kitchen paths stay
+small enough to live in the page cache. The sales rollups are not
+archived; dashboards read them as before.
+
+An order moves in two short transactions per batch: its rows are copied
+into the archive (INSERT OR REPLACE, so a rerun is harmless), then deleted
+from the live tables. The copy commits first, so a crash in between leaves
+an order in both databases rather than in neither. Readers never count it
+twice: the archive side of every history read skips orders still present
+in the live tables.
+
+History reads span both databases through:
+
+  all_orders, all_kot, all_order_items
+      temp views (live UNION ALL archive) for single-table reads. SQLite
+      flattens ``SELECT ... FROM all_orders WHERE ... ORDER BY ... LIMIT``
+      into a merge of two index scans.
+  spanning(select)
+      for joins, which SQLite cannot push through a UNION ALL view: runs
+      the whole join once per database. An order's KOTs and lines always
+      sit in the same database as the order, so a join never crosses over.
+
+Archived orders are read-only; status changes only find live orders. The
+live file does not shrink by itself, but the pages freed by archival are
+reused by new orders, so it stops growing; ``--vacuum`` compacts it
+offline.
+
+    python archive.py --days 90
+"""
+import asyncio
+import logging
+import os
+import time
+
+ARCHIVE_AFTER_DAYS = int(os.environ.get("ARCHIVE_AFTER_DAYS", "90"))
+# Orders per batch; each batch holds the write lock for a few milliseconds
+ARCHIVE_BATCH_SIZE = int(os.environ.get("ARCHIVE_BATCH_SIZE", "200"))
+# Pause between batches so POS writes get the lock in between
+ARCHIVE_BATCH_PAUSE = 0.05
+# Scheduled runs inside the app; 0 leaves archival to `python archive.py`
+ARCHIVE_INTERVAL_HOURS = float(os.environ.get("ARCHIVE_INTERVAL_HOURS", "24"))
+ARCHIVE_FIRST_RUN_DELAY = 60
+# Rows sampled per index when refreshing the archive's planner statistics
+ARCHIVE_ANALYSIS_LIMIT = 1000
+
+logger = logging.getLogger(__name__)
+
+ORDER_COLUMNS = "id, table_id, items, total_amount, status, created_by, created_at, completed_at"
+KOT_COLUMNS = "id, order_id, items, status, kitchen_station, created_at, started_at, completed_at"
+ORDER_ITEM_COLUMNS = "id, order_id, kot_id, menu_item_id, name, quantity, price, notes, status, created_at"
+
+# (table, columns, column holding the order id), parents first
+HISTORY_TABLES = (
+    ("orders", ORDER_COLUMNS, "id"),
+    ("kot", KOT_COLUMNS, "order_id"),
+    ("order_items", ORDER_ITEM_COLUMNS, "order_id"),
+)
+
+def _still_live(order_id):
+    return f"NOT EXISTS (SELECT 1 FROM main.orders live WHERE live.id = {order_id})"
+
+def attach(conn, path):
+    # Per connection: the archive, and the views over both databases. Views
+    # are resolved when used, so they can be created before the archive
+    # tables exist.
+    conn.execute("ATTACH DATABASE ? AS archive", (path,))
+    conn.execute("PRAGMA archive.journal_mode = WAL")
+    conn.execute("PRAGMA archive.synchronous = NORMAL")
+    for table, columns, key in HISTORY_TABLES:
+        conn.execute(
+            f"CREATE TEMP VIEW IF NOT EXISTS all_{table} AS "
+            f"SELECT {columns} FROM main.{table} UNION ALL "
+            f"SELECT {columns} FROM archive.{table} a WHERE {_still_live(f'a.{key}')}"
+        )
+
+def is_attached(conn):
+    return any(row[1] == "archive" for row in conn.execute("PRAGMA database_list"))
+
+def spanning(select, params=(), order_id="o.id"):
+    # ``select`` names the history tables {db}.orders, {db}.kot and
+    # {db}.order_items and must end with its WHERE clause; ``order_id`` is
+    # the expression for the order each row belongs to. Returns the query
+    # over both databases and the parameters for it. To sort or aggregate,
+    # select from it as a subquery.
+    live = select.format(db="main")
+    archived = select.format(db="archive") + f" AND {_still_live(order_id)}"
+    return f"{live} UNION ALL {archived}", list(params) * 2
+
+def _migrate_archive_base(conn):
+    cursor = conn.cursor()
+    # Same columns as the live tables, minus AUTOINCREMENT and foreign keys:
+    # ids come from the live database and rows arrive a whole order at a time
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS archive.orders (
+        id INTEGER PRIMARY KEY,
+        table_id INTEGER,
+        items TEXT NOT NULL,
+        total_amount REAL NOT NULL,
+        status TEXT,
+        created_by INTEGER,
+        created_at TIMESTAMP,
+        completed_at TIMESTAMP
+    )
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS archive.kot (
+        id INTEGER PRIMARY KEY,
+        order_id INTEGER NOT NULL,
+        items TEXT NOT NULL,
+        status TEXT,
+        kitchen_station TEXT,
+        created_at TIMESTAMP,
+        started_at TIMESTAMP,
+        completed_at TIMESTAMP
+    )
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS archive.order_items (
+        id INTEGER PRIMARY KEY,
+        order_id INTEGER NOT NULL,
+        kot_id INTEGER,
+        menu_item_id INTEGER,
+        name TEXT NOT NULL,
+        quantity INTEGER NOT NULL,
+        price REAL NOT NULL,
+        notes TEXT,
+        status TEXT,
+        created_at TIMESTAMP
+    )
+    ''')
+    # The history indexes of the live tables, so both halves of a spanning
+    # read are index scans in the same order
+    cursor.execute("CREATE INDEX IF NOT EXISTS archive.idx_orders_created ON orders (created_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS archive.idx_orders_status_created ON orders (status, created_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS archive.idx_orders_table ON orders (table_id, created_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS archive.idx_kot_order ON kot (order_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS archive.idx_kot_created ON kot (created_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS archive.idx_kot_status_created ON kot (status, created_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS archive.idx_order_items_order ON order_items (order_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS archive.idx_order_items_kot ON order_items (kot_id)")
+
+# Versioned separately from the live database (PRAGMA archive.user_version)
+ARCHIVE_MIGRATIONS = [
+    _migrate_archive_base,
+]
+
+def migrate(conn):
+    # Same scheme as database.migrate, for the attached archive
+    applied = []
+    for version, migration in enumerate(ARCHIVE_MIGRATIONS, start=1):
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            current = conn.execute("PRAGMA archive.user_version").fetchone()[0]
+            if current >= version:
+                conn.rollback()
+                continue
+            migration(conn)
+            conn.execute(f"PRAGMA archive.user_version = {version}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append(migration.__name__)
+    return applied
+
+# Paid orders past the cutoff with nothing left on the kitchen screen,
+# oldest first, through idx_orders_status_created
+ELIGIBLE_SQL = """
+    SELECT o.id FROM main.orders o
+    WHERE o.status = 'paid' AND o.created_at < ?
+      AND NOT EXISTS (
+          SELECT 1 FROM main.kot k
+          WHERE k.order_id = o.id AND k.status IN ('pending', 'preparing', 'ready')
+      )
+    ORDER BY o.created_at
+    LIMIT ?
+"""
+
+def archive_batch(conn, cutoff, batch_size=ARCHIVE_BATCH_SIZE):
+    # Moves up to ``batch_size`` orders created before ``cutoff``; returns
+    # how many moved
+    ids = [row[0] for row in conn.execute(ELIGIBLE_SQL, (cutoff, batch_size))]
+    if not ids:
+        return 0
+    placeholders = ", ".join("?" * len(ids))
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        for table, columns, key in HISTORY_TABLES:
+            conn.execute(
+                f"INSERT OR REPLACE INTO archive.{table} ({columns}) "
+                f"SELECT {columns} FROM main.{table} WHERE {key} IN ({placeholders})",
+                ids
+            )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # Only orders that are still archivable; one reopened in between
+        # stays live, and its copy stays hidden behind it
+        ids = [row[0] for row in conn.execute(
+            f"SELECT id FROM main.orders WHERE id IN ({placeholders}) AND status = 'paid'", ids
+        )]
+        placeholders = ", ".join("?" * len(ids))
+        for table, _, key in reversed(HISTORY_TABLES):
+            conn.execute(f"DELETE FROM main.{table} WHERE {key} IN ({placeholders})", ids)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return len(ids)
+
+def cutoff_for(conn, days):
+    # created_at is CURRENT_TIMESTAMP text, so the cutoff comes from SQLite too
+    return conn.execute("SELECT datetime('now', ?)", (f"-{days} days",)).fetchone()[0]
+
+def refresh_statistics(conn):
+    # A freshly filled archive has no sqlite_stat1, and without it the
+    # planner may start the archive half of a join from the wrong table
+    conn.execute(f"PRAGMA analysis_limit = {ARCHIVE_ANALYSIS_LIMIT}")
+    try:
+        conn.execute("ANALYZE archive")
+        conn.commit()
+    finally:
+        conn.execute("PRAGMA analysis_limit = 0")
+
+def archive_all(conn, days=ARCHIVE_AFTER_DAYS, batch_size=ARCHIVE_BATCH_SIZE, pause=ARCHIVE_BATCH_PAUSE):
+    # Synchronous run for the command line
+    cutoff = cutoff_for(conn, days)
+    moved = batches = 0
+    while True:
+        count = archive_batch(conn, cutoff, batch_size)
+        if not count:
+            break
+        moved += count
+        batches += 1
+        time.sleep(pause)
+    if moved:
+        refresh_statistics(conn)
+    return {"cutoff": cutoff, "orders": moved, "batches": batches}
+
+class Archiver:
+    """Runs archival every ``interval_hours`` inside the app.
+
+    Each batch is a separate db.run() call on a pooled connection, not a
+    db.write(): the group-commit writer defers commit() to the end of its
+    batch, and archive_batch needs its copy committed before the delete.
+    Batches therefore take SQLite's write lock themselves, like a second
+    process would, and the writer waits for them through busy_timeout. A
+    pause after each keeps the lock free between batches. Several workers
+    may each run one; batches are idempotent and serialize on the lock.
+    """
+
+    def __init__(self, days=ARCHIVE_AFTER_DAYS, batch_size=ARCHIVE_BATCH_SIZE,
+                 interval_hours=ARCHIVE_INTERVAL_HOURS, pause=ARCHIVE_BATCH_PAUSE):
+        self.days = days
+        self.batch_size = batch_size
+        self.interval = interval_hours * 3600
+        self.pause = pause
+        self.runs = 0
+        self.orders_moved = 0
+        self.last_run = None
+        self._task = None
+
+    async def run_once(self, db):
+        cutoff = await db.run(cutoff_for, self.days)
+        started = time.perf_counter()
+        moved = 0
+        while True:
+            count = await db.run(archive_batch, cutoff, self.batch_size)
+            if not count:
+                break
+            moved += count
+            self.orders_moved += count
+            await asyncio.sleep(self.pause)
+        if moved:
+            await db.run(refresh_statistics)
+            logger.info("Archived %d orders created before %s in %.1fs", moved, cutoff, time.perf_counter() - started)
+        self.runs += 1
+        self.last_run = {"cutoff": cutoff, "orders": moved, "seconds": round(time.perf_counter() - started, 2)}
+        return moved
+
+    async def _loop(self, db):
+        await asyncio.sleep(ARCHIVE_FIRST_RUN_DELAY)
+        while True:
+            try:
+                await self.run_once(db)
+            except Exception:
+                logger.exception("Archival run failed")
+            await asyncio.sleep(self.interval)
+
+    def start(self, db):
+        if self._task is None and self.interval > 0:
+            self._task = asyncio.create_task(self._loop(db))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self):
+        return {"runs": self.runs, "orders_moved": self.orders_moved, "last_run": self.last_run}
+
+archiver = Archiver()
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    from database import init_db, pool
+
+    parser = argparse.ArgumentParser(description="Move old paid orders into the archive database.")
+    parser.add_argument("--days", type=int, default=ARCHIVE_AFTER_DAYS)
+    parser.add_argument("--batch-size", type=int, default=ARCHIVE_BATCH_SIZE)
+    parser.add_argument("--vacuum", action="store_true", help="compact the live database afterwards (blocks writers)")
+    args = parser.parse_args()
+
+    init_db()
+    with pool.connection() as conn:
+        summary = archive_all(conn, args.days, args.batch_size)
+        if args.vacuum:
+            conn.execute("VACUUM main")
+    print(json.dumps(summary, indent=2))
@@ -0,0 +1,147 @@
+"""Hot/cold archival on a long history.
+
+Generates ``--orders`` orders over two years (benchmarks/generate_dataset.py),
+then times the live paths and history reads before and after archiving
+everything paid more than ``--days`` ago (archive.py). While the archiver
+runs, waiters keep opening and settling tabs, so the report also shows what
+archival costs the POS write path. Ends with the pages the live order
+tables occupy (their working set) before and after.
+
+    python -m benchmarks.bench_archive --orders 200000
+"""
+import argparse
+import asyncio
+import json
+import os
+import sqlite3
+import statistics
+import time
+
+import httpx
+
+from benchmarks.common import admin_headers, load_app, summarize, temp_db_path
+
+def live_pages(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return dict(conn.execute(
+            "SELECT name, COUNT(*) FROM dbstat WHERE name IN ('orders', 'kot', 'order_items') GROUP BY name"
+        ).fetchall())
+    except sqlite3.OperationalError:  # SQLite built without dbstat
+        return {}
+    finally:
+        conn.close()
+
+async def timed(client, headers, method, path, rounds, **kwargs):
+    samples = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        resp = await client.request(method, path, headers=headers, **kwargs)
+        samples.append((time.perf_counter() - started) * 1000)
+        resp.raise_for_status()
+    return round(statistics.median(samples), 2)
+
+async def open_and_settle(client, headers, table_id):
+    items = [{"menu_item_id": 1, "name": "Masala Chai", "quantity": 2, "price": 20.0, "notes": None}]
+    resp = await client.post(
+        "/api/orders/", json={"table_id": table_id, "items": items, "total_amount": 40.0}, headers=headers
+    )
+    resp.raise_for_status()
+    order_id = resp.json()["id"]
+    (await client.patch(f"/api/orders/{order_id}/status", json={"status": "paid"}, headers=headers)).raise_for_status()
+
+async def measure(client, headers, table_id, rounds):
+    results = {}
+    samples = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        await open_and_settle(client, headers, table_id)
+        samples.append((time.perf_counter() - started) * 1000)
+    results["open + settle tab"] = round(statistics.median(samples), 2)
+    for label, path in [
+        ("kds active", "/api/kds/active"),
+        ("orders page 1", "/api/orders/?limit=100"),
+        ("paid orders page 1", "/api/orders/?status=paid&limit=100"),
+        ("oldest KOTs page 1", "/api/kot/?limit=100"),
+        ("sales stats", "/api/sales/stats"),
+    ]:
+        results[label] = await timed(client, headers, "GET", path, rounds)
+    return results
+
+async def main(args):
+    from benchmarks.generate_dataset import generate
+
+    db_path = temp_db_path()
+    # generate() imports database, which reads DATABASE_URL once; point it
+    # at the throwaway file first
+    os.environ["DATABASE_URL"] = db_path
+    print(f"Generating {args.orders:,} orders", flush=True)
+    generate(db_path, orders=args.orders, seed=args.seed, log=lambda line: None)
+    app = load_app(db_path)
+    import archive
+    from database import db
+
+    conn = sqlite3.connect(db_path)
+    tables = [row[0] for row in conn.execute("SELECT id FROM tables WHERE status = 'available' ORDER BY id")]
+    conn.close()
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=600) as client:
+        headers = await admin_headers(client)
+        pages_before = live_pages(db_path)
+        before = await measure(client, headers, tables[0], args.rounds)
+
+        # Time every batch, and keep the waiters working meanwhile
+        batch_ms = []
+        archive_batch = archive.archive_batch
+
+        def timed_batch(conn, cutoff, batch_size):
+            started = time.perf_counter()
+            try:
+                return archive_batch(conn, cutoff, batch_size)
+            finally:
+                batch_ms.append((time.perf_counter() - started) * 1000)
+
+        archive.archive_batch = timed_batch
+        archiver = archive.Archiver(days=args.days, batch_size=args.batch_size)
+        done = asyncio.Event()
+        write_ms = []
+
+        async def waiter(table_id):
+            while not done.is_set():
+                started = time.perf_counter()
+                await open_and_settle(client, headers, table_id)
+                write_ms.append((time.perf_counter() - started) * 1000)
+
+        waiters = [asyncio.create_task(waiter(table_id)) for table_id in tables[1:1 + args.waiters]]
+        started = time.perf_counter()
+        moved = await archiver.run_once(db)
+        elapsed = time.perf_counter() - started
+        done.set()
+        await asyncio.gather(*waiters)
+        archive.archive_batch = archive_batch
+
+        after = await measure(client, headers, tables[0], args.rounds)
+        pages_after = live_pages(db_path)
+
+    archive_path = os.path.splitext(db_path)[0] + "_archive.db"
+    print(json.dumps({
+        "orders": args.orders,
+        "archived": moved,
+        "archive_seconds": round(elapsed, 1),
+        "batch_ms": summarize(batch_ms),
+        "tab_latency_during_archival_ms": summarize(write_ms),
+        "median_ms": {label: {"before": before[label], "after": after[label]} for label in before},
+        "live_table_pages": {"before": pages_before, "after": pages_after},
+        "archive_mb": round(os.path.getsize(archive_path) / 2**20, 1),
+    }, indent=2))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--orders", type=int, default=200000)
+    parser.add_argument("--days", type=int, default=90, help="archive paid orders older than this")
+    parser.add_argument("--batch-size", type=int, default=200)
+    parser.add_argument("--waiters", type=int, default=4)
+    parser.add_argument("--rounds", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=42)
+    asyncio.run(main(parser.parse_args()))
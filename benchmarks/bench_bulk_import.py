@@ -0,0 +1,65 @@
+"""Onboarding a menu: one bulk request vs one POST per item.
+
+Creates ``--rows`` menu items through POST /api/menu/ one at a time, then
+the same number through a single POST /api/menu/bulk (JSON and CSV), and
+reports wall time for each.
+
+    python -m benchmarks.bench_bulk_import --rows 500
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+
+from benchmarks.common import admin_headers, load_app, temp_db_path
+
+def menu_rows(prefix, count):
+    return [
+        {"name": f"{prefix} {i}", "category": "Bench", "price": 10 + i % 90, "description": "seeded"}
+        for i in range(count)
+    ]
+
+def as_csv(rows):
+    lines = ["name,category,price,description"]
+    lines += [f"{r['name']},{r['category']},{r['price']},{r['description']}" for r in rows]
+    return "\n".join(lines).encode("utf-8")
+
+async def main(args):
+    app = load_app(temp_db_path())
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        headers = await admin_headers(client)
+        results = {"rows": args.rows}
+
+        started = time.perf_counter()
+        for row in menu_rows("Single", args.rows):
+            (await client.post("/api/menu/", json=row, headers=headers)).raise_for_status()
+        results["single_posts_s"] = round(time.perf_counter() - started, 3)
+
+        started = time.perf_counter()
+        resp = await client.post("/api/menu/bulk", json=menu_rows("Json", args.rows), headers=headers)
+        resp.raise_for_status()
+        results["bulk_json_s"] = round(time.perf_counter() - started, 3)
+
+        started = time.perf_counter()
+        resp = await client.post(
+            "/api/menu/bulk", content=as_csv(menu_rows("Csv", args.rows)),
+            headers={**headers, "Content-Type": "text/csv"},
+        )
+        resp.raise_for_status()
+        results["bulk_csv_s"] = round(time.perf_counter() - started, 3)
+
+        # Re-importing the same sheet updates in place
+        started = time.perf_counter()
+        resp = await client.post("/api/menu/bulk", json=menu_rows("Json", args.rows), headers=headers)
+        resp.raise_for_status()
+        results["bulk_upsert_s"] = round(time.perf_counter() - started, 3)
+        results["upsert_result"] = {k: v for k, v in resp.json().items() if k != "errors"}
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=500)
+    asyncio.run(main(parser.parse_args()))
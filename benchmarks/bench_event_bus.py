@@ -0,0 +1,98 @@
+"""Cross-process check for the SQLite event bus (EVENT_BUS=sqlite).
+
+Starts N worker processes that each tail the event log of a throwaway
+database, like uvicorn --workers N would, then publishes M events from yet
+another process and asserts that every worker receives every event, in
+order, with the same ids. Reports publish-to-delivery latency per worker.
+
+    python -m benchmarks.bench_event_bus --workers 4 --events 1000
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import time
+
+from benchmarks.common import summarize, temp_db_path
+
+def _bus(db_path):
+    # DATABASE_URL is read when database.py is imported
+    os.environ["DATABASE_URL"] = db_path
+    import database
+    from events import SQLiteEventBus
+    database.init_db()
+    return SQLiteEventBus()
+
+def subscriber_process(db_path, events, ready, results):
+    async def run():
+        bus = _bus(db_path)
+        received, latencies = [], []
+        done = asyncio.Event()
+
+        def handler(event_id, data):
+            latencies.append((time.time() - data["sent_at"]) * 1000)
+            received.append((event_id, data["seq"]))
+            if len(received) == events:
+                done.set()
+
+        bus.subscribe("bench", handler)
+        await bus.start()
+        ready.release()
+        await asyncio.wait_for(done.wait(), timeout=60)
+        await bus.stop()
+        results.put((received, latencies))
+    asyncio.run(run())
+
+def publisher_process(db_path, events):
+    async def run():
+        bus = _bus(db_path)
+        await bus.start()
+        ids = []
+        for seq in range(events):
+            ids.append(await bus.publish("bench", {"seq": seq, "sent_at": time.time()}))
+        await bus.stop()
+        return ids
+    return asyncio.run(run())
+
+def main(args):
+    db_path = temp_db_path()
+    # Create the schema once so the workers do not all race on migrations
+    _bus(db_path)
+
+    ctx = multiprocessing.get_context("spawn")
+    ready = ctx.Semaphore(0)
+    results = ctx.Queue()
+    workers = [
+        ctx.Process(target=subscriber_process, args=(db_path, args.events, ready, results))
+        for _ in range(args.workers)
+    ]
+    for worker in workers:
+        worker.start()
+    for _ in workers:
+        ready.acquire()
+
+    started = time.perf_counter()
+    with ctx.Pool(1) as publisher:
+        ids = publisher.apply(publisher_process, (db_path, args.events))
+    outcomes = [results.get(timeout=60) for _ in workers]
+    elapsed = time.perf_counter() - started
+    for worker in workers:
+        worker.join()
+
+    expected = list(zip(ids, range(args.events)))
+    assert all(received == expected for received, _ in outcomes), "a worker missed or reordered events"
+
+    print(json.dumps({
+        "workers": args.workers,
+        "events": args.events,
+        "deliveries": sum(len(received) for received, _ in outcomes),
+        "events_per_second": round(args.events / elapsed, 1),
+        "delivery_latency": summarize([ms for _, latencies in outcomes for ms in latencies]),
+    }, indent=2))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--events", type=int, default=1000)
+    main(parser.parse_args())
@@ -0,0 +1,73 @@
+"""p99 latency of POST /api/orders/ with and without a concurrent sales report.
+
+If database work runs on the event loop, every /api/sales/top-items scan
+stalls order placement for its whole duration and the p99 of the order
+endpoint tracks the report time. With the database executor the two only
+compete for the SQLite file, not for the loop.
+
+    python -m benchmarks.bench_event_loop --orders 200 --history 20000
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+
+from benchmarks.common import admin_headers, load_app, seed_history, summarize, temp_db_path
+
+ORDER = {
+    "table_id": 1,
+    "items": [{"menu_item_id": 1, "name": "Masala Chai", "quantity": 2, "price": 20.0}],
+    "total_amount": 40.0,
+}
+
+async def place_orders(client, headers, count):
+    latencies = []
+    for _ in range(count):
+        start = time.perf_counter()
+        resp = await client.post("/api/orders/", json=ORDER, headers=headers)
+        latencies.append((time.perf_counter() - start) * 1000)
+        resp.raise_for_status()
+        # Settle the tab so every POST creates a fresh order
+        await client.patch(f"/api/orders/{resp.json()['id']}/status", json={"status": "paid"}, headers=headers)
+    return latencies
+
+async def run_reports(client, headers, stop):
+    runs = 0
+    while not stop.is_set():
+        resp = await client.get("/api/sales/top-items", headers=headers)
+        resp.raise_for_status()
+        runs += 1
+        await asyncio.sleep(0)
+    return runs
+
+async def main(args):
+    db_path = temp_db_path()
+    app = load_app(db_path)
+    seed_history(db_path, orders=args.history)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        headers = await admin_headers(client)
+
+        idle = await place_orders(client, headers, args.orders)
+
+        stop = asyncio.Event()
+        reports = asyncio.create_task(run_reports(client, headers, stop))
+        busy = await place_orders(client, headers, args.orders)
+        stop.set()
+        report_runs = await reports
+
+    print(json.dumps({
+        "history_orders": args.history,
+        "idle": summarize(idle),
+        "with_concurrent_report": summarize(busy),
+        "report_runs": report_runs,
+    }, indent=2))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--orders", type=int, default=200)
+    parser.add_argument("--history", type=int, default=20000)
+    asyncio.run(main(parser.parse_args()))
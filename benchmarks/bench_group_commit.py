@@ -0,0 +1,97 @@
+"""POS/KOT write throughput with and without group commit.
+
+Each client owns a table with an open tab and loops: add a round to it
+(POST /api/orders/), then move the tab's KOT along
+(PATCH /api/kot/{id}/status). Runs for ``--seconds`` at 1, 8 and 64
+concurrent clients, once through the pool (db.run, one transaction per
+request) and once through the group-commit writer (db.write), and reports
+writes/sec, latency and failed requests ('database is locked' and the
+like).
+
+    python -m benchmarks.bench_group_commit --seconds 3
+"""
+import argparse
+import asyncio
+import json
+import sqlite3
+import time
+
+import httpx
+
+from benchmarks.common import MENU, admin_headers, load_app, summarize, temp_db_path
+
+CLIENTS = (1, 8, 64)
+
+def seed_tables(db_path, count):
+    # Table i has open order i with KOT i, so every POST appends a round to
+    # a running tab and the client's PATCHes hit its own KOT
+    conn = sqlite3.connect(db_path)
+    conn.executemany("INSERT OR IGNORE INTO menu_items (id, name, category, price) VALUES (?, ?, ?, ?)", MENU)
+    ids = [(i,) for i in range(1, count + 1)]
+    conn.executemany(
+        "INSERT INTO tables (id, table_number, capacity, status, current_order_id) VALUES (?1, 'T' || ?1, 4, 'occupied', ?1)",
+        ids,
+    )
+    conn.executemany("INSERT INTO orders (id, table_id, items, total_amount) VALUES (?1, ?1, '[]', 0)", ids)
+    conn.executemany("INSERT INTO kot (id, order_id, items, status) VALUES (?1, ?1, '[]', 'pending')", ids)
+    conn.commit()
+    conn.close()
+
+async def client_loop(client, headers, table_id, deadline, latencies, failures):
+    body = {
+        "table_id": table_id,
+        "items": [{"menu_item_id": 1, "name": "Masala Chai", "quantity": 1, "price": 20.0}],
+        "total_amount": 20.0,
+    }
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        resp = await client.post("/api/orders/", json=body, headers=headers)
+        latencies.append((time.perf_counter() - started) * 1000)
+        if resp.status_code != 200:
+            failures.append(resp.status_code)
+            continue
+        status = "preparing" if len(latencies) % 4 == 1 else "pending"
+        started = time.perf_counter()
+        resp = await client.patch(f"/api/kot/{table_id}/status", json={"status": status}, headers=headers)
+        latencies.append((time.perf_counter() - started) * 1000)
+        if resp.status_code != 200:
+            failures.append(resp.status_code)
+
+async def run_level(client, headers, clients, seconds):
+    latencies, failures = [], []
+    deadline = time.perf_counter() + seconds
+    started = time.perf_counter()
+    await asyncio.gather(*[
+        client_loop(client, headers, table_id, deadline, latencies, failures)
+        for table_id in range(1, clients + 1)
+    ])
+    elapsed = time.perf_counter() - started
+    return {
+        "writes_per_sec": round((len(latencies) - len(failures)) / elapsed, 1),
+        "failed": len(failures),
+        "latency": summarize(latencies),
+    }
+
+async def main(args):
+    db_path = temp_db_path()
+    app = load_app(db_path)
+    seed_tables(db_path, max(CLIENTS))
+    from database import db
+
+    results = {}
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+        headers = await admin_headers(client)
+        for group_commit in (False, True):
+            db.group_commit = group_commit
+            mode = "group_commit" if group_commit else "per_request"
+            results[mode] = {}
+            for clients in CLIENTS:
+                results[mode][f"{clients}_clients"] = await run_level(client, headers, clients, args.seconds)
+        results["writer"] = db.writer.stats()
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=3)
+    asyncio.run(main(parser.parse_args()))
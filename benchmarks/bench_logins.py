@@ -0,0 +1,92 @@
+"""Shift-change logins alongside order traffic, with bcrypt inline vs pooled.
+
+Fires N concurrent logins while a second client keeps polling
+/api/kds/active and placing orders, and reports the latency of that
+traffic plus the logins themselves. With bcrypt inline every login holds
+the event loop for a full hash; with the password pool the other requests
+are unaffected.
+
+    python -m benchmarks.bench_logins --logins 20
+"""
+import argparse
+import asyncio
+import json
+import sqlite3
+import time
+
+import httpx
+
+from benchmarks.common import admin_headers, load_app, summarize, temp_db_path
+
+ORDER = {
+    "table_id": 1,
+    "items": [{"menu_item_id": 1, "name": "Masala Chai", "quantity": 1, "price": 20.0}],
+    "total_amount": 20.0,
+}
+
+def seed_staff(db_path, count, password_hash):
+    conn = sqlite3.connect(db_path)
+    conn.execute("INSERT OR IGNORE INTO tables (id, table_number, capacity) VALUES (1, 'T1', 4)")
+    conn.executemany(
+        "INSERT OR IGNORE INTO users (username, password_hash, role) VALUES (?, ?, 'staff')",
+        [(f"staff{i}", password_hash) for i in range(count)],
+    )
+    conn.commit()
+    conn.close()
+
+async def login(client, username, latencies, statuses):
+    start = time.perf_counter()
+    resp = await client.post("/api/auth/login", data={"username": username, "password": "shift-pass"})
+    latencies.append((time.perf_counter() - start) * 1000)
+    statuses.append(resp.status_code)
+
+async def order_traffic(client, headers, stop, latencies):
+    while not stop.is_set():
+        start = time.perf_counter()
+        resp = await client.get("/api/kds/active")
+        resp.raise_for_status()
+        resp = await client.post("/api/orders/", json=ORDER, headers=headers)
+        resp.raise_for_status()
+        latencies.append((time.perf_counter() - start) * 1000)
+        await asyncio.sleep(0.005)
+
+async def shift_change(client, headers, logins):
+    login_latencies, statuses, traffic = [], [], []
+    stop = asyncio.Event()
+    background = asyncio.create_task(order_traffic(client, headers, stop, traffic))
+    await asyncio.sleep(0.05)
+    await asyncio.gather(*(login(client, f"staff{i}", login_latencies, statuses) for i in range(logins)))
+    stop.set()
+    await background
+    return {
+        "logins": summarize(login_latencies),
+        "rejected_503": statuses.count(503),
+        "failed": len([s for s in statuses if s not in (200, 503)]),
+        "order_traffic": summarize(traffic),
+    }
+
+async def main(args):
+    db_path = temp_db_path()
+    app = load_app(db_path)
+    import passwords
+
+    seed_staff(db_path, args.logins, passwords.get_password_hash("shift-pass"))
+    pool_workers = passwords.PASSWORD_HASH_WORKERS or 2
+
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        headers = await admin_headers(client)
+        for mode, workers in (("inline", 0), ("process_pool", pool_workers)):
+            passwords.PASSWORD_HASH_WORKERS = workers
+            passwords.start()
+            results[mode] = await shift_change(client, headers, args.logins)
+    passwords.shutdown()
+
+    results["pool_workers"] = pool_workers
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--logins", type=int, default=20)
+    asyncio.run(main(parser.parse_args()))
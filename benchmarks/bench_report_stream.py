@@ -0,0 +1,65 @@
+"""Peak memory of a year-long sales export, streamed vs built in memory.
+
+Seeds a year of paid orders, then produces the line-level CSV report
+twice: through the streaming generator behind /api/sales/report, and the
+way daily-report used to work (fetch every row, write one big StringIO).
+Reports output size, time and peak Python heap (tracemalloc) for both.
+
+    python -m benchmarks.bench_report_stream --history 50000
+"""
+import argparse
+import asyncio
+import csv
+import io
+import json
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from benchmarks.common import load_app, seed_history, temp_db_path
+
+async def streamed(db, sales, start, end, gzip_output):
+    size = 0
+    async for chunk in sales._report_chunks(db, "line", start, end, gzip_output):
+        size += len(chunk)
+    return size
+
+async def materialized(db, sales, start, end):
+    query, params = sales._report_query("line", start, end)
+    rows = await db.fetchall(query, params)
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow([header for header, _, _ in sales.REPORTS["line"]["columns"]])
+    for row in rows:
+        writer.writerow(list(row.values()))
+    return len(output.getvalue().encode("utf-8"))
+
+async def measure(coro):
+    tracemalloc.start()
+    started = time.perf_counter()
+    size = await coro
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"bytes": size, "seconds": round(elapsed, 2), "peak_heap_mb": round(peak / 2**20, 1)}
+
+async def main(args):
+    db_path = temp_db_path()
+    load_app(db_path)
+    seed_history(db_path, orders=args.history, days=365)
+    from database import db
+    from routes import sales
+
+    end = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+    start = end - timedelta(days=366)
+    print(json.dumps({
+        "history_orders": args.history,
+        "streamed": await measure(streamed(db, sales, start, end, False)),
+        "streamed_gzip": await measure(streamed(db, sales, start, end, True)),
+        "built_in_memory": await measure(materialized(db, sales, start, end)),
+    }, indent=2))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--history", type=int, default=50000)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,81 @@
+"""Bytes on the wire and serialization CPU for the big list endpoints.
+
+For GET /api/orders/, /api/kot/ and /api/kds/active this reports the
+response size uncompressed, gzip and br, and the CPU time to serialize the
+payload through FastAPI's default path (jsonable_encoder + json.dumps)
+versus responses.dumps (orjson when installed).
+
+    python -m benchmarks.bench_responses --history 2000 --active 60
+"""
+import argparse
+import asyncio
+import json
+import sqlite3
+import time
+
+import httpx
+from fastapi.encoders import jsonable_encoder
+
+from benchmarks.common import admin_headers, load_app, seed_history, temp_db_path
+
+ENDPOINTS = ["/api/orders/", "/api/kot/", "/api/kds/active"]
+
+def seed_active_kots(db_path, count):
+    # Open tabs so the KDS has something to show
+    conn = sqlite3.connect(db_path)
+    order_ids = [row[0] for row in conn.execute("SELECT id FROM orders ORDER BY id DESC LIMIT ?", (count,))]
+    conn.executemany("UPDATE kot SET status = 'pending' WHERE order_id = ?", [(i,) for i in order_ids])
+    conn.execute("UPDATE order_items SET status = 'pending' WHERE kot_id IN (SELECT id FROM kot WHERE status = 'pending')")
+    conn.commit()
+    conn.close()
+
+def default_encode(payload):
+    return json.dumps(
+        jsonable_encoder(payload), ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")
+    ).encode("utf-8")
+
+def cpu_ms(fn, payload, rounds):
+    start = time.process_time()
+    for _ in range(rounds):
+        fn(payload)
+    return round((time.process_time() - start) / rounds * 1000, 3)
+
+async def main(args):
+    db_path = temp_db_path()
+    app = load_app(db_path)
+    seed_history(db_path, orders=args.history, days=30)
+    seed_active_kots(db_path, args.active)
+    import responses
+
+    results = {"encoder": "orjson" if responses.orjson else "json"}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        headers = await admin_headers(client)
+        for path in ENDPOINTS:
+            sizes = {}
+            for encoding in ("identity", "gzip", "br"):
+                resp = await client.get(path, headers={**headers, "Accept-Encoding": encoding})
+                resp.raise_for_status()
+                sizes[encoding] = len(resp.content if encoding == "identity" else await _raw_body(client, path, headers, encoding))
+            payload = resp.json()
+            results[path] = {
+                "rows": len(payload),
+                "bytes": sizes,
+                "serialize_cpu_ms": {
+                    "jsonable_encoder": cpu_ms(default_encode, payload, args.rounds),
+                    "fast": cpu_ms(responses.dumps, payload, args.rounds),
+                },
+            }
+    print(json.dumps(results, indent=2))
+
+async def _raw_body(client, path, headers, encoding):
+    # Size as sent, before httpx decodes it
+    async with client.stream("GET", path, headers={**headers, "Accept-Encoding": encoding}) as resp:
+        return b"".join([chunk async for chunk in resp.aiter_raw()])
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--history", type=int, default=2000)
+    parser.add_argument("--active", type=int, default=60)
+    parser.add_argument("--rounds", type=int, default=20)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,59 @@
+"""Cost of adding a round to a long-running tab.
+
+Opens one order and appends ``--rounds`` more rounds to it through
+POST /api/orders/, reporting the mean append latency per block of rounds.
+With append-only lines the latency stays flat as the tab grows instead of
+climbing with its history.
+
+    python -m benchmarks.bench_running_tab --rounds 400
+"""
+import argparse
+import asyncio
+import json
+import sqlite3
+import statistics
+import time
+
+import httpx
+
+from benchmarks.common import MENU, admin_headers, load_app, temp_db_path
+
+async def main(args):
+    db_path = temp_db_path()
+    app = load_app(db_path)
+    conn = sqlite3.connect(db_path)
+    conn.executemany("INSERT OR IGNORE INTO menu_items (id, name, category, price) VALUES (?, ?, ?, ?)", MENU)
+    conn.execute("INSERT INTO tables (id, table_number, capacity) VALUES (1, 'T1', 8)")
+    conn.commit()
+    conn.close()
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        headers = await admin_headers(client)
+        round_items = [
+            {"menu_item_id": m[0], "name": m[1], "quantity": 2, "price": m[3], "notes": None} for m in MENU[:3]
+        ]
+        total = sum(i["quantity"] * i["price"] for i in round_items)
+        body = {"table_id": 1, "items": round_items, "total_amount": total}
+        (await client.post("/api/orders/", json=body, headers=headers)).raise_for_status()
+
+        latencies = []
+        for _ in range(args.rounds):
+            started = time.perf_counter()
+            resp = await client.post("/api/orders/", json=body, headers=headers)
+            latencies.append(time.perf_counter() - started)
+            resp.raise_for_status()
+
+        block = max(1, args.rounds // 4)
+        print(json.dumps({
+            "rounds": args.rounds,
+            "lines_on_tab": (args.rounds + 1) * len(round_items),
+            "mean_append_ms_by_block": [
+                round(statistics.mean(latencies[i:i + block]) * 1000, 2) for i in range(0, len(latencies), block)
+            ],
+        }, indent=2))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=400)
+    asyncio.run(main(parser.parse_args()))
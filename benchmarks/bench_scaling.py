@@ -0,0 +1,160 @@
+"""Endpoint latency against history size.
+
+For each ``--sizes`` entry, generates a database with that many orders
+(benchmarks/generate_dataset.py; reused from ``--cache-dir`` when already
+built) and times the sales and history endpoints against it in a fresh
+process: stats, top items (all time and 30 days, with the cache dropped
+before every call), the daily CSV report for the busiest recent day and
+order history (first page, a page in the middle of the history and paid
+orders). Prints the median per endpoint and size as a table with log-scale
+bars; --csv writes the raw numbers and --png a chart when matplotlib is
+installed.
+
+    python -m benchmarks.bench_scaling --sizes 10000,100000,1000000
+"""
+import argparse
+import asyncio
+import csv
+import json
+import math
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+try:
+    import matplotlib
+    matplotlib.use("Agg")
+    from matplotlib import pyplot
+except ImportError:  # optional: text output only
+    pyplot = None
+
+BAR_WIDTH = 40
+
+def endpoints(conn):
+    # (label, path) pairs; dates come from the generated data
+    busiest = conn.execute(
+        "SELECT day FROM sales_daily WHERE day >= date('now', '-30 days') ORDER BY order_count DESC LIMIT 1"
+    ).fetchone()[0]
+    middle = conn.execute(
+        "SELECT day FROM sales_daily ORDER BY day LIMIT 1 OFFSET (SELECT COUNT(*) / 2 FROM sales_daily)"
+    ).fetchone()[0]
+    return [
+        ("sales stats", "/api/sales/stats"),
+        ("top items (all)", "/api/sales/top-items?window=all"),
+        ("top items (30d)", "/api/sales/top-items?window=30d"),
+        ("daily report", f"/api/sales/daily-report?date={busiest}"),
+        ("orders page 1", "/api/orders/?limit=100"),
+        ("orders mid-history", f"/api/orders/?start={middle}&end={middle}&limit=100"),
+        ("paid orders page 1", "/api/orders/?status=paid&limit=100"),
+    ]
+
+async def measure(db_path, rounds):
+    import sqlite3
+
+    import httpx
+
+    from benchmarks.common import admin_headers, load_app
+
+    app = load_app(db_path)
+    from routes import sales
+
+    conn = sqlite3.connect(db_path)
+    targets = endpoints(conn)
+    conn.close()
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=600) as client:
+        headers = await admin_headers(client)
+        for label, path in targets:
+            samples = []
+            for _ in range(rounds):
+                sales.top_items_cache.invalidate()
+                started = time.perf_counter()
+                resp = await client.get(path, headers=headers)
+                samples.append((time.perf_counter() - started) * 1000)
+                resp.raise_for_status()
+            results[label] = {"path": path, "median_ms": round(statistics.median(samples), 2), "bytes": len(resp.content)}
+    return results
+
+def build(size, cache_dir, seed):
+    from benchmarks.generate_dataset import generate
+
+    path = os.path.join(cache_dir, f"history_{size}_{seed}.db")
+    if not os.path.exists(path):
+        print(f"Generating {size:,} orders into {path}", file=sys.stderr)
+        generate(path, orders=size, seed=seed, log=lambda line: print(line, file=sys.stderr))
+    return path
+
+def bar(value, low, high):
+    # Log scale between the fastest and slowest median in the table
+    if high <= low:
+        return "#"
+    span = math.log10(high) - math.log10(low)
+    return "#" * max(1, round(BAR_WIDTH * (math.log10(value) - math.log10(low)) / span) + 1)
+
+def print_table(sizes, results):
+    labels = list(results[sizes[0]])
+    values = [results[size][label]["median_ms"] for size in sizes for label in labels]
+    low, high = max(min(values), 0.01), max(values)
+    for label in labels:
+        print(f"\n{label}  ({results[sizes[0]][label]['path']})")
+        for size in sizes:
+            value = results[size][label]["median_ms"]
+            print(f"  {size:>12,} orders {value:>10.2f} ms  {bar(max(value, low), low, high)}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="10000,100000,1000000")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--cache-dir", default=os.path.join(tempfile.gettempdir(), "chai_pani_scaling"))
+    parser.add_argument("--csv", help="write size,endpoint,median_ms rows here")
+    parser.add_argument("--png", help="write a latency chart here (needs matplotlib)")
+    parser.add_argument("--measure", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        # Child mode: one database per process, so app state never leaks
+        # from one size into the next
+        print(json.dumps(asyncio.run(measure(args.measure, args.rounds))))
+        return
+
+    os.makedirs(args.cache_dir, exist_ok=True)
+    sizes = [int(size) for size in args.sizes.split(",")]
+    results = {}
+    for size in sizes:
+        path = build(size, args.cache_dir, args.seed)
+        # The app only adds a bench user to the cached file, so it can be
+        # reused by later runs
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_scaling", "--measure", path, "--rounds", str(args.rounds)],
+            check=True, capture_output=True, text=True, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        ).stdout
+        results[size] = json.loads(output.strip().splitlines()[-1])
+
+    print_table(sizes, results)
+    if args.csv:
+        with open(args.csv, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["orders", "endpoint", "path", "median_ms", "bytes"])
+            for size in sizes:
+                for label, row in results[size].items():
+                    writer.writerow([size, label, row["path"], row["median_ms"], row["bytes"]])
+    if args.png:
+        if pyplot is None:
+            sys.exit("--png needs matplotlib")
+        figure, axes = pyplot.subplots(figsize=(9, 6))
+        for label in results[sizes[0]]:
+            axes.plot(sizes, [results[size][label]["median_ms"] for size in sizes], marker="o", label=label)
+        axes.set_xscale("log")
+        axes.set_yscale("log")
+        axes.set_xlabel("orders in history")
+        axes.set_ylabel("median latency (ms)")
+        axes.legend()
+        figure.savefig(args.png, bbox_inches="tight")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Shared helpers for the benchmark scripts.
+
+Benchmarks drive the ASGI app in-process against a throwaway database, so
+they never touch chai_pani.db. Run them from the repository root, e.g.
+``python -m benchmarks.bench_event_loop``.
+"""
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import json
+from datetime import datetime, timedelta
+
+import sales_rollup
+
+MENU = [
+    (1, "Masala Chai", "Beverages", 20.0),
+    (2, "Samosa", "Snacks", 15.0),
+    (3, "Aloo Paratha", "Main Course", 60.0),
+    (4, "Paneer Roll", "Snacks", 80.0),
+    (5, "Cold Coffee", "Beverages", 70.0),
+    (6, "Veg Thali", "Main Course", 150.0),
+]
+
+def temp_db_path(name="bench.db"):
+    return os.path.join(tempfile.mkdtemp(prefix="chai_pani_bench_"), name)
+
+def load_app(db_path):
+    # DATABASE_URL is read when database.py is imported, so it has to be set
+    # before main (and with it every router) is imported.
+    os.environ["DATABASE_URL"] = db_path
+    import main
+    return main.app
+
+def seed_history(db_path, orders=20000, tables=10, days=120, seed=42):
+    rng = random.Random(seed)
+    conn = sqlite3.connect(db_path)
+    conn.executemany(
+        "INSERT OR IGNORE INTO menu_items (id, name, category, price) VALUES (?, ?, ?, ?)",
+        MENU,
+    )
+    conn.executemany(
+        "INSERT OR IGNORE INTO tables (id, table_number, capacity) VALUES (?, ?, 4)",
+        [(i, f"T{i}") for i in range(1, tables + 1)],
+    )
+    now = datetime.now()
+    for _ in range(orders):
+        items = [
+            {"menu_item_id": m[0], "name": m[1], "quantity": rng.randint(1, 3), "price": m[3], "notes": None}
+            for m in rng.sample(MENU, rng.randint(1, 4))
+        ]
+        total = sum(i["quantity"] * i["price"] for i in items)
+        created = (now - timedelta(minutes=rng.randint(0, days * 24 * 60))).strftime("%Y-%m-%d %H:%M:%S")
+        cursor = conn.execute(
+            "INSERT INTO orders (table_id, items, total_amount, status, created_at) VALUES (?, ?, ?, 'paid', ?)",
+            (rng.randint(1, tables), json.dumps(items), total, created),
+        )
+        order_id = cursor.lastrowid
+        cursor = conn.execute(
+            "INSERT INTO kot (order_id, items, status, created_at) VALUES (?, ?, 'completed', ?)",
+            (order_id, json.dumps(items), created),
+        )
+        conn.executemany(
+            "INSERT INTO order_items (order_id, kot_id, menu_item_id, name, quantity, price, status, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, 'completed', ?)",
+            [(order_id, cursor.lastrowid, i["menu_item_id"], i["name"], i["quantity"], i["price"], created) for i in items],
+        )
+    sales_rollup.backfill(conn)
+    conn.commit()
+    conn.close()
+
+async def admin_headers(client, username="bench_admin", password="bench-password"):
+    resp = await client.post("/api/auth/register", json={"username": username, "password": password, "role": "admin"})
+    if resp.status_code != 200:
+        resp = await client.post("/api/auth/login", data={"username": username, "password": password})
+    resp.raise_for_status()
+    return {"Authorization": f"Bearer {resp.json()['access_token']}"}
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    k = (len(ordered) - 1) * pct / 100
+    lo = int(k)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+def summarize(samples_ms):
+    return {
+        "count": len(samples_ms),
+        "mean_ms": round(statistics.fmean(samples_ms), 2) if samples_ms else 0.0,
+        "p50_ms": round(percentile(samples_ms, 50), 2),
+        "p95_ms": round(percentile(samples_ms, 95), 2),
+        "p99_ms": round(percentile(samples_ms, 99), 2),
+        "max_ms": round(max(samples_ms), 2) if samples_ms else 0.0,
+    }
@@ -0,0 +1,263 @@
+"""Seeded synthetic restaurant history for scale testing.
+
+Builds a fresh database through the normal migrations, then bulk-loads
+users, a menu, tables and ``--orders`` orders spread over ``--days`` of
+trading. Volume follows a daily curve (breakfast chai, lunch, evening
+snacks, dinner) and a weekly one (busier Friday to Sunday) on a slow growth
+trend. Some tabs get extra rounds, each with its own KOT, as running tabs
+do; everything but the open tabs of the last day is paid. Rollups are
+rebuilt and ANALYZE is run at the end, so the result behaves like a
+long-lived production database.
+
+Loading runs with the journal off and secondary indexes dropped until the
+end, in large executemany batches with explicit ids:
+
+    python -m benchmarks.generate_dataset --out /tmp/big.db --orders 10000000
+
+Never point --out at a database you care about; an existing file is only
+replaced with --force.
+"""
+import argparse
+import itertools
+import json
+import math
+import os
+import random
+import sqlite3
+import sys
+import time
+from datetime import datetime, timedelta
+
+import sales_rollup
+
+BATCH_ORDERS = 20000
+# Relative order volume per hour of the day
+HOUR_WEIGHTS = [
+    0, 0, 0, 0, 0, 0, 1, 4, 8, 7, 4, 5,
+    9, 10, 7, 4, 6, 8, 6, 7, 10, 9, 5, 2,
+]
+# Monday .. Sunday
+WEEKDAY_WEIGHTS = [0.85, 0.8, 0.85, 0.9, 1.15, 1.4, 1.3]
+CATEGORIES = {
+    "Beverages": (["Masala Chai", "Ginger Chai", "Cutting Chai", "Filter Coffee", "Cold Coffee", "Lassi", "Nimbu Pani"], (15, 90)),
+    "Snacks": (["Samosa", "Kachori", "Vada Pav", "Pakora", "Bun Maska", "Poha", "Dhokla"], (15, 80)),
+    "Main Course": (["Aloo Paratha", "Veg Thali", "Rajma Chawal", "Chole Bhature", "Pav Bhaji", "Masala Dosa"], (60, 220)),
+    "Desserts": (["Gulab Jamun", "Jalebi", "Kulfi", "Rasmalai"], (30, 120)),
+}
+ROLES = ["staff"] * 6 + ["kitchen"] * 3 + ["manager"]
+QUANTITIES = (1, 1, 1, 2, 2, 3)
+
+def _stamp(day, day_str, second):
+    # created_at text for ``second`` past midnight of ``day``; string
+    # formatting is several times cheaper than datetime.strftime
+    if second < 86400:
+        hour, rest = divmod(second, 3600)
+        return f"{day_str} {hour:02d}:{rest // 60:02d}:{rest % 60:02d}"
+    return (day + timedelta(seconds=second)).strftime("%Y-%m-%d %H:%M:%S")
+
+def connect(path):
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+def build_menu(rng, count):
+    # Popularity falls off like a Zipf curve, so a few items dominate
+    menu, names = [], [(category, name) for category, (items, _) in CATEGORIES.items() for name in items]
+    for i in range(count):
+        category, name = names[i % len(names)]
+        if i >= len(names):
+            name = f"{name} {i // len(names) + 1}"
+        low, high = CATEGORIES[category][1]
+        menu.append((i + 1, name, category, float(rng.randrange(low, high + 1, 5))))
+    weights = [1 / (rank + 1) ** 0.9 for rank in range(count)]
+    rng.shuffle(weights)
+    return menu, weights
+
+def day_volumes(rng, orders, days, end_day):
+    # Orders per day: weekday curve on a linear growth trend with noise,
+    # scaled to add up to ``orders``
+    weights = []
+    for offset in range(days):
+        day = end_day - timedelta(days=days - 1 - offset)
+        trend = 0.6 + 0.4 * offset / max(days - 1, 1)
+        weights.append(WEEKDAY_WEIGHTS[day.weekday()] * trend * rng.uniform(0.85, 1.15))
+    total = sum(weights)
+    counts = [math.floor(orders * w / total) for w in weights]
+    for i in range(orders - sum(counts)):
+        counts[-1 - i % days] += 1
+    return counts
+
+def drop_secondary_indexes(conn, tables):
+    placeholders = ", ".join("?" * len(tables))
+    indexes = conn.execute(
+        f"SELECT name, sql FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL AND tbl_name IN ({placeholders})",
+        tables
+    ).fetchall()
+    for index in indexes:
+        conn.execute(f"DROP INDEX {index['name']}")
+    return [index["sql"] for index in indexes]
+
+def generate(path, orders=100000, days=730, users=25, menu_items=40, tables=30,
+             append_rate=0.3, open_tabs=None, seed=42, log=print):
+    started = time.perf_counter()
+    rng = random.Random(seed)
+    from database import migrate
+
+    conn = connect(path)
+    migrate(conn)
+    conn.execute("PRAGMA journal_mode = OFF")
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("PRAGMA cache_size = -262144")  # 256 MB
+    conn.execute("PRAGMA temp_store = MEMORY")
+    index_sql = drop_secondary_indexes(conn, ["orders", "kot", "order_items"])
+
+    from passwords import pwd_context
+    password_hash = pwd_context.hash("password")  # every generated user
+    conn.execute(
+        "INSERT INTO users (username, email, password_hash, role) VALUES ('admin', 'admin@example.com', ?, 'admin')",
+        (password_hash,)
+    )
+    conn.executemany(
+        "INSERT INTO users (username, email, password_hash, role) VALUES (?, ?, ?, ?)",
+        [(f"user{i}", f"user{i}@example.com", password_hash, rng.choice(ROLES)) for i in range(1, users)]
+    )
+    staff_ids = [row[0] for row in conn.execute("SELECT id FROM users")]
+
+    menu, popularity = build_menu(rng, menu_items)
+    conn.executemany("INSERT INTO menu_items (id, name, category, price) VALUES (?, ?, ?, ?)", menu)
+    conn.executemany(
+        "INSERT INTO tables (id, table_number, capacity) VALUES (?, ?, ?)",
+        [(i, f"T{i}", rng.choice((2, 4, 4, 6, 8))) for i in range(1, tables + 1)]
+    )
+    conn.commit()
+
+    end_day = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    counts = day_volumes(rng, orders, days, end_day)
+    if open_tabs is None:
+        open_tabs = min(tables // 3, counts[-1])
+    hours = [hour for hour in range(24) for _ in range(HOUR_WEIGHTS[hour])]
+    cum_popularity = list(itertools.accumulate(popularity))
+    # Each line's JSON around its quantity, in OrderItem field order, so a
+    # round's items blob is string joins rather than json.dumps
+    fragments = {
+        m[0]: (f'{{"menu_item_id":{m[0]},"name":{json.dumps(m[1])},"quantity":', f',"price":{m[3]},"notes":null}}')
+        for m in menu
+    }
+
+    order_id = kot_id = line_id = 0
+    order_rows, kot_rows, line_rows = [], [], []
+    open_orders = []
+
+    def flush():
+        conn.executemany(
+            "INSERT INTO orders (id, table_id, items, total_amount, status, created_by, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            order_rows
+        )
+        conn.executemany("INSERT INTO kot (id, order_id, items, status, created_at) VALUES (?, ?, ?, ?, ?)", kot_rows)
+        conn.executemany(
+            "INSERT INTO order_items (id, order_id, kot_id, menu_item_id, name, quantity, price, notes, status, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, NULL, ?, ?)",
+            line_rows
+        )
+        conn.commit()
+        order_rows.clear()
+        kot_rows.clear()
+        line_rows.clear()
+
+    random_ = rng.random
+    for offset, count in enumerate(counts):
+        day = end_day - timedelta(days=days - 1 - offset)
+        day_str = day.strftime("%Y-%m-%d")
+        # Chronological within the day, so ids grow with created_at
+        seconds = sorted(hours[int(random_() * len(hours))] * 3600 + int(random_() * 3600) for _ in range(count))
+        last_day = offset == days - 1
+        for n, second in enumerate(seconds):
+            order_id += 1
+            is_open = last_day and n >= count - open_tabs
+            status = "pending" if is_open else "paid"
+            line_status = "pending" if is_open else "completed"
+            rounds = 1
+            while rounds < 4 and random_() < append_rate:
+                rounds += 1
+            total, first_round = 0.0, None
+            for round_number in range(rounds):
+                kot_id += 1
+                at = _stamp(day, day_str, second + 1200 * round_number + int(random_() * 600)) if round_number else None
+                at = at or _stamp(day, day_str, second)
+                parts = []
+                for m in rng.choices(menu, cum_weights=cum_popularity, k=1 + int(random_() * 4)):
+                    quantity = QUANTITIES[int(random_() * len(QUANTITIES))]
+                    prefix, suffix = fragments[m[0]]
+                    parts.append(f"{prefix}{quantity}{suffix}")
+                    total += quantity * m[3]
+                    line_id += 1
+                    line_rows.append((line_id, order_id, kot_id, m[0], m[1], quantity, m[3], line_status, at))
+                lines_json = "[" + ",".join(parts) + "]"
+                first_round = first_round or lines_json
+                kot_rows.append((kot_id, order_id, lines_json, line_status, at))
+            order_rows.append((
+                order_id, 1 + int(random_() * tables), first_round, round(total, 2), status,
+                staff_ids[int(random_() * len(staff_ids))], _stamp(day, day_str, second)
+            ))
+            if is_open:
+                open_orders.append(order_id)
+            if len(order_rows) >= BATCH_ORDERS:
+                flush()
+                if order_id % (BATCH_ORDERS * 25) == 0:
+                    log(f"  {order_id:,} orders ({time.perf_counter() - started:.0f}s)")
+    flush()
+
+    # Open tabs sit on distinct tables
+    conn.executemany(
+        "UPDATE tables SET status = 'occupied', current_order_id = ? WHERE id = ?",
+        [(oid, table_id) for table_id, oid in enumerate(open_orders, start=1)]
+    )
+    conn.executemany("UPDATE orders SET table_id = ? WHERE id = ?", list(enumerate(open_orders, start=1)))
+
+    log("  rebuilding indexes and rollups")
+    for sql in index_sql:
+        conn.execute(sql)
+    sales_rollup.backfill(conn)
+    conn.commit()
+    conn.execute("ANALYZE")
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.close()
+    return {
+        "path": path,
+        "orders": order_id,
+        "kots": kot_id,
+        "order_items": line_id,
+        "days": days,
+        "seconds": round(time.perf_counter() - started, 1),
+        "size_mb": round(os.path.getsize(path) / 2**20, 1),
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--out", required=True)
+    parser.add_argument("--orders", type=int, default=100000)
+    parser.add_argument("--days", type=int, default=730)
+    parser.add_argument("--users", type=int, default=25)
+    parser.add_argument("--menu-items", type=int, default=40)
+    parser.add_argument("--tables", type=int, default=30)
+    parser.add_argument("--append-rate", type=float, default=0.3,
+                        help="chance a tab gets another round (up to 4 rounds)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--force", action="store_true", help="replace an existing --out file")
+    args = parser.parse_args(argv)
+
+    if os.path.exists(args.out):
+        if not args.force:
+            sys.exit(f"{args.out} exists; pass --force to replace it")
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(args.out + suffix):
+                os.remove(args.out + suffix)
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    summary = generate(
+        args.out, orders=args.orders, days=args.days, users=args.users, menu_items=args.menu_items,
+        tables=args.tables, append_rate=args.append_rate, seed=args.seed,
+    )
+    print(json.dumps(summary, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+"""Service-period load test with JSON baselines.
+
+Drives the ASGI app in-process with a rush-hour mix against a seeded
+throwaway database:
+
+  waiters   POST /api/orders/ (new tabs and extra rounds) and settle tabs
+            with PATCH /api/orders/{id}/status
+  kitchen   GET /api/kds/active and walk tickets through
+            PATCH /api/kot/{id}/status
+  screens   kitchen displays holding /api/kds/stream open; every KOT event
+            published during the run must reach every screen
+  managers  poll GET /api/sales/stats
+
+and reports throughput, p50/p95/p99 and errors per route. The result is
+compared with a saved baseline; the run exits non-zero if any route got
+slower or lost throughput beyond ``--tolerance``, errored more than the
+baseline did, or a screen missed events. Baselines depend on the machine,
+so record one where the check runs:
+
+    python -m benchmarks.load_test --update-baseline
+    python -m benchmarks.load_test            # compare against it
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+
+import httpx
+
+from benchmarks.common import MENU, admin_headers, load_app, seed_history, summarize, temp_db_path
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baselines", "service_period.json")
+# Absolute slack on p95 so sub-millisecond routes do not fail on jitter
+LATENCY_SLACK_MS = 2.0
+PROFILE_KEYS = ("seconds", "waiters", "kitchen", "screens", "managers", "tables", "history", "think_ms", "seed")
+
+class Recorder:
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+
+    async def call(self, client, route, method, path, **kwargs):
+        # ``route`` is the templated path results are grouped by
+        started = time.perf_counter()
+        try:
+            resp = await client.request(method, path, **kwargs)
+        except Exception:
+            resp = None
+        self.latencies.setdefault(route, []).append((time.perf_counter() - started) * 1000)
+        if resp is None or resp.status_code >= 400:
+            self.errors[route] = self.errors.get(route, 0) + 1
+            return None
+        return resp
+
+async def think(rng, args):
+    await asyncio.sleep(rng.uniform(0, 2 * args.think_ms) / 1000)
+
+async def waiter(client, headers, recorder, rng, tables, deadline, args):
+    tabs = {}
+    while time.perf_counter() < deadline:
+        table_id = rng.choice(tables)
+        if table_id in tabs and rng.random() < 0.25:
+            resp = await recorder.call(
+                client, "PATCH /api/orders/{id}/status", "PATCH", f"/api/orders/{tabs.pop(table_id)}/status",
+                json={"status": "paid"}, headers=headers,
+            )
+        else:
+            items = [
+                {"menu_item_id": m[0], "name": m[1], "quantity": rng.randint(1, 3), "price": m[3], "notes": None}
+                for m in rng.sample(MENU, rng.randint(1, 3))
+            ]
+            resp = await recorder.call(
+                client, "POST /api/orders/", "POST", "/api/orders/",
+                json={"table_id": table_id, "items": items, "total_amount": sum(i["quantity"] * i["price"] for i in items)},
+                headers=headers,
+            )
+            if resp is not None:
+                tabs[table_id] = resp.json()["id"]
+        await think(rng, args)
+
+NEXT_STATUS = {"pending": "preparing", "preparing": "ready", "ready": "completed"}
+
+async def kitchen(client, headers, recorder, rng, deadline, args):
+    while time.perf_counter() < deadline:
+        resp = await recorder.call(client, "GET /api/kds/active", "GET", "/api/kds/active", headers=headers)
+        for kot in (resp.json() if resp is not None else [])[:5]:
+            await recorder.call(
+                client, "PATCH /api/kot/{id}/status", "PATCH", f"/api/kot/{kot['id']}/status",
+                json={"status": NEXT_STATUS[kot["status"]]}, headers=headers,
+            )
+        await think(rng, args)
+
+async def manager(client, headers, recorder, rng, deadline, args):
+    while time.perf_counter() < deadline:
+        await recorder.call(client, "GET /api/sales/stats", "GET", "/api/sales/stats", headers=headers)
+        # Dashboards refresh far less often than the floor works
+        await asyncio.sleep(rng.uniform(0, 20 * args.think_ms) / 1000)
+
+async def screen(app, ready, stop, received):
+    # httpx's ASGI transport buffers whole responses, so the stream is read
+    # by calling the app directly
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": "/api/kds/stream", "raw_path": b"/api/kds/stream", "query_string": b"",
+        "root_path": "", "headers": [(b"host", b"bench"), (b"accept", b"text/event-stream")],
+        "client": ("127.0.0.1", 0), "server": ("bench", 80),
+    }
+    requested = False
+
+    async def receive():
+        nonlocal requested
+        if not requested:
+            requested = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await stop.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] != "http.response.body":
+            return
+        for line in message.get("body", b"").decode("utf-8").splitlines():
+            if line.startswith("retry:"):
+                ready.set()
+            elif line.startswith("data: ") and json.loads(line[6:])["type"].startswith("kot."):
+                received.append(line)
+
+    await app(scope, receive, send)
+
+async def run(args):
+    db_path = temp_db_path()
+    app = load_app(db_path)
+    seed_history(db_path, orders=args.history, tables=args.tables, seed=args.seed)
+    from events import bus
+
+    # Every KOT event published on this worker; each screen should get all
+    published = []
+    bus.subscribe("kds", lambda event_id, data: published.append(event_id) if data["type"].startswith("kot.") else None)
+    rng = random.Random(args.seed)
+    recorder = Recorder()
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+        headers = await admin_headers(client)
+
+        stop = asyncio.Event()
+        screens, received = [], []
+        for _ in range(args.screens):
+            ready, got = asyncio.Event(), []
+            screens.append(asyncio.create_task(screen(app, ready, stop, got)))
+            received.append(got)
+            await asyncio.wait_for(ready.wait(), timeout=5)
+
+        published.clear()
+        tables = list(range(1, args.tables + 1))
+        started = time.perf_counter()
+        deadline = started + args.seconds
+        workers = [
+            waiter(client, headers, recorder, random.Random(rng.random()), tables[i::args.waiters], deadline, args)
+            for i in range(args.waiters)
+        ] + [
+            kitchen(client, headers, recorder, random.Random(rng.random()), deadline, args)
+            for _ in range(args.kitchen)
+        ] + [
+            manager(client, headers, recorder, random.Random(rng.random()), deadline, args)
+            for _ in range(args.managers)
+        ]
+        await asyncio.gather(*workers)
+        elapsed = time.perf_counter() - started
+
+        # Let the last events drain to the screens before hanging up
+        await asyncio.sleep(0.2)
+        stop.set()
+        await asyncio.wait_for(asyncio.gather(*screens), timeout=10)
+
+    routes = {}
+    for route, samples in sorted(recorder.latencies.items()):
+        routes[route] = {
+            "rps": round(len(samples) / elapsed, 1),
+            "errors": recorder.errors.get(route, 0),
+            "latency": summarize(samples),
+        }
+    total = sum(len(samples) for samples in recorder.latencies.values())
+    return {
+        "profile": {key: getattr(args, key) for key in PROFILE_KEYS},
+        "requests": total,
+        "rps": round(total / elapsed, 1),
+        "errors": sum(recorder.errors.values()),
+        "routes": routes,
+        "sse": {
+            "screens": args.screens,
+            "kot_events": len(published),
+            "min_received": min((len(got) for got in received), default=0),
+            "missed": max((len(published) - len(got) for got in received), default=0),
+        },
+    }
+
+def compare(result, baseline, tolerance):
+    failures = []
+    if baseline["profile"] != result["profile"]:
+        failures.append(f"profile differs from the baseline's {baseline['profile']}; re-record it")
+        return failures
+    for route, base in baseline["routes"].items():
+        current = result["routes"].get(route)
+        if current is None:
+            failures.append(f"{route}: no requests")
+            continue
+        if current["errors"] > base["errors"]:
+            failures.append(f"{route}: {current['errors']} errors (baseline {base['errors']})")
+        limit = base["latency"]["p95_ms"] * (1 + tolerance) + LATENCY_SLACK_MS
+        if current["latency"]["p95_ms"] > limit:
+            failures.append(f"{route}: p95 {current['latency']['p95_ms']} ms > {limit:.2f} ms")
+        if current["rps"] < base["rps"] * (1 - tolerance):
+            failures.append(f"{route}: {current['rps']} req/s < {base['rps'] * (1 - tolerance):.1f}")
+    if result["sse"]["missed"]:
+        failures.append(f"kds stream: a screen missed {result['sse']['missed']} events")
+    return failures
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--waiters", type=int, default=8)
+    parser.add_argument("--kitchen", type=int, default=2)
+    parser.add_argument("--screens", type=int, default=4)
+    parser.add_argument("--managers", type=int, default=2)
+    parser.add_argument("--tables", type=int, default=24)
+    parser.add_argument("--history", type=int, default=5000)
+    parser.add_argument("--think-ms", type=float, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--tolerance", type=float, default=0.5,
+                        help="allowed fractional p95 increase / throughput drop per route")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--update-baseline", action="store_true")
+    args = parser.parse_args(argv)
+
+    result = asyncio.run(run(args))
+    print(json.dumps(result, indent=2))
+
+    if args.update_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump(result, f, indent=2)
+            f.write("\n")
+        print(f"Baseline written to {args.baseline}")
+        return 0
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; record one with --update-baseline")
+        return 1
+
+    with open(args.baseline) as f:
+        failures = compare(result, json.load(f), args.tolerance)
+    for failure in failures:
+        print(f"REGRESSION {failure}")
+    if failures:
+        return 1
+    print("No regressions against the baseline.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
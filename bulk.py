@@ -0,0 +1,142 @@
+import csv
+import io
+import json
+import sqlite3
+
+from fastapi import HTTPException, Request
+from pydantic import ValidationError
+
+# Bulk create/upsert for the onboarding endpoints: the whole batch is parsed
+# and validated first, then written with executemany in one transaction, so
+# a 500-row import costs one commit. Rows that fail validation are reported
+# back by position and skipped; the rest are applied.
+BULK_MAX_ROWS = 5000
+
+async def read_rows(request: Request):
+    # A JSON array, a text/csv body, or a multipart upload in field "file"
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("multipart/form-data"):
+        form = await request.form()
+        upload = form.get("file")
+        if upload is None or isinstance(upload, str):
+            raise HTTPException(status_code=400, detail="Upload the CSV as form field 'file'")
+        rows = _parse_csv(await upload.read())
+    elif content_type.startswith("text/csv"):
+        rows = _parse_csv(await request.body())
+    else:
+        try:
+            rows = json.loads(await request.body())
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Body must be a JSON array or CSV")
+        if not isinstance(rows, list):
+            raise HTTPException(status_code=400, detail="Body must be a JSON array or CSV")
+
+    if len(rows) > BULK_MAX_ROWS:
+        raise HTTPException(status_code=400, detail=f"At most {BULK_MAX_ROWS} rows per request")
+    return rows
+
+def _parse_csv(data):
+    try:
+        text = data.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="CSV must be UTF-8")
+    # Empty cells fall back to the field's default
+    return [
+        {key.strip(): value for key, value in row.items() if key and value not in ("", None)}
+        for row in csv.DictReader(io.StringIO(text))
+    ]
+
+def validate_rows(rows, model, key):
+    # Returns ([(row_number, values)], errors); values only hold the fields
+    # the row actually set, so an upsert leaves the others alone
+    valid, errors, seen = [], [], set()
+    for number, row in enumerate(rows, start=1):
+        if not isinstance(row, dict):
+            errors.append({"row": number, "error": "Row must be an object"})
+            continue
+        try:
+            item = model(**row)
+        except ValidationError as e:
+            errors.append({"row": number, "error": "; ".join(
+                f"{'.'.join(str(part) for part in err['loc'])}: {err['msg']}" for err in e.errors()
+            )})
+            continue
+        values = item.dict(exclude_unset=True)
+        values[key] = getattr(item, key)
+        if values[key] in seen:
+            errors.append({"row": number, "error": f"Duplicate {key} '{values[key]}' in this batch"})
+            continue
+        seen.add(values[key])
+        valid.append((number, values))
+    return valid, errors
+
+def apply_rows(conn, table, key, model, rows, upsert, touch=None, watch=None):
+    # Insert new keys and (if upsert) update existing ones, matching on
+    # ``key``; ``touch`` is an extra SET clause for updates, e.g. a
+    # last_updated timestamp. The write lock is taken before the lookup so
+    # two imports of the same sheet cannot both decide a row is new.
+    # ``watch(conn)`` runs under that lock before the writes and returns a
+    # function run after them, before the commit; its result is returned
+    # as "watched".
+    conn.execute("BEGIN IMMEDIATE")
+    finish_watch = watch(conn) if watch else None
+    existing = {}
+    keys = [values[key] for _, values in rows]
+    for start in range(0, len(keys), 500):
+        chunk = keys[start:start + 500]
+        placeholders = ", ".join("?" * len(chunk))
+        for row in conn.execute(f"SELECT id, {key} FROM {table} WHERE {key} IN ({placeholders})", chunk):
+            existing.setdefault(row[key], []).append(row["id"])
+
+    errors, inserts, updates = [], [], {}
+    for number, values in rows:
+        matches = existing.get(values[key], [])
+        if not matches:
+            # New rows get the model's defaults for anything left out
+            full = {**model(**values).dict(), **values}
+            inserts.append(full)
+        elif not upsert:
+            errors.append({"row": number, "error": f"{key} '{values[key]}' already exists"})
+        elif len(matches) > 1:
+            errors.append({"row": number, "error": f"{key} '{values[key]}' matches {len(matches)} existing rows"})
+        else:
+            # Rows setting the same columns share one executemany
+            columns = tuple(column for column in values if column != key)
+            updates.setdefault(columns, []).append([values[column] for column in columns] + [matches[0]])
+
+    try:
+        if inserts:
+            columns = list(inserts[0])
+            conn.executemany(
+                f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                [[values[column] for column in columns] for values in inserts]
+            )
+        for columns, params in updates.items():
+            set_clause = ", ".join([f"{column} = ?" for column in columns] + ([touch] if touch else []))
+            if set_clause:
+                conn.executemany(f"UPDATE {table} SET {set_clause} WHERE id = ?", params)
+        watched = finish_watch(conn) if finish_watch else None
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    result = {
+        "created": len(inserts),
+        "updated": sum(len(params) for params in updates.values()),
+        "errors": errors,
+    }
+    if finish_watch:
+        result["watched"] = watched
+    return result
+
+async def import_rows(request, db, table, key, model, upsert, touch=None, watch=None):
+    rows, errors = validate_rows(await read_rows(request), model, key)
+    result = {"created": 0, "updated": 0, "errors": []}
+    if rows:
+        try:
+            result = await db.run(apply_rows, table, key, model, rows, upsert, touch, watch)
+        except sqlite3.Error as e:
+            raise HTTPException(status_code=400, detail=f"Import failed: {e}")
+    result["errors"] = sorted(errors + result["errors"], key=lambda error: error["row"])
+    return result
@@ -0,0 +1,64 @@
+import threading
+import time
+from collections import OrderedDict
+
+class TTLCache:
+    """Small in-process LRU cache with per-entry expiry.
+
+    ``version`` is bumped by every invalidation. Readers that compute a value
+    outside the cache pass the version they started with to ``set``, so a
+    result computed from data that changed mid-flight is never stored.
+    """
+
+    def __init__(self, maxsize=128, ttl=60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value, version=None, ttl=None):
+        # ``ttl`` overrides the cache-wide expiry for this entry
+        with self._lock:
+            if version is not None and version != self.version:
+                return False
+            self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+            return True
+
+    def invalidate(self, key=None):
+        with self._lock:
+            self.version += 1
+            if key is None:
+                self._data.clear()
+            else:
+                self._data.pop(key, None)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+    def __len__(self):
+        return len(self._data)
@@ -1,15 +1,452 @@
+import asyncio
+import functools
+import os
+import queue
 import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
 
-DATABASE_URL = "chai_pani.db"
+import archive
+import sales_rollup
+import sqltrace
+
+DATABASE_URL = os.environ.get("DATABASE_URL", "chai_pani.db")
+# Old paid orders are moved here (see archive.py); attached to every connection
+ARCHIVE_DATABASE_URL = os.environ.get(
+    "ARCHIVE_DATABASE_URL", f"{os.path.splitext(DATABASE_URL)[0]}_archive.db"
+)
+
+# Connection pool settings. Connections are long-lived, so the per-connection
+# prepared statement cache (cached_statements) stays warm across requests.
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "8"))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", "10"))
+DB_STATEMENT_CACHE_SIZE = 256
+
+# Threads that run SQLite work off the event loop. One per pooled connection,
+# so a worker never waits on the pool; streamed reads take theirs from a
+# separate pool and never hold one of these.
+DB_EXECUTOR_WORKERS = int(os.environ.get("DB_EXECUTOR_WORKERS", str(DB_POOL_SIZE)))
+# Streamed reads (CSV reports) keep a connection until the client has
+# downloaded everything. They get their own connections, at most this many
+# at a time; further streams wait for one to finish.
+DB_STREAM_CONNECTIONS = int(os.environ.get("DB_STREAM_CONNECTIONS", "2"))
+
+# Group commit for the POS/KOT write path (see WriteQueue). A batch holds up
+# to DB_WRITE_BATCH_MAX mutations: whatever queued up while the previous
+# batch was committing, plus anything arriving within DB_WRITE_WINDOW_MS of
+# the first one. The window defaults to 0 since under load batches fill on
+# their own and a fixed wait only adds latency when it is quiet.
+# DB_GROUP_COMMIT=0 sends db.write() straight to the pool like db.run().
+DB_GROUP_COMMIT = os.environ.get("DB_GROUP_COMMIT", "1") != "0"
+DB_WRITE_BATCH_MAX = int(os.environ.get("DB_WRITE_BATCH_MAX", "64"))
+DB_WRITE_WINDOW_MS = float(os.environ.get("DB_WRITE_WINDOW_MS", "0"))
+DB_WRITE_RETRIES = 5
+
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA busy_timeout = 5000",
+    "PRAGMA cache_size = -16000",  # ~16 MB page cache per connection
+    "PRAGMA mmap_size = 268435456",  # 256 MB
+    "PRAGMA temp_store = MEMORY",
+)
+
+# Every connection this process opened: the pools, the writer and the
+# event bus all come through get_db_connection()
+_connections_opened = 0
+_connections_lock = threading.Lock()
+
+def connections_opened():
+    return _connections_opened
 
 def get_db_connection():
-    conn = sqlite3.connect(DATABASE_URL, check_same_thread=False)
+    global _connections_opened
+    with _connections_lock:
+        _connections_opened += 1
+    conn = sqlite3.connect(
+        DATABASE_URL,
+        check_same_thread=False,
+        cached_statements=DB_STATEMENT_CACHE_SIZE,
+        factory=sqltrace.connection_factory(),
+    )
     conn.row_factory = sqlite3.Row
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    archive.attach(conn, ARCHIVE_DATABASE_URL)
     return conn
 
-def init_db():
-    conn = get_db_connection()
+class ConnectionPool:
+    """Bounded pool of long-lived SQLite connections.
+
+    Connections are opened lazily up to ``size`` and handed out exclusively,
+    so a connection is never used by two requests at the same time.
+    """
+
+    def __init__(self, size=DB_POOL_SIZE, timeout=DB_POOL_TIMEOUT):
+        self.size = size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._opened = 0
+        self.opened_total = 0
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if self._opened < self.size:
+                self._opened += 1
+                try:
+                    conn = get_db_connection()
+                except Exception:
+                    self._opened -= 1
+                    raise
+                self.opened_total += 1
+                return conn
+
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise RuntimeError("Timed out waiting for a database connection")
+
+    def release(self, conn):
+        # Never hand out a connection with a half-finished transaction
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            sqltrace.flush(conn)
+        except sqlite3.Error:
+            self._discard(conn)
+            return
+        self._idle.put(conn)
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        finally:
+            with self._lock:
+                self._opened -= 1
+
+    def stats(self):
+        idle = self._idle.qsize()
+        return {"open": self._opened, "idle": idle, "in_use": self._opened - idle, "opened_total": self.opened_total}
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close_all(self):
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                # Refresh planner statistics for what this connection saw
+                conn.execute("PRAGMA optimize")
+            except sqlite3.Error:
+                pass
+            self._discard(conn)
+
+pool = ConnectionPool(size=max(DB_POOL_SIZE, DB_EXECUTOR_WORKERS))
+stream_pool = ConnectionPool(size=DB_STREAM_CONNECTIONS)
+
+def _rows_to_dicts(cursor):
+    return [dict(row) for row in cursor.fetchall()]
+
+def _is_busy(exc):
+    return isinstance(exc, sqlite3.OperationalError) and (
+        "locked" in str(exc) or "busy" in str(exc)
+    )
+
+class _BatchConnection:
+    # The writer's connection as one queued mutation sees it: its commit()
+    # is deferred to the end of the batch
+    def __init__(self, conn):
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        raise RuntimeError("db.write() mutations cannot roll back; raise instead")
+
+class WriteQueue:
+    """Single writer with group commit.
+
+    Mutations are queued from the event loop and applied by one writer task
+    on its own connection and thread. Everything queued while the previous
+    batch was committing goes into one BEGIN
+    IMMEDIATE transaction, so N concurrent writers cost one lock acquisition
+    and one commit instead of N, and never race each other for the lock.
+    Each mutation runs inside its own SAVEPOINT: one that raises is rolled
+    back alone and its caller gets the exception, the rest still commit.
+    Callers are resolved only after the batch has committed. If the lock
+    is busy (another process, e.g. a second uvicorn worker), the whole
+    batch is retried with backoff.
+    """
+
+    def __init__(self, batch_max=DB_WRITE_BATCH_MAX, window_ms=DB_WRITE_WINDOW_MS):
+        self.batch_max = batch_max
+        self.window = window_ms / 1000
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+        self.batches = 0
+        self.writes = 0
+        self._conn = None
+        self._loop = None
+        self._queue = None
+        self._task = None
+
+    async def submit(self, fn, args, kwargs):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # First write on this loop (tests run each client in its own)
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._task = loop.create_task(self._writer())
+        future = loop.create_future()
+        self._queue.put_nowait((fn, args, kwargs, future))
+        return await future
+
+    async def _writer(self):
+        while True:
+            batch = [await self._queue.get()]
+            if self.window:
+                await asyncio.sleep(self.window)
+            while len(batch) < self.batch_max and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            try:
+                outcomes = await self._loop.run_in_executor(self.executor, self._commit_batch, batch)
+            except Exception as exc:
+                outcomes = [(False, exc)] * len(batch)
+            for (_, _, _, future), (ok, value) in zip(batch, outcomes):
+                # A caller that went away (client disconnect) still had its
+                # write applied, as with db.run()
+                if future.done():
+                    continue
+                if ok:
+                    future.set_result(value)
+                else:
+                    future.set_exception(value)
+
+    def _commit_batch(self, batch):
+        if self._conn is None:
+            self._conn = get_db_connection()
+        for attempt in range(DB_WRITE_RETRIES + 1):
+            try:
+                outcomes = self._apply(batch)
+            except sqlite3.OperationalError as exc:
+                if not _is_busy(exc) or attempt == DB_WRITE_RETRIES:
+                    raise
+                time.sleep(0.01 * 2 ** attempt)
+                continue
+            self.batches += 1
+            self.writes += len(batch)
+            sqltrace.flush(self._conn)
+            return outcomes
+
+    def _apply(self, batch):
+        conn = self._conn
+        view = _BatchConnection(conn)
+        outcomes = []
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for fn, args, kwargs, _ in batch:
+                conn.execute("SAVEPOINT write")
+                try:
+                    result = fn(view, *args, **kwargs)
+                except Exception as exc:
+                    if _is_busy(exc):
+                        raise
+                    conn.execute("ROLLBACK TO write")
+                    conn.execute("RELEASE write")
+                    outcomes.append((False, exc))
+                else:
+                    conn.execute("RELEASE write")
+                    outcomes.append((True, result))
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        return outcomes
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "writes": self.writes,
+            "mean_batch": round(self.writes / self.batches, 2) if self.batches else 0,
+        }
+
+    def shutdown(self):
+        if self._task is not None:
+            self._task.cancel()
+        self.executor.shutdown(wait=True)
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+class Database:
+    """Awaitable access to the pool.
+
+    ``run`` executes a synchronous ``fn(conn, *args)`` on the database
+    executor with a pooled connection, so route handlers only await and the
+    event loop never blocks on SQLite. Anything ``fn`` does not commit is
+    rolled back when the connection goes back to the pool.
+    """
+
+    def __init__(self, pool, stream_pool, workers=DB_EXECUTOR_WORKERS, group_commit=DB_GROUP_COMMIT):
+        self.pool = pool
+        self.stream_pool = stream_pool
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="db")
+        self.group_commit = group_commit
+        self.writer = WriteQueue()
+        # Waiting for a stream slot happens here on the event loop, so a
+        # queued download never ties up an executor thread
+        self._stream_slots = asyncio.Semaphore(stream_pool.size)
+
+    def _call(self, fn, args, kwargs):
+        with self.pool.connection() as conn:
+            return fn(conn, *args, **kwargs)
+
+    async def run(self, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, functools.partial(self._call, fn, args, kwargs)
+        )
+
+    async def write(self, fn, *args, **kwargs):
+        # Like run(), for hot-path mutations: fn joins the writer's next
+        # group commit. Its conn.commit() is deferred to the batch and it
+        # must not roll back itself; raising undoes just its own changes.
+        if not self.group_commit:
+            return await self.run(fn, *args, **kwargs)
+        return await self.writer.submit(fn, args, kwargs)
+
+    async def fetchall(self, query, params=()):
+        return await self.run(lambda conn: _rows_to_dicts(conn.execute(query, params)))
+
+    async def fetchone(self, query, params=()):
+        def _fetchone(conn):
+            row = conn.execute(query, params).fetchone()
+            return dict(row) if row else None
+        return await self.run(_fetchone)
+
+    async def execute(self, query, params=()):
+        # Single write statement in its own transaction; returns the cursor's
+        # (lastrowid, rowcount) since the cursor itself stays on the worker.
+        def _execute(conn):
+            cursor = conn.execute(query, params)
+            conn.commit()
+            return cursor.lastrowid, cursor.rowcount
+        return await self.run(_execute)
+
+    async def stream(self, query, params=(), batch_size=500):
+        # Yields the rows of a large result in batches without holding all of
+        # it in memory. Keeps a connection from stream_pool (and its read
+        # snapshot) until the generator is exhausted or closed, so slow
+        # downloads never starve run() and write() of pooled connections.
+        async with self._stream_slots:
+            acquiring = self.executor.submit(self.stream_pool.acquire)
+            try:
+                conn = await asyncio.wrap_future(acquiring)
+            except asyncio.CancelledError:
+                # The acquire may still be running; give its connection back
+                acquiring.add_done_callback(
+                    lambda f: f.cancelled() or f.exception() or self.stream_pool.release(f.result())
+                )
+                raise
+
+            cursor = []
+            pending = None
+
+            def execute():
+                cursor.append(conn.execute(query, params))
+
+            def finish(_=None):
+                try:
+                    for c in cursor:
+                        c.close()
+                except sqlite3.Error:
+                    pass
+                self.stream_pool.release(conn)
+
+            try:
+                pending = self.executor.submit(execute)
+                await asyncio.wrap_future(pending)
+                while True:
+                    pending = self.executor.submit(cursor[0].fetchmany, batch_size)
+                    rows = await asyncio.wrap_future(pending)
+                    if not rows:
+                        break
+                    yield rows
+            finally:
+                # Also runs when the client disconnects and the generator is
+                # cancelled, which does not stop a call already running on
+                # its thread: the connection is only closed out and released
+                # after that call returns, on the same thread
+                if pending is not None and not pending.done():
+                    pending.add_done_callback(finish)
+                else:
+                    self.executor.submit(finish)
+
+    def shutdown(self):
+        self.writer.shutdown()
+        self.executor.shutdown(wait=True)
+        self.pool.close_all()
+        self.stream_pool.close_all()
+
+db = Database(pool, stream_pool)
+
+def get_db():
+    # FastAPI dependency. Routes await db.run()/fetchall() instead of touching
+    # sqlite3 on the event loop.
+    return db
+
+ORDER_ITEM_FIELDS = "menu_item_id, name, quantity, price, notes"
+
+def fetch_order_items(conn, key, ids, with_status=False, table="order_items"):
+    # Lines for many orders/KOTs in a few indexed lookups, grouped by
+    # ``key`` ('order_id' or 'kot_id') in the order they were placed.
+    # History reads pass table="all_order_items" to include the archive.
+    if key not in ("order_id", "kot_id"):
+        raise ValueError(f"Cannot group order items by {key}")
+    grouped = {item_id: [] for item_id in ids}
+    ids = list(grouped)
+    fields = ORDER_ITEM_FIELDS + (", status" if with_status else "")
+    for start in range(0, len(ids), 500):
+        chunk = ids[start:start + 500]
+        placeholders = ", ".join("?" * len(chunk))
+        rows = conn.execute(
+            f"SELECT {key} AS group_id, {fields} FROM {table} WHERE {key} IN ({placeholders}) ORDER BY id",
+            chunk
+        )
+        for row in rows:
+            item = dict(row)
+            grouped[item.pop("group_id")].append(item)
+    return grouped
+
+def insert_order_items(conn, order_id, kot_id, items):
+    conn.executemany(
+        f"INSERT INTO order_items (order_id, kot_id, {ORDER_ITEM_FIELDS}) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [
+            (order_id, kot_id, item["menu_item_id"], item["name"], item["quantity"], item["price"], item.get("notes"))
+            for item in items
+        ]
+    )
+
+def _migrate_base_schema(conn):
     cursor = conn.cursor()
     
     # Users Table
@@ -67,7 +504,7 @@ def init_db():
     CREATE TABLE IF NOT EXISTS orders (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         table_id INTEGER,
-        items TEXT NOT NULL, -- JSON string of items
+        items TEXT NOT NULL, -- JSON of the first round only; order_items holds every line
         total_amount REAL NOT NULL,
         status TEXT DEFAULT 'pending', -- pending, preparing, ready, completed, paid
         created_by INTEGER,
@@ -93,9 +530,336 @@ def init_db():
     )
     ''')
 
-    conn.commit()
-    conn.close()
+def _migrate_order_items(conn):
+    # One row per ordered line, replaces parsing the orders.items / kot.items
+    # JSON blobs for reads and aggregation
+    cursor = conn.cursor()
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'order_items'")
+    order_items_existed = cursor.fetchone() is not None
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS order_items (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        order_id INTEGER NOT NULL,
+        kot_id INTEGER,
+        menu_item_id INTEGER,
+        name TEXT NOT NULL,
+        quantity INTEGER NOT NULL,
+        price REAL NOT NULL,
+        notes TEXT,
+        status TEXT DEFAULT 'pending', -- mirrors the status of its KOT
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (order_id) REFERENCES orders (id),
+        FOREIGN KEY (kot_id) REFERENCES kot (id),
+        FOREIGN KEY (menu_item_id) REFERENCES menu_items (id)
+    )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_order_items_order ON order_items (order_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_order_items_kot ON order_items (kot_id)")
+
+    if not order_items_existed:
+        _backfill_order_items(cursor)
+
+def _backfill_order_items(cursor):
+    # One-time copy of the legacy JSON columns. Every KOT carries the lines it
+    # was created with, so KOTs are the source; orders that never got a KOT
+    # fall back to orders.items.
+    cursor.execute('''
+    INSERT INTO order_items (order_id, kot_id, menu_item_id, name, quantity, price, notes, status, created_at)
+    SELECT k.order_id, k.id,
+           json_extract(j.value, '$.menu_item_id'), json_extract(j.value, '$.name'),
+           json_extract(j.value, '$.quantity'), json_extract(j.value, '$.price'),
+           json_extract(j.value, '$.notes'), k.status, k.created_at
+    FROM kot k, json_each(k.items) j
+    ORDER BY k.id, j.key
+    ''')
+    cursor.execute('''
+    INSERT INTO order_items (order_id, kot_id, menu_item_id, name, quantity, price, notes, status, created_at)
+    SELECT o.id, NULL,
+           json_extract(j.value, '$.menu_item_id'), json_extract(j.value, '$.name'),
+           json_extract(j.value, '$.quantity'), json_extract(j.value, '$.price'),
+           json_extract(j.value, '$.notes'),
+           CASE WHEN o.status = 'paid' THEN 'completed' ELSE 'pending' END, o.created_at
+    FROM orders o, json_each(o.items) j
+    WHERE NOT EXISTS (SELECT 1 FROM kot k WHERE k.order_id = o.id)
+    ORDER BY o.id, j.key
+    ''')
+
+def _migrate_sales_rollups(conn):
+    # Maintained when an order is paid (see sales_rollup.py)
+    cursor = conn.cursor()
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sales_daily'")
+    rollups_existed = cursor.fetchone() is not None
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS sales_daily (
+        day TEXT PRIMARY KEY, -- YYYY-MM-DD of the order's created_at
+        revenue REAL NOT NULL DEFAULT 0,
+        order_count INTEGER NOT NULL DEFAULT 0
+    ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS sales_hourly (
+        day TEXT NOT NULL,
+        hour INTEGER NOT NULL,
+        revenue REAL NOT NULL DEFAULT 0,
+        order_count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (day, hour)
+    ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS sales_item_daily (
+        day TEXT NOT NULL,
+        name TEXT NOT NULL,
+        quantity INTEGER NOT NULL DEFAULT 0,
+        revenue REAL NOT NULL DEFAULT 0,
+        PRIMARY KEY (day, name)
+    ) WITHOUT ROWID
+    ''')
+
+    if not rollups_existed:
+        sales_rollup.backfill(conn, ["sales_daily", "sales_hourly", "sales_item_daily"])
+
+def _migrate_hot_indexes(conn):
+    cursor = conn.cursor()
+    # Open/paid order lists: WHERE status = ? ORDER BY created_at, and the
+    # paid-order date ranges used by reports and the rollup backfill
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_orders_status_created ON orders (status, created_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_orders_table ON orders (table_id, created_at)")
+    # get_order / paying an order look up its KOTs
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_kot_order ON kot (order_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_kot_status_created ON kot (status, created_at)")
+    # The kitchen screen only ever reads open tickets; keep that index tiny
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_kot_active ON kot (created_at) "
+        "WHERE status IN ('pending', 'preparing', 'ready')"
+    )
+
+def _migrate_analytics_rollups(conn):
+    # Per-table and per-category days for /api/sales/analytics
+    cursor = conn.cursor()
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS sales_table_daily (
+        day TEXT NOT NULL,
+        table_id INTEGER NOT NULL, -- 0 when the order had no table
+        revenue REAL NOT NULL DEFAULT 0,
+        order_count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (day, table_id)
+    ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS sales_category_daily (
+        day TEXT NOT NULL,
+        category TEXT NOT NULL,
+        revenue REAL NOT NULL DEFAULT 0,
+        quantity INTEGER NOT NULL DEFAULT 0,
+        order_count INTEGER NOT NULL DEFAULT 0, -- paid orders containing the category
+        PRIMARY KEY (day, category)
+    ) WITHOUT ROWID
+    ''')
+    sales_rollup.backfill(conn, ["sales_table_daily", "sales_category_daily"])
+
+def _migrate_event_log(conn):
+    # Shared event stream tailed by every worker (events.SQLiteEventBus).
+    # AUTOINCREMENT so ids are never reused after old rows are pruned.
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS event_log (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        channel TEXT NOT NULL,
+        payload TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+
+def _migrate_history_indexes(conn):
+    # Unfiltered order/KOT history pages walk (created_at, id); the rowid
+    # rides along in every index, so created_at alone gives that order
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_orders_created ON orders (created_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_kot_created ON kot (created_at)")
+
+def _migrate_recipes(conn):
+    # How much of each inventory item one unit of a menu item uses; see
+    # stock.py. Looked up by menu item when a KOT is deducted.
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS recipes (
+        menu_item_id INTEGER NOT NULL,
+        inventory_item_id INTEGER NOT NULL,
+        quantity REAL NOT NULL,
+        PRIMARY KEY (menu_item_id, inventory_item_id),
+        FOREIGN KEY (menu_item_id) REFERENCES menu_items (id),
+        FOREIGN KEY (inventory_item_id) REFERENCES inventory (id)
+    ) WITHOUT ROWID
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_recipes_inventory ON recipes (inventory_item_id)")
+    # The low-stock set: only rows at or under their threshold are in it
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_inventory_low_stock ON inventory (item_name) "
+        "WHERE quantity <= low_stock_threshold"
+    )
+
+# Schema history. Each entry runs once, in order, and PRAGMA user_version
+# records how many have been applied. Only ever append to this list; existing
+# databases created before versioning start at 0, so every step has to be
+# safe to run against tables that may already exist.
+MIGRATIONS = [
+    _migrate_base_schema,
+    _migrate_order_items,
+    _migrate_sales_rollups,
+    _migrate_hot_indexes,
+    _migrate_analytics_rollups,
+    _migrate_event_log,
+    _migrate_history_indexes,
+    _migrate_recipes,
+]
+
+def migrate(conn):
+    applied = []
+    for version, migration in enumerate(MIGRATIONS, start=1):
+        # BEGIN IMMEDIATE takes the write lock before we look at
+        # user_version, so several workers starting at once apply each
+        # migration exactly once
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            current = conn.execute("PRAGMA user_version").fetchone()[0]
+            if current >= version:
+                conn.rollback()
+                continue
+            migration(conn)
+            conn.execute(f"PRAGMA user_version = {version}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append(migration.__name__)
+    return applied
+
+def init_db():
+    with pool.connection() as conn:
+        # Archive first: a migration that backfills rollups reads through it
+        return archive.migrate(conn) + migrate(conn)
+
+# Hot queries and the index(es) each one may use. `python database.py
+# --check-plans` fails if any of them falls back to a full table scan.
+HOT_QUERY_PLANS = [
+    (
+        "orders by status",
+        "SELECT * FROM orders WHERE status = ? ORDER BY created_at DESC",
+        ("pending",),
+        "idx_orders_status_created",
+    ),
+    (
+        "orders by table",
+        "SELECT * FROM orders WHERE table_id = ? ORDER BY created_at DESC",
+        (1,),
+        "idx_orders_table",
+    ),
+    (
+        "paid orders in range",
+        "SELECT id, total_amount FROM orders WHERE status = 'paid' AND created_at >= ? AND created_at < ?",
+        ("2025-01-01 00:00:00", "2025-01-02 00:00:00"),
+        "idx_orders_status_created",
+    ),
+    (
+        "KOTs of an order",
+        "SELECT * FROM kot WHERE order_id = ?",
+        (1,),
+        "idx_kot_order",
+    ),
+    (
+        "lines of an order",
+        f"SELECT {ORDER_ITEM_FIELDS} FROM order_items WHERE order_id IN (?, ?) ORDER BY id",
+        (1, 2),
+        "idx_order_items_order",
+    ),
+    (
+        "KOTs by status",
+        "SELECT k.*, t.table_number FROM kot k JOIN orders o ON k.order_id = o.id "
+        "JOIN tables t ON o.table_id = t.id WHERE k.status = ? ORDER BY k.created_at ASC",
+        ("pending",),
+        "idx_kot_status_created",
+    ),
+    (
+        "active KOTs (KDS)",
+        "SELECT k.*, t.table_number FROM kot k JOIN orders o ON k.order_id = o.id "
+        "JOIN tables t ON o.table_id = t.id WHERE k.status IN ('pending', 'preparing', 'ready') "
+        "ORDER BY k.created_at ASC",
+        (),
+        # Which of the two wins depends on sqlite_stat1 (ANALYZE); either
+        # keeps the kitchen screen off a full kot scan
+        ("idx_kot_active", "idx_kot_status_created"),
+    ),
+    (
+        "order history page",
+        "SELECT id, created_at, total_amount FROM orders WHERE 1=1 "
+        "AND (created_at, id) < (?, ?) ORDER BY created_at DESC, id DESC LIMIT ?",
+        ("2025-01-02 00:00:00", 100, 101),
+        "idx_orders_created",
+    ),
+    (
+        "order history page by status",
+        "SELECT id, created_at, total_amount FROM orders WHERE 1=1 AND status = ? "
+        "AND (created_at, id) < (?, ?) ORDER BY created_at DESC, id DESC LIMIT ?",
+        ("paid", "2025-01-02 00:00:00", 100, 101),
+        "idx_orders_status_created",
+    ),
+    (
+        "KOT history page",
+        "SELECT k.id, k.created_at, t.table_number FROM kot k JOIN orders o ON k.order_id = o.id "
+        "JOIN tables t ON o.table_id = t.id WHERE 1=1 AND (k.created_at, k.id) > (?, ?) "
+        "ORDER BY k.created_at ASC, k.id ASC LIMIT ?",
+        ("2025-01-02 00:00:00", 100, 101),
+        "idx_kot_created",
+    ),
+    (
+        "low stock",
+        "SELECT * FROM inventory WHERE quantity <= low_stock_threshold ORDER BY item_name",
+        (),
+        "idx_inventory_low_stock",
+    ),
+    (
+        "recipes of ordered items",
+        "SELECT menu_item_id, inventory_item_id, quantity FROM recipes WHERE menu_item_id IN (?, ?)",
+        (1, 2),
+        "PRIMARY KEY",
+    ),
+    (
+        # Merged index scans over the live and archived halves
+        "order history incl. archive",
+        "SELECT id, created_at FROM all_orders WHERE created_at >= ? AND created_at < ? "
+        "ORDER BY created_at DESC, id DESC LIMIT ?",
+        ("2025-01-01", "2025-01-02", 100),
+        "idx_orders_created",
+    ),
+]
+
+def explain(conn, query, params=()):
+    return [row["detail"] for row in conn.execute(f"EXPLAIN QUERY PLAN {query}", params)]
+
+def check_query_plans(conn):
+    failures = []
+    for name, query, params, indexes in HOT_QUERY_PLANS:
+        if isinstance(indexes, str):
+            indexes = (indexes,)
+        plan = explain(conn, query, params)
+        uses_index = any(index in step for step in plan for index in indexes)
+        # SEARCH/SCAN through the primary key of a joined table is fine;
+        # a bare "SCAN <table>" is not
+        full_scan = any(step.startswith("SCAN ") and " USING " not in step for step in plan)
+        if not uses_index or full_scan:
+            failures.append((name, indexes, plan))
+    return failures
 
 if __name__ == "__main__":
-    init_db()
-    print("Database initialized successfully.")
+    import sys
+
+    applied = init_db()
+    print(f"Database initialized successfully ({len(applied)} migrations applied).")
+
+    if "--check-plans" in sys.argv:
+        with pool.connection() as conn:
+            failures = check_query_plans(conn)
+        for name, indexes, plan in failures:
+            print(f"FAIL {name}: expected {' or '.join(indexes)}, got {plan}")
+        if failures:
+            sys.exit(1)
+        print(f"All {len(HOT_QUERY_PLANS)} hot query plans use their indexes.")
@@ -0,0 +1,305 @@
+import asyncio
+import itertools
+import json
+import logging
+import os
+import sqlite3
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+import sqltrace
+from database import get_db_connection
+
+logger = logging.getLogger(__name__)
+
+# Per-subscriber queue depth. A kitchen screen that falls this far behind is
+# disconnected and catches up from the replay buffer when it reconnects.
+SUBSCRIBER_QUEUE_SIZE = 256
+REPLAY_BUFFER_SIZE = 1000
+
+# "memory" keeps events inside one process; "sqlite" shares them between all
+# uvicorn workers on the host through the event_log table.
+EVENT_BUS = os.environ.get("EVENT_BUS", "memory")
+EVENT_BUS_POLL_INTERVAL = float(os.environ.get("EVENT_BUS_POLL_INTERVAL", "0.05"))
+EVENT_BUS_BATCH_SIZE = 500
+EVENT_LOG_RETENTION = 10000  # rows kept for workers that restart
+EVENT_LOG_PRUNE_SECONDS = 60
+
+class Event:
+    __slots__ = ("id", "data")
+
+    def __init__(self, id, data):
+        self.id = id
+        self.data = data
+
+class Subscriber:
+    def __init__(self, queue_size):
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.evicted = False
+
+    async def get(self, timeout=None):
+        # Returns the next Event, None on timeout; raises EOFError once the
+        # broker has evicted this subscriber
+        try:
+            # Fast path: draining a backlog needs no timer or extra task
+            event = self.queue.get_nowait()
+        except asyncio.QueueEmpty:
+            try:
+                event = await asyncio.wait_for(self.queue.get(), timeout)
+            except asyncio.TimeoutError:
+                return None
+        if event is _EVICTED:
+            raise EOFError("subscriber evicted")
+        return event
+
+_EVICTED = object()
+
+class EventBroker:
+    """In-process pub/sub with fan-out, replay and slow-consumer eviction.
+
+    Every publish gets the next event id and is pushed to every subscriber's
+    own bounded queue, waking waiting consumers immediately. The last
+    ``history`` events are kept so a reconnecting client can resume from its
+    Last-Event-ID. All methods must be called from the event loop thread.
+    """
+
+    def __init__(self, history=REPLAY_BUFFER_SIZE, queue_size=SUBSCRIBER_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self.subscribers = set()
+        self.evictions = 0
+        self._history = deque(maxlen=history)
+        self._ids = itertools.count(1)
+        self._dropped_through = 0
+
+    @property
+    def last_event_id(self):
+        return self._history[-1].id if self._history else 0
+
+    def publish(self, data, id=None):
+        # ``id`` comes from the event bus; ids only have to increase, gaps
+        # (events on other channels) are fine
+        event = Event(next(self._ids) if id is None else id, data)
+        if len(self._history) == self._history.maxlen:
+            self._dropped_through = self._history[0].id
+        self._history.append(event)
+        for subscriber in list(self.subscribers):
+            try:
+                subscriber.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                self._evict(subscriber)
+        return event
+
+    def subscribe(self, last_event_id=None):
+        subscriber = Subscriber(self.queue_size)
+        if last_event_id is not None:
+            for event in self.replay(last_event_id)[:self.queue_size]:
+                subscriber.queue.put_nowait(event)
+        self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        self.subscribers.discard(subscriber)
+
+    def replay(self, last_event_id):
+        return [event for event in self._history if event.id > last_event_id]
+
+    def can_replay(self, last_event_id):
+        # False when events after last_event_id have already been dropped
+        # from the buffer, there are more of them than a subscriber queue
+        # holds, or the id is from before a restart; in each case the client
+        # must reload its full state
+        if last_event_id > self.last_event_id:
+            return False
+        if last_event_id < self._dropped_through:
+            return False
+        return len(self.replay(last_event_id)) <= self.queue_size
+
+    def _evict(self, subscriber):
+        self.subscribers.discard(subscriber)
+        self.evictions += 1
+        subscriber.evicted = True
+        # Make room for the sentinel so the consumer stops right away
+        while not subscriber.queue.empty():
+            subscriber.queue.get_nowait()
+        subscriber.queue.put_nowait(_EVICTED)
+
+class MemoryEventBus:
+    """Channel-based publish/subscribe between the parts of one process.
+
+    Handlers are plain callables ``handler(event_id, data)`` run on the event
+    loop; they must not block. Event ids increase across all channels.
+    """
+
+    def __init__(self):
+        self.handlers = defaultdict(list)
+        # Every event with an id above this is delivered to this process
+        self.replay_from = 0
+        self._ids = itertools.count(1)
+
+    def subscribe(self, channel, handler):
+        self.handlers[channel].append(handler)
+
+    def _dispatch(self, event_id, channel, data):
+        for handler in self.handlers.get(channel, ()):
+            try:
+                handler(event_id, data)
+            except Exception:
+                logger.exception("Event handler for %s failed", channel)
+
+    async def publish(self, channel, data):
+        event_id = next(self._ids)
+        self._dispatch(event_id, channel, data)
+        return event_id
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+class SQLiteEventBus(MemoryEventBus):
+    """Event bus shared by every worker process on the host.
+
+    ``publish`` appends to the event_log table and each worker tails it,
+    dispatching rows to its own handlers in id order, so all workers see the
+    same events with the same ids. A publish wakes the local tailer right
+    away; other workers pick it up within ``poll_interval``. On start a
+    worker reloads the last ``REPLAY_BUFFER_SIZE`` rows so reconnecting
+    clients can still resume from it. An event whose append fails is lost;
+    screens pick the change up on their next /api/kds/active load and
+    caches through their TTL.
+    """
+
+    def __init__(self, connect=get_db_connection, poll_interval=EVENT_BUS_POLL_INTERVAL,
+                 retention=EVENT_LOG_RETENTION):
+        super().__init__()
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self.last_id = 0
+        self._connect = connect
+        self._conn = None
+        self._task = None
+        self._wake = None
+        # One thread owns the bus connection, keeping it off the request pool
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="event-bus")
+
+    async def _run(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, fn, *args)
+
+    # The bus connection is traced like the pooled ones (see sqltrace.py) but
+    # never goes back to a pool, so each step flushes it as pool.release would
+
+    def _open(self):
+        self._conn = self._connect()
+        try:
+            row = self._conn.execute(
+                "SELECT MIN(id) - 1 FROM (SELECT id FROM event_log ORDER BY id DESC LIMIT ?)",
+                (REPLAY_BUFFER_SIZE,)
+            ).fetchone()
+        finally:
+            sqltrace.flush(self._conn)
+        return row[0] or 0
+
+    def _append(self, channel, payload):
+        try:
+            cursor = self._conn.execute(
+                "INSERT INTO event_log (channel, payload) VALUES (?, ?)", (channel, payload)
+            )
+            self._conn.commit()
+        except sqlite3.Error:
+            # Don't leave the insert pending for the next append to commit
+            self._conn.rollback()
+            raise
+        finally:
+            sqltrace.flush(self._conn)
+        return cursor.lastrowid
+
+    def _fetch(self, after_id):
+        try:
+            return self._conn.execute(
+                "SELECT id, channel, payload FROM event_log WHERE id > ? ORDER BY id LIMIT ?",
+                (after_id, EVENT_BUS_BATCH_SIZE)
+            ).fetchall()
+        finally:
+            sqltrace.flush(self._conn)
+
+    def _prune(self):
+        try:
+            self._conn.execute(
+                "DELETE FROM event_log WHERE id <= (SELECT MAX(id) FROM event_log) - ?",
+                (self.retention,)
+            )
+            self._conn.commit()
+        finally:
+            sqltrace.flush(self._conn)
+
+    async def publish(self, channel, data):
+        # Every publish follows a committed write, so a failed append (the
+        # event log locked past busy_timeout) is logged rather than raised:
+        # the caller's change stands, and failing the request would only
+        # invite a retry that repeats it. Returns None when nothing was sent.
+        try:
+            event_id = await self._run(self._append, channel, json.dumps(data))
+        except sqlite3.Error:
+            logger.exception("Publishing to %s failed", channel)
+            return None
+        if self._wake is not None:
+            self._wake.set()
+        return event_id
+
+    async def start(self):
+        if self._task is not None:
+            return
+        self.last_id = self.replay_from = await self._run(self._open)
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._tail())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._conn is not None:
+            await self._run(self._conn.close)
+            self._conn = None
+        self._executor.shutdown(wait=True)
+
+    async def _tail(self):
+        loop = asyncio.get_running_loop()
+        next_prune = loop.time() + EVENT_LOG_PRUNE_SECONDS
+        while True:
+            self._wake.clear()
+            try:
+                rows = await self._run(self._fetch, self.last_id)
+            except sqlite3.Error:
+                logger.exception("Reading the event log failed")
+                rows = []
+            for event_id, channel, payload in rows:
+                self.last_id = event_id
+                self._dispatch(event_id, channel, json.loads(payload))
+            if loop.time() >= next_prune:
+                next_prune = loop.time() + EVENT_LOG_PRUNE_SECONDS
+                try:
+                    await self._run(self._prune)
+                except sqlite3.Error:
+                    # Another worker holds the write lock; try next round
+                    pass
+            if len(rows) == EVENT_BUS_BATCH_SIZE:
+                continue
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+def create_event_bus(backend=EVENT_BUS):
+    if backend == "memory":
+        return MemoryEventBus()
+    if backend == "sqlite":
+        return SQLiteEventBus()
+    raise ValueError(f"Unknown EVENT_BUS backend: {backend}")
+
+bus = create_event_bus()
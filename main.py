@@ -1,8 +1,15 @@
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from database import init_db
-from routes import auth, menu, inventory, tables, orders, kot, kds, sales
+from archive import archiver
+from database import connections_opened, init_db, db
+from events import bus
+from middleware.compression import CompressionMiddleware
+from middleware.metrics import MetricsMiddleware, metrics
+import passwords
+from sqltrace import sql_stats
+from routes import admin, auth, menu, inventory, tables, orders, kot, kds, sales
 
 # Initialize Database
 init_db()
@@ -16,8 +23,17 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["http://localhsost:3000","https://chai-pani-new.onrender.com"],
+    # X-Last-Event-ID: read by kitchen.html to resume the stream
+    # X-Next-Cursor: next page of the order/KOT history lists
+    expose_headers=["X-Last-Event-ID", "X-Next-Cursor"],
 )
 
+# br/gzip for complete responses over COMPRESS_MIN_SIZE; streams are untouched
+app.add_middleware(CompressionMiddleware)
+
+# Outermost, so latency includes compression and CORS
+app.add_middleware(MetricsMiddleware)
+
 # Include Routers
 app.include_router(auth.router)
 app.include_router(menu.router)
@@ -27,10 +43,71 @@ app.include_router(orders.router)
 app.include_router(kot.router)
 app.include_router(kds.router)
 app.include_router(sales.router)
+app.include_router(admin.router)
 
-# Mount static files for frontend
-app.mount("/", StaticFiles(directory="public", html=True), name="public")
+# Gauges read at scrape time. Per worker: with several uvicorn workers each
+# scrape sees whichever worker answered.
+metrics.gauge("db_connections_open", "Pooled SQLite connections currently open.", lambda: db.pool.stats()["open"])
+metrics.gauge("db_connections_in_use", "Pooled SQLite connections checked out.", lambda: db.pool.stats()["in_use"])
+metrics.gauge(
+    "db_stream_connections_in_use", "Connections held by streamed report downloads.",
+    lambda: db.stream_pool.stats()["in_use"],
+)
+metrics.gauge(
+    "db_connections_opened_total", "SQLite connections opened (request and stream pools, writer, event bus).",
+    connections_opened, kind="counter",
+)
+metrics.gauge("db_write_batches_total", "Group-commit transactions.", lambda: db.writer.batches, kind="counter")
+metrics.gauge("db_writes_total", "Mutations applied through the group-commit writer.", lambda: db.writer.writes, kind="counter")
+metrics.gauge(
+    "db_slow_queries_total", "Statements that ran for DB_SLOW_QUERY_MS or longer.",
+    lambda: sql_stats.stats()["slow_calls"], kind="counter",
+)
+metrics.gauge(
+    "archive_orders_moved_total", "Orders moved to the archive database by this worker.",
+    lambda: archiver.orders_moved, kind="counter",
+)
+metrics.gauge("kds_sse_subscribers", "Kitchen screens connected to the event stream.", lambda: len(kds.broker.subscribers))
+metrics.gauge("kds_sse_evictions_total", "Slow kitchen screens disconnected.", lambda: kds.broker.evictions, kind="counter")
+
+@app.on_event("startup")
+async def start_event_bus():
+    await bus.start()
+
+@app.on_event("startup")
+async def start_archiver():
+    # Moves old paid orders to the archive every ARCHIVE_INTERVAL_HOURS
+    archiver.start(db)
+
+@app.on_event("startup")
+def start_password_workers():
+    passwords.start()
+
+@app.on_event("shutdown")
+async def stop_event_bus():
+    await bus.stop()
+
+@app.on_event("shutdown")
+async def stop_archiver():
+    await archiver.stop()
+
+@app.on_event("shutdown")
+def stop_password_workers():
+    passwords.shutdown()
+
+@app.on_event("shutdown")
+def close_database():
+    db.shutdown()
 
 @app.get("/api/health")
 async def health_check():
     return {"status": "healthy"}
+
+@app.get("/api/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    # Prometheus text exposition format
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+# Mount static files for frontend. Last: the mount matches every path, so
+# routes declared after it would never be reached
+app.mount("/", StaticFiles(directory="public", html=True), name="public")
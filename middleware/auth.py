@@ -3,23 +3,31 @@ from typing import Optional
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
-from passlib.context import CryptContext
+import os
 import sqlite3
-from database import get_db_connection
+import time
+from cache import TTLCache
+from database import Database, get_db
+from events import bus
 
 # Configuration
 SECRET_KEY = "your-secret-key-change-this-in-production"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 300 # Long expiry for MVP
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/login")
+# Verified token -> user row. A hit skips both JWT verification and the
+# users lookup; entries never outlive their token. User changes must call
+# invalidate_principals() so no worker keeps serving a stale row.
+AUTH_CACHE_SIZE = int(os.environ.get("AUTH_CACHE_SIZE", "1024"))
+AUTH_CACHE_TTL = float(os.environ.get("AUTH_CACHE_TTL", "60"))
+principal_cache = TTLCache(maxsize=AUTH_CACHE_SIZE, ttl=AUTH_CACHE_TTL)
+bus.subscribe("cache.auth", lambda event_id, data: principal_cache.invalidate())
 
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+async def invalidate_principals():
+    principal_cache.invalidate()
+    await bus.publish("cache.auth", {})
 
-def get_password_hash(password):
-    return pwd_context.hash(password)
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/login")
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -31,7 +39,12 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme)):
+async def get_current_user(token: str = Depends(oauth2_scheme), db: Database = Depends(get_db)):
+    user = principal_cache.get(token)
+    if user is not None:
+        # Copy so a handler cannot change the cached row
+        return dict(user)
+
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -45,14 +58,14 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
     except JWTError:
         raise credentials_exception
         
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM users WHERE username = ?", (username,))
-    user = cursor.fetchone()
-    conn.close()
+    version = principal_cache.version
+    user = await db.fetchone("SELECT * FROM users WHERE username = ?", (username,))
     
     if user is None:
         raise credentials_exception
+    # jwt.decode has already rejected expired tokens, so this is positive
+    ttl = min(AUTH_CACHE_TTL, payload["exp"] - time.time()) if "exp" in payload else None
+    principal_cache.set(token, user, version=version, ttl=ttl)
     return dict(user)
 
 async def get_current_active_user(current_user: dict = Depends(get_current_user)):
@@ -60,7 +73,8 @@ async def get_current_active_user(current_user: dict = Depends(get_current_user)
     return current_user
 
 def check_role(required_roles: list):
-    def role_checker(user: dict = Depends(get_current_active_user)):
+    # async so the check runs on the event loop instead of a threadpool hop
+    async def role_checker(user: dict = Depends(get_current_active_user)):
         if user["role"] not in required_roles and "admin" not in required_roles: # Admin always has access if we want, but let's be explicit
              # If admin is not in required roles, we might still want to allow admin. 
              # For now, let's just check if user role is in the list.
@@ -76,3 +90,10 @@ def check_role(required_roles: list):
                 )
         return user
     return role_checker
+
+async def require_admin(user: dict = Depends(get_current_active_user)):
+    # Not check_role(["admin"]): that lets any role through whenever
+    # "admin" is in the list
+    if user["role"] != "admin":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Operation not permitted")
+    return user
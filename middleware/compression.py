@@ -0,0 +1,107 @@
+import gzip
+import os
+
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+# Bodies smaller than this go out as-is; compressing them costs more than it
+# saves on the wire
+COMPRESS_MIN_SIZE = int(os.environ.get("COMPRESS_MIN_SIZE", "1024"))
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5  # about as fast as gzip level 6, smaller output
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/javascript", "image/svg+xml")
+
+def base_etag(tag):
+    # Compressed bodies carry the weak form of the route's ETag; compare
+    # If-None-Match tags without it
+    return tag[2:] if tag.startswith("W/") else tag
+
+def accepted_encodings(header):
+    # Lower-cased codings from an Accept-Encoding header, minus any the
+    # client refused with q=0. Shared with the streamed CSV reports.
+    accepted = set()
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        params = params.replace(" ", "")
+        if params.startswith("q=") and params[2:] in ("0", "0.0", "0.00", "0.000"):
+            continue
+        accepted.add(name.lower())
+    return accepted
+
+class CompressionMiddleware:
+    """Brotli/gzip compression for complete (non-streaming) responses.
+
+    A response is compressed when the client accepts br (if the brotli
+    package is installed) or gzip, it is a text-like type, not already
+    encoded and at least ``minimum_size`` bytes. Streaming responses (the
+    KDS event stream, CSV reports, static files) pass through untouched so
+    events are never held back in a compressor buffer.
+    """
+
+    def __init__(self, app, minimum_size=COMPRESS_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        accepted = accepted_encodings(Headers(scope=scope).get("accept-encoding", ""))
+        if brotli is not None and "br" in accepted:
+            encoding = "br"
+        elif "gzip" in accepted:
+            encoding = "gzip"
+        else:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+
+        async def send_compressed(message):
+            nonlocal start_message
+            if message["type"] == "http.response.start":
+                # Hold the headers until the first body chunk shows whether
+                # this is a complete response
+                start_message = message
+                return
+            if message["type"] != "http.response.body" or start_message is None:
+                await send(message)
+                return
+
+            start, start_message = start_message, None
+            body = message.get("body", b"")
+            if message.get("more_body", False) or not self._should_compress(start, body):
+                await send(start)
+                await send(message)
+                return
+
+            if encoding == "br":
+                body = brotli.compress(body, quality=BROTLI_QUALITY)
+            else:
+                body = gzip.compress(body, compresslevel=GZIP_LEVEL)
+            headers = MutableHeaders(scope=start)
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(body))
+            etag = headers.get("etag")
+            if etag and not etag.startswith("W/"):
+                # A strong ETag promises byte-identical bodies, which no
+                # longer holds across encodings (same as nginx does)
+                headers["ETag"] = f"W/{etag}"
+            headers.add_vary_header("Accept-Encoding")
+            await send(start)
+            await send({**message, "body": body})
+
+        await self.app(scope, receive, send_compressed)
+
+    def _should_compress(self, start, body):
+        if len(body) < self.minimum_size or start["status"] in (204, 304):
+            return False
+        headers = Headers(raw=start["headers"])
+        if "content-encoding" in headers:
+            return False
+        return headers.get("content-type", "").startswith(COMPRESSIBLE_TYPES)
@@ -0,0 +1,131 @@
+import time
+from bisect import bisect_left
+
+# Upper bounds (seconds) of the request latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _labels(names, values):
+    return ",".join(f'{name}="{value}"' for name, value in zip(names, values))
+
+class Histogram:
+    # Per-bucket (non-cumulative) counts; cumulated only when rendered
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+class Metrics:
+    """Request counters and latency histograms in Prometheus text format.
+
+    Everything is updated from the event loop thread only, so plain dict
+    and int updates need no locks. Histograms are fixed buckets, so an
+    observation is one bisect and three additions. Gauges registered with
+    ``gauge()`` are read from their callbacks at scrape time.
+    """
+
+    def __init__(self):
+        self.requests = {}  # (method, route, status) -> count
+        self.latency = {}  # (method, route) -> Histogram
+        self.in_flight = 0
+        self._gauges = []
+
+    def gauge(self, name, help, collect, kind="gauge"):
+        # ``collect()`` returns the current value; kind="counter" for
+        # totals kept elsewhere
+        self._gauges.append((name, help, kind, collect))
+
+    def record(self, method, route, status, seconds):
+        key = (method, route, status)
+        self.requests[key] = self.requests.get(key, 0) + 1
+        if seconds is not None:
+            histogram = self.latency.get((method, route))
+            if histogram is None:
+                histogram = self.latency[(method, route)] = Histogram()
+            histogram.observe(seconds)
+
+    def render(self):
+        lines = [
+            "# HELP http_requests_total HTTP requests by method, route and status.",
+            "# TYPE http_requests_total counter",
+        ]
+        for key, count in sorted(self.requests.items()):
+            lines.append(f"http_requests_total{{{_labels(('method', 'route', 'status'), key)}}} {count}")
+
+        lines += [
+            "# HELP http_requests_in_flight Requests currently being handled.",
+            "# TYPE http_requests_in_flight gauge",
+            f"http_requests_in_flight {self.in_flight}",
+            "# HELP http_request_duration_seconds Request latency by method and route (event streams excluded).",
+            "# TYPE http_request_duration_seconds histogram",
+        ]
+        for key, histogram in sorted(self.latency.items()):
+            labels = _labels(("method", "route"), key)
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS + ("+Inf",), histogram.counts):
+                cumulative += count
+                lines.append(f'http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f"http_request_duration_seconds_sum{{{labels}}} {histogram.sum:.6f}")
+            lines.append(f"http_request_duration_seconds_count{{{labels}}} {histogram.count}")
+
+        for name, help, kind, collect in self._gauges:
+            lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}", f"{name} {collect()}"]
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics()
+
+def _route_label(scope):
+    # The route template (/api/orders/{order_id}), never the raw path, so
+    # label cardinality stays bounded
+    route = scope.get("route")
+    path = getattr(route, "path", None)
+    if path is None:
+        return "static" if "endpoint" in scope else "unmatched"
+    return path
+
+class MetricsMiddleware:
+    """Counts every HTTP request by route and status and times it.
+
+    Latency runs until the last body chunk is sent. Event streams are
+    counted but left out of the histogram, since their "latency" is how
+    long a screen stayed connected.
+    """
+
+    def __init__(self, app, registry=metrics):
+        self.app = app
+        self.registry = registry
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        registry = self.registry
+        started = time.perf_counter()
+        status = 500
+        streaming = False
+
+        async def send_wrapper(message):
+            nonlocal status, streaming
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                for name, value in message.get("headers", ()):
+                    if name == b"content-type" and value.startswith(b"text/event-stream"):
+                        streaming = True
+            await send(message)
+
+        registry.in_flight += 1
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            registry.in_flight -= 1
+            registry.record(
+                scope["method"], _route_label(scope), status,
+                None if streaming else time.perf_counter() - started,
+            )
@@ -0,0 +1,78 @@
+import base64
+import json
+from datetime import datetime, timedelta
+
+from fastapi import HTTPException
+
+from responses import FastJSONResponse
+
+# History endpoints page on (created_at, id): each page is one index range
+# scan that starts where the previous page stopped, so its cost does not
+# depend on how much history sits before it.
+PAGE_SIZE_DEFAULT = 100
+PAGE_SIZE_MAX = 500
+
+def check_limit(limit):
+    if limit < 1 or limit > PAGE_SIZE_MAX:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {PAGE_SIZE_MAX}")
+
+def encode_cursor(row):
+    raw = json.dumps([row["created_at"], row["id"]]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, row_id = json.loads(raw)
+        if not isinstance(created_at, str) or not isinstance(row_id, int):
+            raise ValueError(cursor)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return created_at, row_id
+
+def keyset_clause(column_prefix, cursor, descending):
+    # Rows strictly after the cursor in (created_at, id) order
+    if cursor is None:
+        return "", []
+    op = "<" if descending else ">"
+    return (
+        f" AND ({column_prefix}created_at, {column_prefix}id) {op} (?, ?)",
+        list(decode_cursor(cursor)),
+    )
+
+def date_range_clause(column, start, end):
+    # Inclusive YYYY-MM-DD bounds on a timestamp column
+    clause, params = "", []
+    for value, name, op in ((start, "start", ">="), (end, "end", "<")):
+        if value is None:
+            continue
+        try:
+            day = datetime.strptime(value, "%Y-%m-%d")
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Invalid {name} date. Use YYYY-MM-DD")
+        if name == "end":
+            day += timedelta(days=1)
+        clause += f" AND {column} {op} ?"
+        params.append(day.strftime("%Y-%m-%d %H:%M:%S"))
+    return clause, params
+
+def parse_fields(fields, allowed):
+    # Comma-separated projection; None means every field
+    if not fields:
+        return None
+    selected = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = [field for field in selected if field not in allowed]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    return selected
+
+def page_response(rows, limit, fields):
+    # ``rows`` holds up to limit + 1 rows; the extra one only signals that
+    # another page exists
+    headers = {}
+    if len(rows) > limit:
+        rows = rows[:limit]
+        headers["X-Next-Cursor"] = encode_cursor(rows[-1])
+    if fields is not None:
+        rows = [{field: row[field] for field in fields} for row in rows]
+    return FastJSONResponse(rows, headers=headers)
@@ -0,0 +1,82 @@
+"""Password hashing off the event loop.
+
+bcrypt is deliberately slow (~250 ms per hash or verify), so login and
+register hand it to a small process pool instead of running it inside the
+request handler. The event loop only waits on a future meanwhile.
+"""
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+
+# 0 runs bcrypt inline on the event loop (the old behaviour)
+PASSWORD_HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS", str(min(2, os.cpu_count() or 1))))
+# Hashes queued or running at once; beyond this logins get a 503 instead of
+# piling up behind each other
+PASSWORD_HASH_MAX_PENDING = int(os.environ.get("PASSWORD_HASH_MAX_PENDING", "32"))
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+def verify_password(plain_password, hashed_password):
+    return pwd_context.verify(plain_password, hashed_password)
+
+def get_password_hash(password):
+    return pwd_context.hash(password)
+
+_executor = None
+_pending = 0
+
+def _get_executor():
+    # forkserver, not the default fork: workers can be started on demand
+    # while the database and event bus threads hold locks, and a forked
+    # child would inherit those locks held. The workers only need this
+    # module and passlib.
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=PASSWORD_HASH_WORKERS, mp_context=multiprocessing.get_context("forkserver")
+        )
+    return _executor
+
+async def _run(fn, *args):
+    global _pending
+    if PASSWORD_HASH_WORKERS <= 0:
+        return fn(*args)
+    if _pending >= PASSWORD_HASH_MAX_PENDING:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many sign-ins in progress, try again shortly",
+            headers={"Retry-After": "1"},
+        )
+    _pending += 1
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_get_executor(), fn, *args)
+    finally:
+        _pending -= 1
+
+async def check_password(plain_password, hashed_password):
+    return await _run(verify_password, plain_password, hashed_password)
+
+async def hash_password(password):
+    return await _run(get_password_hash, password)
+
+def pending():
+    return _pending
+
+def start():
+    # Start the workers at startup, before any request traffic, rather than
+    # on the first login
+    if PASSWORD_HASH_WORKERS > 0:
+        executor = _get_executor()
+        for _ in range(PASSWORD_HASH_WORKERS):
+            executor.submit(pow, 1, 1)
+
+def shutdown():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
@@ -0,0 +1,28 @@
+import json
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # optional: falls back to the stdlib encoder
+    orjson = None
+
+def dumps(content):
+    # Compact UTF-8 JSON bytes, same shape FastAPI's JSONResponse produces
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(
+        content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")
+    ).encode("utf-8")
+
+class FastJSONResponse(JSONResponse):
+    """JSON response that encodes its content directly to bytes.
+
+    Returning a Response from a route skips FastAPI's jsonable_encoder pass
+    and response_model validation, so only use this for data that is
+    already plain dicts, lists, strings and numbers, e.g. rows read from
+    SQLite.
+    """
+
+    def render(self, content):
+        return dumps(content)
@@ -0,0 +1,25 @@
+from fastapi import APIRouter, Depends, HTTPException
+from middleware.auth import require_admin
+from sqltrace import sql_stats
+
+router = APIRouter(prefix="/api/admin", tags=["admin"])
+
+SQL_STATS_ORDER = ("total", "mean", "max", "calls")
+
+@router.get("/sql-stats", dependencies=[Depends(require_admin)])
+async def read_sql_stats(limit: int = 20, by: str = "total"):
+    """
+    Worst SQL statements on this worker since start (or the last reset),
+    normalized so calls that differ only in their values add up. Slow ones
+    carry the EXPLAIN QUERY PLAN from their last slow call.
+    """
+    if by not in SQL_STATS_ORDER:
+        raise HTTPException(status_code=400, detail=f"by must be one of: {', '.join(SQL_STATS_ORDER)}")
+    if limit < 1 or limit > 100:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 100")
+    return {**sql_stats.stats(), "top": sql_stats.top(limit, by)}
+
+@router.delete("/sql-stats", dependencies=[Depends(require_admin)])
+async def reset_sql_stats():
+    sql_stats.reset()
+    return {"message": "SQL statistics reset"}
@@ -4,12 +4,13 @@ from pydantic import BaseModel
 from datetime import timedelta
 from middleware.auth import (
     create_access_token,
-    get_password_hash,
-    verify_password,
     get_current_active_user,
+    require_admin,
+    principal_cache,
     ACCESS_TOKEN_EXPIRE_MINUTES
 )
-from database import get_db_connection
+from database import Database, get_db
+from passwords import check_password, hash_password
 import sqlite3
 
 router = APIRouter(prefix="/api/auth", tags=["auth"])
@@ -25,39 +26,30 @@ class Token(BaseModel):
     token_type: str
 
 @router.post("/register", response_model=Token)
-async def register(user: UserCreate):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
+async def register(user: UserCreate, db: Database = Depends(get_db)):
     # Check if user exists
-    cursor.execute("SELECT id FROM users WHERE username = ?", (user.username,))
-    if cursor.fetchone():
-        conn.close()
+    if await db.fetchone("SELECT id FROM users WHERE username = ?", (user.username,)):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Username already registered"
         )
     
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await hash_password(user.password)
     
     # Handle empty email string as None (NULL) to allow multiple users without email
     email_to_save = user.email if user.email else None
 
     try:
-        cursor.execute(
+        await db.execute(
             "INSERT INTO users (username, email, password_hash, role) VALUES (?, ?, ?, ?)",
             (user.username, email_to_save, hashed_password, user.role)
         )
-        conn.commit()
     except sqlite3.IntegrityError:
-        conn.close()
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Email already registered"
         )
     
-    conn.close()
-    
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
         data={"sub": user.username, "role": user.role},
@@ -67,15 +59,10 @@ async def register(user: UserCreate):
     return {"access_token": access_token, "token_type": "bearer"}
 
 @router.post("/login", response_model=Token)
-async def login(form_data: OAuth2PasswordRequestForm = Depends()):
-    conn = get_db_connection()
-    cursor = conn.cursor()
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Database = Depends(get_db)):
+    user = await db.fetchone("SELECT * FROM users WHERE username = ?", (form_data.username,))
     
-    cursor.execute("SELECT * FROM users WHERE username = ?", (form_data.username,))
-    user = cursor.fetchone()
-    conn.close()
-    
-    if not user or not verify_password(form_data.password, user["password_hash"]):
+    if not user or not await check_password(form_data.password, user["password_hash"]):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
@@ -98,3 +85,7 @@ async def read_users_me(current_user: dict = Depends(get_current_active_user)):
         "email": current_user["email"],
         "role": current_user["role"]
     }
+
+@router.get("/cache-stats", dependencies=[Depends(require_admin)])
+async def read_cache_stats():
+    return principal_cache.stats()
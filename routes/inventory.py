@@ -1,8 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from pydantic import BaseModel
 from typing import List, Optional
 from middleware.auth import check_role
-from database import get_db_connection
+from database import Database, get_db
+from routes.kds import broadcast_update
+import bulk
+import stock
 
 router = APIRouter(prefix="/api/inventory", tags=["inventory"])
 
@@ -19,69 +22,62 @@ class InventoryItemUpdate(BaseModel):
     supplier: Optional[str] = None
 
 @router.get("/", dependencies=[Depends(check_role(["admin", "manager"]))])
-async def get_inventory():
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM inventory")
-    items = [dict(row) for row in cursor.fetchall()]
-    conn.close()
-    return items
+async def get_inventory(db: Database = Depends(get_db)):
+    return await db.fetchall("SELECT * FROM inventory")
 
 @router.get("/low-stock", dependencies=[Depends(check_role(["admin", "manager"]))])
-async def get_low_stock():
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM inventory WHERE quantity <= low_stock_threshold")
-    items = [dict(row) for row in cursor.fetchall()]
-    conn.close()
-    return items
+async def get_low_stock(db: Database = Depends(get_db)):
+    # Reads only the idx_inventory_low_stock partial index, not the table
+    return await db.fetchall("SELECT * FROM inventory WHERE quantity <= low_stock_threshold ORDER BY item_name")
 
 @router.post("/", dependencies=[Depends(check_role(["admin", "manager"]))])
-async def add_inventory_item(item: InventoryItemCreate):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute(
-        "INSERT INTO inventory (item_name, quantity, unit, low_stock_threshold, supplier) VALUES (?, ?, ?, ?, ?)",
-        (item.item_name, item.quantity, item.unit, item.low_stock_threshold, item.supplier)
-    )
-    conn.commit()
-    item_id = cursor.lastrowid
-    conn.close()
+async def add_inventory_item(item: InventoryItemCreate, db: Database = Depends(get_db)):
+    item_id, crossing = await db.run(stock.insert_item, item.dict())
+    if crossing:
+        await broadcast_update(crossing)
     
     return {**item.dict(), "id": item_id}
 
+@router.post("/bulk", dependencies=[Depends(check_role(["admin", "manager"]))])
+async def bulk_upsert_inventory(request: Request, upsert: bool = True, db: Database = Depends(get_db)):
+    # JSON array or CSV of InventoryItemCreate rows, matched on item_name;
+    # see bulk.py. Items the import took under (or back over) their
+    # threshold are published like deductions are.
+    result = await bulk.import_rows(
+        request, db, "inventory", "item_name", InventoryItemCreate, upsert,
+        touch="last_updated = CURRENT_TIMESTAMP", watch=stock.watch_crossings
+    )
+    for crossing in result.pop("watched", None) or ():
+        await broadcast_update(crossing)
+    return result
+
 @router.put("/{item_id}", dependencies=[Depends(check_role(["admin", "manager"]))])
-async def update_inventory_item(item_id: int, item: InventoryItemUpdate):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
+async def update_inventory_item(item_id: int, item: InventoryItemUpdate, db: Database = Depends(get_db)):
     update_data = item.dict(exclude_unset=True)
     if not update_data:
-        conn.close()
         return {"message": "No changes provided"}
         
     set_clause = ", ".join([f"{key} = ?" for key in update_data.keys()])
-    values = list(update_data.values())
-    values.append(item_id)
-    
-    cursor.execute(f"UPDATE inventory SET {set_clause}, last_updated = CURRENT_TIMESTAMP WHERE id = ?", values)
-    if cursor.rowcount == 0:
-        conn.close()
+    found, crossing = await db.run(
+        stock.update_item, item_id, f"{set_clause}, last_updated = CURRENT_TIMESTAMP", update_data.values()
+    )
+    if not found:
         raise HTTPException(status_code=404, detail="Item not found")
+    if crossing:
+        await broadcast_update(crossing)
         
-    conn.commit()
-    conn.close()
     return {"message": "Inventory updated"}
 
+def _delete_inventory_item(conn, item_id):
+    # Recipes that used the item go with it
+    conn.execute("DELETE FROM recipes WHERE inventory_item_id = ?", (item_id,))
+    rowcount = conn.execute("DELETE FROM inventory WHERE id = ?", (item_id,)).rowcount
+    conn.commit()
+    return rowcount
+
 @router.delete("/{item_id}", dependencies=[Depends(check_role(["admin"]))])
-async def delete_inventory_item(item_id: int):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM inventory WHERE id = ?", (item_id,))
-    if cursor.rowcount == 0:
-        conn.close()
+async def delete_inventory_item(item_id: int, db: Database = Depends(get_db)):
+    rowcount = await db.run(_delete_inventory_item, item_id)
+    if rowcount == 0:
         raise HTTPException(status_code=404, detail="Item not found")
-    conn.commit()
-    conn.close()
     return {"message": "Item deleted"}
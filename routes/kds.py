@@ -1,33 +1,101 @@
 from fastapi import APIRouter, Depends, Request
 from fastapi.responses import StreamingResponse
-import asyncio
 import json
-from database import get_db_connection
+from typing import Optional
+from events import EventBroker, bus
+from database import Database, get_db, fetch_order_items
+from responses import FastJSONResponse
 
 router = APIRouter(prefix="/api/kds", tags=["kds"])
 
-# Simple in-memory event queue for MVP
-# In production, use Redis or similar
-msg_queue = asyncio.Queue()
+# Fan-out broker: every connected kitchen screen gets every event. Events
+# arrive through the bus, so with EVENT_BUS=sqlite screens connected to any
+# worker see KOT changes made through every other worker.
+broker = EventBroker()
+bus.subscribe("kds", lambda event_id, data: broker.publish(data, id=event_id))
+KEEPALIVE_SECONDS = 15
 
-async def event_generator():
-    while True:
-        # Check for new messages
-        if not msg_queue.empty():
-            msg = await msg_queue.get()
-            yield f"data: {json.dumps(msg)}\n\n"
-        
-        # Keep connection alive
-        await asyncio.sleep(1)
-        yield ": keep-alive\n\n"
+def _snapshot_event_id():
+    # Highest id a client can safely resume from on this worker
+    return max(broker.last_event_id, bus.replay_from)
+
+def _format_event(event):
+    return f"id: {event.id}\ndata: {json.dumps(event.data)}\n\n"
+
+async def event_generator(last_event_id=None):
+    # Subscribe inside the generator so the subscription only exists while
+    # the response is actually streaming
+    resync = last_event_id is not None and (
+        last_event_id < bus.replay_from or not broker.can_replay(last_event_id)
+    )
+    subscriber = broker.subscribe(None if resync else last_event_id)
+    try:
+        # Tell the browser how long to wait before reconnecting
+        yield "retry: 2000\n\n"
+        if resync:
+            # Missed events are gone from the replay buffer; the client has
+            # to reload its full state
+            yield f"id: {_snapshot_event_id()}\ndata: {json.dumps({'type': 'resync'})}\n\n"
+        while True:
+            try:
+                event = await subscriber.get(timeout=KEEPALIVE_SECONDS)
+            except EOFError:
+                # Evicted as a slow consumer; closing makes the browser
+                # reconnect and resume from its Last-Event-ID
+                break
+            if event is None:
+                yield ": keep-alive\n\n"
+                continue
+            yield _format_event(event)
+    finally:
+        broker.unsubscribe(subscriber)
 
 @router.get("/stream")
-async def message_stream(request: Request):
-    return StreamingResponse(event_generator(), media_type="text/event-stream")
+async def message_stream(request: Request, last_event_id: Optional[int] = None):
+    # EventSource sends Last-Event-ID on reconnect; the query parameter lets
+    # a fresh page resume from an id it already knows
+    header = request.headers.get("last-event-id")
+    if header and header.isdigit():
+        last_event_id = int(header)
+    
+    return StreamingResponse(
+        event_generator(last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 # Helper to broadcast updates
 async def broadcast_update(message: dict):
-    await msg_queue.put(message)
+    return await bus.publish("kds", message)
+
+async def publish_kot_event(event_type: str, kot: dict):
+    # kot.created / kot.status_changed / kot.closed, carrying the same KOT
+    # payload as /api/kds/active so screens can apply it in place
+    return await broadcast_update({"type": event_type, "kot": kot})
+
+# LEFT JOIN: a KOT still has to reach the kitchen (and its status updates
+# the screens) after its table has been deleted
+KOT_SELECT = """
+    SELECT k.*, COALESCE(t.table_number, 'Unknown') AS table_number 
+    FROM kot k 
+    JOIN orders o ON k.order_id = o.id 
+    LEFT JOIN tables t ON o.table_id = t.id 
+"""
+
+def attach_kot_items(conn, kots, table="order_items"):
+    # Replace the legacy items blob with the KOT's rows from order_items
+    items_by_kot = fetch_order_items(conn, "kot_id", [kot['id'] for kot in kots], table=table)
+    for kot in kots:
+        kot['items'] = items_by_kot[kot['id']]
+    return kots
+
+def fetch_kots(conn, kot_ids):
+    # Full KDS payloads for the given KOTs, in id order
+    if not kot_ids:
+        return []
+    placeholders = ", ".join("?" * len(kot_ids))
+    cursor = conn.execute(f"{KOT_SELECT} WHERE k.id IN ({placeholders}) ORDER BY k.id", list(kot_ids))
+    return attach_kot_items(conn, [dict(row) for row in cursor.fetchall()])
 
 # Re-export KOT status updates here if we want to trigger broadcasts
 # Or we can just call broadcast_update from the KOT/Orders routes
@@ -35,27 +103,27 @@ async def broadcast_update(message: dict):
 # Actually, let's make a simple polling endpoint for "active" KOTs as a fallback
 # And try to use the stream.
 
-@router.get("/active")
-async def get_active_kots():
-    conn = get_db_connection()
+def _get_active_kots(conn):
     cursor = conn.cursor()
     
     # Get KOTs that are not completed
-    query = """
-        SELECT k.*, t.table_number 
-        FROM kot k 
-        JOIN orders o ON k.order_id = o.id 
-        JOIN tables t ON o.table_id = t.id 
+    query = KOT_SELECT + """
         WHERE k.status IN ('pending', 'preparing', 'ready')
         ORDER BY k.created_at ASC
     """
     
     cursor.execute(query)
-    kots = []
-    for row in cursor.fetchall():
-        kot = dict(row)
-        kot['items'] = json.loads(kot['items'])
-        kots.append(kot)
+    kots = [dict(row) for row in cursor.fetchall()]
+    attach_kot_items(conn, kots)
         
-    conn.close()
     return kots
+
+@router.get("/active")
+async def get_active_kots(db: Database = Depends(get_db)):
+    # Anything published after this id may not be in the snapshot; the
+    # screen subscribes from here and replays the gap
+    last_event_id = _snapshot_event_id()
+    return FastJSONResponse(
+        await db.run(_get_active_kots),
+        headers={"X-Last-Event-ID": str(last_event_id)}
+    )
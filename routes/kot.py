@@ -1,64 +1,105 @@
 from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
 from typing import List, Optional
-import json
 from middleware.auth import check_role
-from database import get_db_connection
+from database import Database, get_db
+import archive
+from pagination import PAGE_SIZE_DEFAULT, check_limit, date_range_clause, keyset_clause, page_response, parse_fields
+from routes.kds import attach_kot_items, fetch_kots, publish_kot_event
 
 router = APIRouter(prefix="/api/kot", tags=["kot"])
 
 class KOTUpdate(BaseModel):
     status: str # pending, preparing, ready, completed
 
-@router.get("/")
-async def get_kots(status: Optional[str] = None):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    query = "SELECT k.*, t.table_number FROM kot k JOIN orders o ON k.order_id = o.id JOIN tables t ON o.table_id = t.id WHERE 1=1"
+KOT_FIELDS = ("id", "order_id", "items", "status", "kitchen_station", "created_at", "started_at", "completed_at", "table_number")
+
+def _get_kots(conn, status, start, end, cursor, limit, fields):
+    # Oldest first, one page at a time; see pagination.py
+    # Same column handling as orders._get_orders
+    selected = list(fields or KOT_FIELDS)
+    selected += [field for field in ("id", "created_at") if field not in selected]
+    columns = ", ".join(
+        "NULL AS items" if field == "items"
+        else "t.table_number" if field == "table_number"
+        else f"k.{field}"
+        for field in selected
+    )
+    # CROSS JOIN keeps kot as the outer loop in both halves: every filter is
+    # on k, and the archive half otherwise tends to start from the small
+    # tables table and sort the whole archive
+    query = (
+        f"SELECT {columns} FROM {{db}}.kot k CROSS JOIN {{db}}.orders o ON k.order_id = o.id "
+        "CROSS JOIN tables t ON o.table_id = t.id WHERE 1=1"
+    )
     params = []
     
     if status:
         query += " AND k.status = ?"
         params.append(status)
+    
+    clause, clause_params = date_range_clause("k.created_at", start, end)
+    query += clause
+    params.extend(clause_params)
+    clause, clause_params = keyset_clause("k.", cursor, descending=False)
+    query += clause
+    params.extend(clause_params)
         
-    query += " ORDER BY k.created_at ASC"
+    # Archived tickets too: the join runs once per database and SQLite
+    # merges the two ordered halves (see archive.py)
+    query, params = archive.spanning(query, params, order_id="k.order_id")
+    query = f"SELECT * FROM ({query}) ORDER BY created_at ASC, id ASC LIMIT ?"
+    params.append(limit + 1)
     
-    cursor.execute(query, params)
-    kots = []
-    for row in cursor.fetchall():
-        kot = dict(row)
-        kot['items'] = json.loads(kot['items'])
-        kots.append(kot)
+    kots = [dict(row) for row in conn.execute(query, params)]
+    if fields is None or "items" in fields:
+        attach_kot_items(conn, kots[:limit], table="all_order_items")
         
-    conn.close()
     return kots
 
-@router.get("/{kot_id}")
-async def get_kot(kot_id: int):
-    conn = get_db_connection()
+@router.get("/")
+async def get_kots(
+    status: Optional[str] = None,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = PAGE_SIZE_DEFAULT,
+    fields: Optional[str] = None,
+    db: Database = Depends(get_db)
+):
+    # Pass the X-Next-Cursor response header back as ?cursor= for the next page
+    check_limit(limit)
+    fields = parse_fields(fields, KOT_FIELDS)
+    kots = await db.run(_get_kots, status, start, end, cursor, limit, fields)
+    return page_response(kots, limit, fields)
+
+def _get_kot(conn, kot_id):
     cursor = conn.cursor()
-    cursor.execute("SELECT * FROM kot WHERE id = ?", (kot_id,))
+    cursor.execute("SELECT * FROM all_kot WHERE id = ?", (kot_id,))
     kot = cursor.fetchone()
-    conn.close()
     
     if not kot:
         raise HTTPException(status_code=404, detail="KOT not found")
         
-    kot_dict = dict(kot)
-    kot_dict['items'] = json.loads(kot_dict['items'])
-    return kot_dict
+    return attach_kot_items(conn, [dict(kot)], table="all_order_items")[0]
 
-@router.patch("/{kot_id}/status", dependencies=[Depends(check_role(["admin", "manager", "kitchen"]))])
-async def update_kot_status(kot_id: int, status_update: KOTUpdate):
-    conn = get_db_connection()
+@router.get("/{kot_id}")
+async def get_kot(kot_id: int, db: Database = Depends(get_db)):
+    return await db.run(_get_kot, kot_id)
+
+def _update_kot_status(conn, kot_id, status_update):
     cursor = conn.cursor()
     
     cursor.execute("UPDATE kot SET status = ? WHERE id = ?", (status_update.status, kot_id))
     if cursor.rowcount == 0:
-        conn.close()
         raise HTTPException(status_code=404, detail="KOT not found")
+    cursor.execute("UPDATE order_items SET status = ? WHERE kot_id = ?", (status_update.status, kot_id))
         
     conn.commit()
-    conn.close()
+    return fetch_kots(conn, [kot_id])[0]
+
+@router.patch("/{kot_id}/status", dependencies=[Depends(check_role(["admin", "manager", "kitchen"]))])
+async def update_kot_status(kot_id: int, status_update: KOTUpdate, db: Database = Depends(get_db)):
+    kot = await db.write(_update_kot_status, kot_id, status_update)
+    await publish_kot_event("kot.closed" if kot['status'] == 'completed' else "kot.status_changed", kot)
     return {"message": f"KOT status updated to {status_update.status}"}
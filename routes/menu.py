@@ -1,12 +1,54 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
 from pydantic import BaseModel
 from typing import List, Optional
 from middleware.auth import check_role, get_current_active_user
-from database import get_db_connection
+from database import Database, get_db
+from events import bus
+from middleware.compression import base_etag
+from responses import dumps
+import bulk
+import hashlib
 import sqlite3
 
 router = APIRouter(prefix="/api/menu", tags=["menu"])
 
+# In-memory snapshot of menu_items. Every write in this module rebuilds it
+# and tells the other workers to drop theirs, so reads never hit SQLite.
+# Responses are serialized once per (category, available_only) filter for
+# the categories on the menu and carry a strong ETag (hash of the body,
+# identical across workers) so tablets revalidate with If-None-Match and
+# usually get a 304.
+_menu = {"generation": 0, "items": None, "by_id": None, "bodies": {}}
+
+def _drop_menu(event_id=None, data=None):
+    _menu["generation"] += 1
+    _menu["items"] = _menu["by_id"] = None
+    _menu["bodies"] = {}
+
+bus.subscribe("cache.menu", _drop_menu)
+
+async def _menu_items(db):
+    if _menu["items"] is None:
+        generation = _menu["generation"]
+        items = await db.fetchall("SELECT * FROM menu_items ORDER BY id")
+        # A write that landed while we were reading has already dropped the
+        # snapshot again; use what we read but do not keep it
+        if generation != _menu["generation"]:
+            return items
+        _menu["items"] = items
+        _menu["by_id"] = {item["id"]: item for item in items}
+    return _menu["items"]
+
+async def refresh_menu(db):
+    # Call after every committed menu_items change
+    _drop_menu()
+    await bus.publish("cache.menu", {})
+    await _menu_items(db)
+
+def _serialize(items):
+    body = dumps(items)
+    return body, '"%s"' % hashlib.sha256(body).hexdigest()[:32]
+
 class MenuItemCreate(BaseModel):
     name: str
     description: Optional[str] = None
@@ -23,67 +65,73 @@ class MenuItemUpdate(BaseModel):
     image_url: Optional[str] = None
     available: Optional[bool] = None
 
+class RecipeIngredient(BaseModel):
+    inventory_item_id: int
+    quantity: float
+
 @router.get("/", response_model=List[dict])
-async def get_menu_items(category: Optional[str] = None, available_only: bool = False):
-    conn = get_db_connection()
-    cursor = conn.cursor()
+async def get_menu_items(request: Request, category: Optional[str] = None, available_only: bool = False, db: Database = Depends(get_db)):
+    items = await _menu_items(db)
+    key = (category, available_only)
+    cached = _menu["bodies"].get(key) if _menu["items"] is items else None
+    if cached is None:
+        if category:
+            items = [item for item in items if item["category"] == category]
+        # Only categories on the menu are kept, so arbitrary ?category=
+        # values cannot grow the cache; anything else is served uncached
+        keep = _menu["items"] is not None and (not category or items)
+        if available_only:
+            items = [item for item in items if item["available"]]
+        cached = _serialize(items)
+        if keep:
+            _menu["bodies"][key] = cached
+    body, etag = cached
     
-    query = "SELECT * FROM menu_items WHERE 1=1"
-    params = []
-    
-    if category:
-        query += " AND category = ?"
-        params.append(category)
-        
-    if available_only:
-        query += " AND available = 1"
-        
-    cursor.execute(query, params)
-    items = [dict(row) for row in cursor.fetchall()]
-    conn.close()
-    return items
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag in [base_etag(tag.strip()) for tag in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+@router.post("/bulk", dependencies=[Depends(check_role(["admin", "manager"]))])
+async def bulk_upsert_menu_items(request: Request, upsert: bool = True, db: Database = Depends(get_db)):
+    # JSON array or CSV of MenuItemCreate rows, matched on name; see bulk.py
+    result = await bulk.import_rows(request, db, "menu_items", "name", MenuItemCreate, upsert)
+    if result["created"] or result["updated"]:
+        await refresh_menu(db)
+    return result
 
 @router.get("/{item_id}")
-async def get_menu_item(item_id: int):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM menu_items WHERE id = ?", (item_id,))
-    item = cursor.fetchone()
-    conn.close()
+async def get_menu_item(item_id: int, db: Database = Depends(get_db)):
+    await _menu_items(db)
+    item = (_menu["by_id"] or {}).get(item_id)
+    if item is None:
+        # Snapshot was dropped mid-read; fall back to the table
+        item = await db.fetchone("SELECT * FROM menu_items WHERE id = ?", (item_id,))
     
     if not item:
         raise HTTPException(status_code=404, detail="Menu item not found")
-    return dict(item)
+    return item
 
 @router.post("/", dependencies=[Depends(check_role(["admin", "manager"]))])
-async def create_menu_item(item: MenuItemCreate):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute(
+async def create_menu_item(item: MenuItemCreate, db: Database = Depends(get_db)):
+    item_id, _ = await db.execute(
         "INSERT INTO menu_items (name, description, category, price, image_url, available) VALUES (?, ?, ?, ?, ?, ?)",
         (item.name, item.description, item.category, item.price, item.image_url, item.available)
     )
-    conn.commit()
-    item_id = cursor.lastrowid
-    conn.close()
+    await refresh_menu(db)
     
     return {**item.dict(), "id": item_id}
 
-@router.put("/{item_id}", dependencies=[Depends(check_role(["admin", "manager"]))])
-async def update_menu_item(item_id: int, item: MenuItemUpdate):
-    conn = get_db_connection()
+def _update_menu_item(conn, item_id, item):
     cursor = conn.cursor()
     
     # Check if exists
     cursor.execute("SELECT id FROM menu_items WHERE id = ?", (item_id,))
     if not cursor.fetchone():
-        conn.close()
         raise HTTPException(status_code=404, detail="Menu item not found")
     
     update_data = item.dict(exclude_unset=True)
     if not update_data:
-        conn.close()
         return {"message": "No changes provided"}
         
     set_clause = ", ".join([f"{key} = ?" for key in update_data.keys()])
@@ -92,34 +140,80 @@ async def update_menu_item(item_id: int, item: MenuItemUpdate):
     
     cursor.execute(f"UPDATE menu_items SET {set_clause} WHERE id = ?", values)
     conn.commit()
-    conn.close()
     
     return {"message": "Menu item updated successfully"}
 
+@router.put("/{item_id}", dependencies=[Depends(check_role(["admin", "manager"]))])
+async def update_menu_item(item_id: int, item: MenuItemUpdate, db: Database = Depends(get_db)):
+    result = await db.run(_update_menu_item, item_id, item)
+    await refresh_menu(db)
+    return result
+
+def _delete_menu_item(conn, item_id):
+    conn.execute("DELETE FROM recipes WHERE menu_item_id = ?", (item_id,))
+    rowcount = conn.execute("DELETE FROM menu_items WHERE id = ?", (item_id,)).rowcount
+    conn.commit()
+    return rowcount
+
 @router.delete("/{item_id}", dependencies=[Depends(check_role(["admin"]))])
-async def delete_menu_item(item_id: int):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute("DELETE FROM menu_items WHERE id = ?", (item_id,))
-    if cursor.rowcount == 0:
-        conn.close()
+async def delete_menu_item(item_id: int, db: Database = Depends(get_db)):
+    rowcount = await db.run(_delete_menu_item, item_id)
+    if rowcount == 0:
         raise HTTPException(status_code=404, detail="Menu item not found")
+    await refresh_menu(db)
         
-    conn.commit()
-    conn.close()
     return {"message": "Menu item deleted"}
 
 @router.patch("/{item_id}/availability", dependencies=[Depends(check_role(["admin", "manager"]))])
-async def toggle_availability(item_id: int, available: bool):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute("UPDATE menu_items SET available = ? WHERE id = ?", (available, item_id))
-    if cursor.rowcount == 0:
-        conn.close()
+async def toggle_availability(item_id: int, available: bool, db: Database = Depends(get_db)):
+    _, rowcount = await db.execute("UPDATE menu_items SET available = ? WHERE id = ?", (available, item_id))
+    if rowcount == 0:
         raise HTTPException(status_code=404, detail="Menu item not found")
+    await refresh_menu(db)
         
-    conn.commit()
-    conn.close()
     return {"message": f"Availability set to {available}"}
+
+RECIPE_SELECT = """
+    SELECT r.inventory_item_id, i.item_name, r.quantity, i.unit
+    FROM recipes r
+    JOIN inventory i ON r.inventory_item_id = i.id
+    WHERE r.menu_item_id = ?
+    ORDER BY i.item_name
+"""
+
+@router.get("/{item_id}/recipe", dependencies=[Depends(check_role(["admin", "manager"]))])
+async def get_recipe(item_id: int, db: Database = Depends(get_db)):
+    if not await db.fetchone("SELECT id FROM menu_items WHERE id = ?", (item_id,)):
+        raise HTTPException(status_code=404, detail="Menu item not found")
+    return await db.fetchall(RECIPE_SELECT, (item_id,))
+
+def _set_recipe(conn, item_id, ingredients):
+    if not conn.execute("SELECT id FROM menu_items WHERE id = ?", (item_id,)).fetchone():
+        raise HTTPException(status_code=404, detail="Menu item not found")
+
+    inventory_ids = [ingredient.inventory_item_id for ingredient in ingredients]
+    if len(set(inventory_ids)) != len(inventory_ids):
+        raise HTTPException(status_code=400, detail="Each inventory item may appear only once")
+    if any(ingredient.quantity <= 0 for ingredient in ingredients):
+        raise HTTPException(status_code=400, detail="Recipe quantities must be positive")
+    if inventory_ids:
+        placeholders = ", ".join("?" * len(inventory_ids))
+        known = {row["id"] for row in conn.execute(f"SELECT id FROM inventory WHERE id IN ({placeholders})", inventory_ids)}
+        missing = [str(i) for i in inventory_ids if i not in known]
+        if missing:
+            raise HTTPException(status_code=400, detail=f"Unknown inventory items: {', '.join(missing)}")
+
+    # Replace the whole recipe at once
+    conn.execute("DELETE FROM recipes WHERE menu_item_id = ?", (item_id,))
+    conn.executemany(
+        "INSERT INTO recipes (menu_item_id, inventory_item_id, quantity) VALUES (?, ?, ?)",
+        [(item_id, ingredient.inventory_item_id, ingredient.quantity) for ingredient in ingredients]
+    )
+    conn.commit()
+    return [dict(row) for row in conn.execute(RECIPE_SELECT, (item_id,))]
+
+@router.put("/{item_id}/recipe", dependencies=[Depends(check_role(["admin", "manager"]))])
+async def set_recipe(item_id: int, ingredients: List[RecipeIngredient], db: Database = Depends(get_db)):
+    # Amount of each inventory item used per unit sold; deducted from stock
+    # whenever a KOT for this item is created (see stock.py)
+    return await db.run(_set_recipe, item_id, ingredients)
@@ -3,7 +3,12 @@ from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
 import json
 from middleware.auth import check_role, get_current_active_user
-from database import get_db_connection
+from database import Database, get_db, fetch_order_items, insert_order_items
+from pagination import PAGE_SIZE_DEFAULT, check_limit, date_range_clause, keyset_clause, page_response, parse_fields
+import sales_rollup
+import stock
+from routes.sales import invalidate_sales_cache
+from routes.kds import broadcast_update, fetch_kots, publish_kot_event
 
 router = APIRouter(prefix="/api/orders", tags=["orders"])
 
@@ -22,12 +27,18 @@ class OrderCreate(BaseModel):
 class OrderUpdate(BaseModel):
     status: str # pending, preparing, ready, completed, paid
 
-@router.get("/")
-async def get_orders(status: Optional[str] = None, table_id: Optional[int] = None):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    query = "SELECT * FROM orders WHERE 1=1"
+ORDER_FIELDS = ("id", "table_id", "items", "total_amount", "status", "created_by", "created_at", "completed_at")
+
+def _get_orders(conn, status, table_id, start, end, cursor, limit, fields):
+    # Newest first, one page at a time; see pagination.py
+    # items comes from order_items; NULL keeps its place in the key order
+    # without reading the legacy JSON blob. id and created_at are always
+    # read because the cursor needs them.
+    selected = list(fields or ORDER_FIELDS)
+    selected += [field for field in ("id", "created_at") if field not in selected]
+    columns = ", ".join("NULL AS items" if field == "items" else field for field in selected)
+    # History includes archived orders (see archive.py)
+    query = f"SELECT {columns} FROM all_orders WHERE 1=1"
     params = []
     
     if status:
@@ -37,60 +48,78 @@ async def get_orders(status: Optional[str] = None, table_id: Optional[int] = Non
     if table_id:
         query += " AND table_id = ?"
         params.append(table_id)
+    
+    clause, clause_params = date_range_clause("created_at", start, end)
+    query += clause
+    params.extend(clause_params)
+    clause, clause_params = keyset_clause("", cursor, descending=True)
+    query += clause
+    params.extend(clause_params)
         
-    query += " ORDER BY created_at DESC"
-    
-    cursor.execute(query, params)
-    orders = []
-    for row in cursor.fetchall():
-        order = dict(row)
-        order['items'] = json.loads(order['items'])
-        orders.append(order)
+    query += " ORDER BY created_at DESC, id DESC LIMIT ?"
+    params.append(limit + 1)
+    
+    orders = [dict(row) for row in conn.execute(query, params)]
+    
+    if fields is None or "items" in fields:
+        items_by_order = fetch_order_items(
+            conn, "order_id", [order['id'] for order in orders[:limit]], table="all_order_items"
+        )
+        for order in orders[:limit]:
+            order['items'] = items_by_order[order['id']]
         
-    conn.close()
     return orders
 
-@router.get("/{order_id}")
-async def get_order(order_id: int):
-    conn = get_db_connection()
+@router.get("/")
+async def get_orders(
+    status: Optional[str] = None,
+    table_id: Optional[int] = None,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = PAGE_SIZE_DEFAULT,
+    fields: Optional[str] = None,
+    db: Database = Depends(get_db)
+):
+    # Pass the X-Next-Cursor response header back as ?cursor= for the next page
+    check_limit(limit)
+    fields = parse_fields(fields, ORDER_FIELDS)
+    orders = await db.run(_get_orders, status, table_id, start, end, cursor, limit, fields)
+    return page_response(orders, limit, fields)
+
+def _get_order(conn, order_id):
     cursor = conn.cursor()
-    cursor.execute("SELECT * FROM orders WHERE id = ?", (order_id,))
+    # Lines come from order_items below, never from the legacy JSON column
+    columns = ", ".join("NULL AS items" if field == "items" else field for field in ORDER_FIELDS)
+    cursor.execute(f"SELECT {columns} FROM all_orders WHERE id = ?", (order_id,))
     order = cursor.fetchone()
     
     if not order:
-        conn.close()
         raise HTTPException(status_code=404, detail="Order not found")
         
     order_dict = dict(order)
-    order_dict['items'] = json.loads(order_dict['items'])
-    
-    # Fetch KOTs to get item-level status
-    cursor.execute("SELECT items, status, created_at FROM kot WHERE order_id = ?", (order_id,))
-    kots = cursor.fetchall()
-    
-    detailed_items = []
-    for kot in kots:
-        kot_items = json.loads(kot['items'])
-        kot_status = kot['status']
-        for item in kot_items:
-            item['status'] = kot_status
-            detailed_items.append(item)
-            
+    
+    # Lines carry their KOT's status, so item-level status needs no KOT lookup
+    detailed_items = fetch_order_items(conn, "order_id", [order_id], with_status=True, table="all_order_items")[order_id]
+    order_dict['items'] = [
+        {key: value for key, value in item.items() if key != 'status'}
+        for item in detailed_items
+    ]
     order_dict['detailed_items'] = detailed_items
     
-    conn.close()
     return order_dict
 
-@router.post("/", dependencies=[Depends(check_role(["admin", "manager", "staff"]))])
-async def create_order(order: OrderCreate, current_user: dict = Depends(get_current_active_user)):
-    conn = get_db_connection()
+@router.get("/{order_id}")
+async def get_order(order_id: int, db: Database = Depends(get_db)):
+    return await db.run(_get_order, order_id)
+
+def _create_order(conn, order, current_user):
     cursor = conn.cursor()
     
     # Verify table exists
     cursor.execute("SELECT id, current_order_id FROM tables WHERE id = ?", (order.table_id,))
     table = cursor.fetchone()
     if not table:
-        conn.close()
         raise HTTPException(status_code=404, detail="Table not found")
     
     # Check if table has an existing active order (not paid)
@@ -98,26 +127,19 @@ async def create_order(order: OrderCreate, current_user: dict = Depends(get_curr
     existing_order = None
     
     if existing_order_id:
-        cursor.execute("SELECT * FROM orders WHERE id = ? AND status != 'paid'", (existing_order_id,))
+        cursor.execute("SELECT id FROM orders WHERE id = ? AND status != 'paid'", (existing_order_id,))
         existing_order = cursor.fetchone()
     
     if existing_order:
-        # Append items to existing order
-        existing_items = json.loads(existing_order['items'])
+        # Append items to existing order. Only the new lines are written:
+        # order_items holds every round, so the order row just gets its
+        # total bumped and never re-reads or rewrites earlier rounds.
         new_items = [item.dict() for item in order.items]
-        
-        # Merge items
-        combined_items = existing_items + new_items
-        combined_items_json = json.dumps(combined_items)
-        
-        # Update total amount
-        new_total = existing_order['total_amount'] + order.total_amount
-        
-        # Update existing order
-        cursor.execute(
-            "UPDATE orders SET items = ?, total_amount = ? WHERE id = ?",
-            (combined_items_json, new_total, existing_order_id)
-        )
+        # RETURNING can hand back whole amounts as int; the message shows a float
+        new_total = float(conn.execute(
+            "UPDATE orders SET total_amount = total_amount + ? WHERE id = ? RETURNING total_amount",
+            (order.total_amount, existing_order_id)
+        ).fetchall()[0]['total_amount'])
         
         # Create additional KOT for the new items
         new_items_json = json.dumps(new_items)
@@ -125,18 +147,21 @@ async def create_order(order: OrderCreate, current_user: dict = Depends(get_curr
             "INSERT INTO kot (order_id, items, status) VALUES (?, ?, 'pending')",
             (existing_order_id, new_items_json)
         )
+        kot_id = cursor.lastrowid
+        insert_order_items(conn, existing_order_id, kot_id, new_items)
+        crossings = stock.deduct_for_items(conn, new_items)
         
         conn.commit()
-        conn.close()
         
         return {
             "id": existing_order_id, 
             "message": f"Items added to existing order. New total: {new_total}",
             "appended": True
-        }
+        }, fetch_kots(conn, [kot_id])[0], crossings
     else:
         # Create new order as usual
-        items_json = json.dumps([item.dict() for item in order.items])
+        new_items = [item.dict() for item in order.items]
+        items_json = json.dumps(new_items)
         
         # Create Order
         cursor.execute(
@@ -150,6 +175,10 @@ async def create_order(order: OrderCreate, current_user: dict = Depends(get_curr
             "INSERT INTO kot (order_id, items, status) VALUES (?, ?, 'pending')",
             (order_id, items_json)
         )
+        kot_id = cursor.lastrowid
+        insert_order_items(conn, order_id, kot_id, new_items)
+        # Take the ticket's ingredients out of stock in the same transaction
+        crossings = stock.deduct_for_items(conn, new_items)
         
         # Update Table Status
         cursor.execute(
@@ -158,28 +187,39 @@ async def create_order(order: OrderCreate, current_user: dict = Depends(get_curr
         )
         
         conn.commit()
-        conn.close()
         
-        return {"id": order_id, "message": "Order created and KOT generated", "appended": False}
+        return {"id": order_id, "message": "Order created and KOT generated", "appended": False}, fetch_kots(conn, [kot_id])[0], crossings
 
+@router.post("/", dependencies=[Depends(check_role(["admin", "manager", "staff"]))])
+async def create_order(order: OrderCreate, current_user: dict = Depends(get_current_active_user), db: Database = Depends(get_db)):
+    result, kot, crossings = await db.write(_create_order, order, current_user)
+    await publish_kot_event("kot.created", kot)
+    # Only items that just went under (or back over) their threshold
+    for crossing in crossings:
+        await broadcast_update(crossing)
+    return result
 
-@router.patch("/{order_id}/status", dependencies=[Depends(check_role(["admin", "manager", "staff"]))])
-async def update_order_status(order_id: int, status_update: OrderUpdate):
-    conn = get_db_connection()
+def _update_order_status(conn, order_id, status_update):
     cursor = conn.cursor()
     
     # Get current order details
-    cursor.execute("SELECT * FROM orders WHERE id = ?", (order_id,))
+    cursor.execute("SELECT id, table_id, status FROM orders WHERE id = ?", (order_id,))
     order = cursor.fetchone()
     
     if not order:
-        conn.close()
         raise HTTPException(status_code=404, detail="Order not found")
     
     # Update order status
     cursor.execute("UPDATE orders SET status = ? WHERE id = ?", (status_update.status, order_id))
+    
+    # Keep the sales rollups in step, in the same transaction
+    if status_update.status == 'paid' and order['status'] != 'paid':
+        sales_rollup.record_paid_order(conn, order_id)
+    elif order['status'] == 'paid' and status_update.status != 'paid':
+        sales_rollup.record_paid_order(conn, order_id, sign=-1)
         
     # If order is marked as 'paid', also update related entities
+    closed_kot_ids = []
     if status_update.status == 'paid':
         table_id = order['table_id']
         
@@ -190,17 +230,30 @@ async def update_order_status(order_id: int, status_update: OrderUpdate):
         )
         
         # Update KOT status to completed
+        cursor.execute("SELECT id FROM kot WHERE order_id = ? AND status != 'completed'", (order_id,))
+        closed_kot_ids = [row['id'] for row in cursor.fetchall()]
         cursor.execute(
             "UPDATE kot SET status = 'completed' WHERE order_id = ? AND status != 'completed'",
             (order_id,)
         )
+        cursor.execute(
+            "UPDATE order_items SET status = 'completed' WHERE order_id = ? AND status != 'completed'",
+            (order_id,)
+        )
             
     conn.commit()
-    conn.close()
     
     message = f"Order status updated to {status_update.status}"
     if status_update.status == 'paid':
         message += " and table freed"
     
-    return {"message": message}
+    return {"message": message}, fetch_kots(conn, closed_kot_ids)
 
+@router.patch("/{order_id}/status", dependencies=[Depends(check_role(["admin", "manager", "staff"]))])
+async def update_order_status(order_id: int, status_update: OrderUpdate, db: Database = Depends(get_db)):
+    result, closed_kots = await db.write(_update_order_status, order_id, status_update)
+    # Rollups may have changed (paid, or moved back out of paid)
+    await invalidate_sales_cache()
+    for kot in closed_kots:
+        await publish_kot_event("kot.closed", kot)
+    return result
@@ -1,18 +1,20 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from fastapi.responses import StreamingResponse
-from typing import List, Dict, Any
-import json
+from typing import List, Dict, Any, Optional
 import io
 import csv
+import zlib
 from datetime import datetime, timedelta
 from middleware.auth import check_role
-from database import get_db_connection
+from middleware.compression import accepted_encodings
+from database import Database, get_db
+import archive
+from cache import TTLCache
+from events import bus
 
 router = APIRouter(prefix="/api/sales", tags=["sales"])
 
-@router.get("/stats", dependencies=[Depends(check_role(["admin", "manager"]))])
-async def get_sales_stats():
-    conn = get_db_connection()
+def _get_sales_stats(conn):
     cursor = conn.cursor()
     
     # Get today's start
@@ -20,74 +22,429 @@ async def get_sales_stats():
     week_start = today - timedelta(days=today.weekday())
     month_start = today.replace(day=1)
     
-    stats = {
-        "today": 0.0,
-        "week": 0.0,
-        "month": 0.0,
-        "total_orders_today": 0
+    # At most ~37 rollup rows cover the month and the week, which can
+    # start in the previous month
+    cursor.execute(
+        """
+        SELECT
+            COALESCE(SUM(CASE WHEN day >= :today THEN revenue END), 0) AS today,
+            COALESCE(SUM(CASE WHEN day >= :week THEN revenue END), 0) AS week,
+            COALESCE(SUM(CASE WHEN day >= :month THEN revenue END), 0) AS month,
+            COALESCE(SUM(CASE WHEN day >= :today THEN order_count END), 0) AS total_orders_today
+        FROM sales_daily
+        WHERE day >= :since
+        """,
+        {
+            "today": today.strftime('%Y-%m-%d'),
+            "week": week_start.strftime('%Y-%m-%d'),
+            "month": month_start.strftime('%Y-%m-%d'),
+            "since": min(week_start, month_start).strftime('%Y-%m-%d'),
+        }
+    )
+    row = cursor.fetchone()
+    
+    return {
+        "today": float(row['today']),
+        "week": float(row['week']),
+        "month": float(row['month']),
+        "total_orders_today": row['total_orders_today']
     }
+
+@router.get("/stats", dependencies=[Depends(check_role(["admin", "manager"]))])
+async def get_sales_stats(db: Database = Depends(get_db)):
+    return await db.run(_get_sales_stats)
+
+def _parse_date(value, name):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d')
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid {name} date. Use YYYY-MM-DD")
+
+# Top items per (window, ranking, limit). Paying an order invalidates it in
+# every worker through the event bus; the TTL is a backstop.
+top_items_cache = TTLCache(maxsize=64, ttl=60)
+TOP_ITEMS_WINDOWS = {"today": 0, "7d": 6, "30d": 29}
+bus.subscribe("cache.sales", lambda event_id, data: top_items_cache.invalidate())
+
+async def invalidate_sales_cache():
+    # Drop our own copy right away so this worker reads its own writes
+    top_items_cache.invalidate()
+    await bus.publish("cache.sales", {})
+
+def _top_items_range(window, start, end):
+    # Inclusive (first_day, last_day) of the window; None means all time
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    if window == "all":
+        return None, None
+    if window in TOP_ITEMS_WINDOWS:
+        first_day = today - timedelta(days=TOP_ITEMS_WINDOWS[window])
+        return first_day.strftime('%Y-%m-%d'), today.strftime('%Y-%m-%d')
+    if window == "custom":
+        if not start:
+            raise HTTPException(status_code=400, detail="start is required for a custom window")
+        first_day = _parse_date(start, "start")
+        last_day = _parse_date(end, "end") if end else today
+        if first_day > last_day:
+            raise HTTPException(status_code=400, detail="start must not be after end")
+        return first_day.strftime('%Y-%m-%d'), last_day.strftime('%Y-%m-%d')
+    raise HTTPException(
+        status_code=400,
+        detail=f"window must be one of: all, {', '.join(TOP_ITEMS_WINDOWS)}, custom"
+    )
+
+def _get_top_items(conn, first_day, last_day, by, limit):
+    cursor = conn.cursor()
     
-    # Fetch all completed/paid orders
-    # Assuming 'paid' is the final status for revenue
-    cursor.execute("SELECT total_amount, created_at FROM orders WHERE status = 'paid'")
-    rows = cursor.fetchall()
-    
-    for row in rows:
-        amount = row['total_amount']
-        created_at = datetime.strptime(row['created_at'], '%Y-%m-%d %H:%M:%S')
-        
-        if created_at >= today:
-            stats["today"] += amount
-            stats["total_orders_today"] += 1
-            
-        if created_at >= week_start:
-            stats["week"] += amount
-            
-        if created_at >= month_start:
-            stats["month"] += amount
-            
-    conn.close()
-    return stats
+    query = "SELECT name, SUM(quantity) AS quantity, SUM(revenue) AS revenue FROM sales_item_daily"
+    params = []
+    if first_day:
+        query += " WHERE day >= ? AND day <= ?"
+        params += [first_day, last_day]
+    
+    # SQLite keeps only the best `limit` groups while sorting (ORDER BY ...
+    # LIMIT), so nothing but the answer is materialized
+    query += f" GROUP BY name HAVING SUM(quantity) > 0 ORDER BY {by} DESC, name LIMIT ?"
+    params.append(limit)
+    
+    cursor.execute(query, params)
+    return [
+        {"name": row['name'], "quantity": row['quantity'], "revenue": round(row['revenue'], 2)}
+        for row in cursor.fetchall()
+    ]
 
 @router.get("/top-items", dependencies=[Depends(check_role(["admin", "manager"]))])
-async def get_top_items(limit: int = 5):
-    conn = get_db_connection()
-    cursor = conn.cursor()
+async def get_top_items(
+    limit: int = 5,
+    window: str = "all",
+    by: str = "quantity",
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    db: Database = Depends(get_db)
+):
+    """
+    Best sellers of paid orders ranked by quantity or revenue over a window:
+    all (default), today, 7d, 30d or custom (start/end, YYYY-MM-DD).
+    """
+    if by not in ("quantity", "revenue"):
+        raise HTTPException(status_code=400, detail="by must be quantity or revenue")
+    if limit < 1 or limit > 100:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 100")
+    first_day, last_day = _top_items_range(window, start, end)
+    
+    key = (first_day, last_day, by, limit)
+    cached = top_items_cache.get(key)
+    if cached is not None:
+        return cached
     
-    # Fetch all completed/paid orders
-    cursor.execute("SELECT items FROM orders WHERE status IN ('paid', 'completed')")
-    rows = cursor.fetchall()
-    
-    item_counts = {}
-    
-    for row in rows:
-        items = json.loads(row['items'])
-        for item in items:
-            name = item['name']
-            quantity = item['quantity']
-            if name in item_counts:
-                item_counts[name] += quantity
-            else:
-                item_counts[name] = quantity
-                
-    # Sort by quantity desc
-    sorted_items = sorted(item_counts.items(), key=lambda x: x[1], reverse=True)
-    
-    # Format for response
-    top_items = [{"name": name, "quantity": quantity} for name, quantity in sorted_items[:limit]]
-    
-    conn.close()
+    version = top_items_cache.version
+    top_items = await db.run(_get_top_items, first_day, last_day, by, limit)
+    top_items_cache.set(key, top_items, version=version)
     return top_items
 
+# Analytics dimensions as SQL over the daily/hourly rollups (column `day`,
+# plus `hour`, `table_id` or `category` depending on the table) and over raw
+# paid orders (o = orders, t = tables, mi = menu_items).
+ROLLUP_DIMENSIONS = {
+    "hour": "hour",
+    "weekday": "CAST(strftime('%w', day) AS INTEGER)", # 0 = Sunday
+    "day": "day",
+    "week": "strftime('%Y-W%W', day)",
+    "month": "strftime('%Y-%m', day)",
+    "table": "COALESCE(t.table_number, 'Unknown')",
+    "category": "category",
+}
+ORDER_DIMENSIONS = {
+    "hour": "CAST(strftime('%H', o.created_at) AS INTEGER)",
+    "weekday": "CAST(strftime('%w', o.created_at) AS INTEGER)",
+    "day": "date(o.created_at)",
+    "week": "strftime('%Y-W%W', o.created_at)",
+    "month": "strftime('%Y-%m', o.created_at)",
+    "table": "COALESCE(t.table_number, 'Unknown')",
+    "category": "COALESCE(mi.category, 'Uncategorized')",
+}
+# Rollup tables in order of preference, with the buckets each can answer
+ANALYTICS_ROLLUPS = [
+    (
+        {"hour", "weekday", "day", "week", "month"},
+        "sales_hourly",
+        "SUM(revenue) AS revenue, SUM(order_count) AS orders",
+    ),
+    (
+        {"weekday", "day", "week", "month", "table"},
+        "sales_table_daily r LEFT JOIN tables t ON t.id = r.table_id",
+        "SUM(revenue) AS revenue, SUM(order_count) AS orders",
+    ),
+    (
+        {"weekday", "day", "week", "month", "category"},
+        "sales_category_daily",
+        "SUM(revenue) AS revenue, SUM(order_count) AS orders, SUM(quantity) AS items",
+    ),
+]
+ANALYTICS_MAX_DAYS = 731
+
+def _analytics_query(dimensions, start, end):
+    # Whatever a rollup can answer costs O(days) rows; only combinations
+    # like hour x table fall back to the orders in range, found through the
+    # (status, created_at) index.
+    for supported, source, metrics in ANALYTICS_ROLLUPS:
+        if set(dimensions) <= supported:
+            select = ", ".join(f"{ROLLUP_DIMENSIONS[dim]} AS \"{dim}\"" for dim in dimensions)
+            query = f"SELECT {select}, {metrics} FROM {source} WHERE day >= ? AND day < ?"
+            params = [start.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d')]
+            source = source.split()[0]
+            break
+    else:
+        select = ", ".join(f"{ORDER_DIMENSIONS[dim]} AS \"{dim}\"" for dim in dimensions)
+        if "category" in dimensions:
+            # Category revenue has to come from the lines, not order totals
+            rows = f"""
+                SELECT {select}, oi.quantity * oi.price AS revenue, o.id AS order_id, oi.quantity AS quantity
+                FROM {{db}}.orders o
+                JOIN {{db}}.order_items oi ON oi.order_id = o.id
+                LEFT JOIN menu_items mi ON mi.id = oi.menu_item_id
+                LEFT JOIN tables t ON t.id = o.table_id
+                WHERE o.status = 'paid' AND o.created_at >= ? AND o.created_at < ?
+            """
+            metrics = "SUM(revenue) AS revenue, COUNT(DISTINCT order_id) AS orders, SUM(quantity) AS items"
+        else:
+            rows = f"""
+                SELECT {select}, o.total_amount AS revenue
+                FROM {{db}}.orders o
+                LEFT JOIN tables t ON t.id = o.table_id
+                WHERE o.status = 'paid' AND o.created_at >= ? AND o.created_at < ?
+            """
+            metrics = "SUM(revenue) AS revenue, COUNT(*) AS orders"
+        # Archived orders count too; each database's rows are joined
+        # separately and grouped together (see archive.py)
+        rows, params = archive.spanning(
+            rows, [start.strftime('%Y-%m-%d %H:%M:%S'), end.strftime('%Y-%m-%d %H:%M:%S')]
+        )
+        names = ", ".join(f"\"{dim}\"" for dim in dimensions)
+        query = f"SELECT {names}, {metrics} FROM ({rows})"
+        source = "orders"
+    
+    positions = ", ".join(str(i) for i in range(1, len(dimensions) + 1))
+    query += f" GROUP BY {positions} ORDER BY {positions}"
+    return query, params, source
+
+@router.get("/analytics", dependencies=[Depends(check_role(["admin", "manager"]))])
+async def get_sales_analytics(
+    bucket: str = "day",
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    db: Database = Depends(get_db)
+):
+    """
+    Revenue and order counts for paid orders between start and end
+    (inclusive, YYYY-MM-DD; defaults to the last 30 days), grouped by one or
+    more comma-separated buckets: hour, weekday, day, week, month, table,
+    category. E.g. bucket=weekday,hour gives a weekly heatmap.
+    """
+    dimensions = [dim.strip() for dim in bucket.split(",") if dim.strip()]
+    unknown = [dim for dim in dimensions if dim not in ORDER_DIMENSIONS]
+    if not dimensions or unknown or len(set(dimensions)) != len(dimensions):
+        raise HTTPException(
+            status_code=400,
+            detail=f"bucket must be a comma-separated list of: {', '.join(ORDER_DIMENSIONS)}"
+        )
+    
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    end_date = _parse_date(end, "end") if end else today
+    start_date = _parse_date(start, "start") if start else end_date - timedelta(days=29)
+    if start_date > end_date:
+        raise HTTPException(status_code=400, detail="start must not be after end")
+    if (end_date - start_date).days >= ANALYTICS_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"Date range is limited to {ANALYTICS_MAX_DAYS} days")
+    
+    # end is inclusive; the SQL range is half-open
+    query, params, source = _analytics_query(dimensions, start_date, end_date + timedelta(days=1))
+    rows = await db.fetchall(query, params)
+    
+    return {
+        "start": start_date.strftime('%Y-%m-%d'),
+        "end": end_date.strftime('%Y-%m-%d'),
+        "bucket": dimensions,
+        "source": source,
+        "rows": rows
+    }
+
+# Streamed CSV exports. Each report is one query whose rows go from a
+# server-side cursor to the client a batch at a time, so memory stays flat
+# however long the range is. Columns: (header, SQL expression, format).
+def _money(value):
+    return f"{value:.2f}"
+
+REPORTS = {
+    "day_item": {
+        "columns": [
+            ("Date", "day", None),
+            ("Item Name", "name", None),
+            ("Quantity Sold", "quantity", None),
+            ("Revenue (₹)", "revenue", _money),
+        ],
+        "from": "sales_item_daily WHERE day >= ? AND day < ?",
+        "order": "day, name",
+    },
+    "item": {
+        "columns": [
+            ("Item Name", "name", None),
+            ("Quantity Sold", "SUM(quantity)", None),
+            ("Revenue (₹)", "SUM(revenue)", _money),
+        ],
+        "from": "sales_item_daily WHERE day >= ? AND day < ? GROUP BY name",
+        "order": "name",
+    },
+    "day": {
+        "columns": [
+            ("Date", "day", None),
+            ("Orders", "order_count", None),
+            ("Revenue (₹)", "revenue", _money),
+        ],
+        "from": "sales_daily WHERE day >= ? AND day < ?",
+        "order": "day",
+    },
+    "table": {
+        "columns": [
+            ("Table", "COALESCE(t.table_number, 'Unknown')", None),
+            ("Orders", "SUM(r.order_count)", None),
+            ("Revenue (₹)", "SUM(r.revenue)", _money),
+        ],
+        "from": "sales_table_daily r LEFT JOIN tables t ON t.id = r.table_id "
+                "WHERE r.day >= ? AND r.day < ? GROUP BY 1",
+        "order": "1",
+    },
+    "day_table": {
+        "columns": [
+            ("Date", "r.day", None),
+            ("Table", "COALESCE(t.table_number, 'Unknown')", None),
+            ("Orders", "r.order_count", None),
+            ("Revenue (₹)", "r.revenue", _money),
+        ],
+        "from": "sales_table_daily r LEFT JOIN tables t ON t.id = r.table_id WHERE r.day >= ? AND r.day < ?",
+        "order": "r.day, r.table_id",
+    },
+    # Every paid order line, for reconciliation; the one report that is not
+    # served from the rollups, so it spans the archive as well
+    "line": {
+        "columns": [
+            ("Date", "date(o.created_at)", None),
+            ("Time", "time(o.created_at)", None),
+            ("Order ID", "o.id", None),
+            ("Table", "COALESCE(t.table_number, 'Unknown')", None),
+            ("Item Name", "oi.name", None),
+            ("Quantity", "oi.quantity", None),
+            ("Price (₹)", "oi.price", _money),
+            ("Line Total (₹)", "oi.quantity * oi.price", _money),
+        ],
+        "from": "{db}.orders o JOIN {db}.order_items oi ON oi.order_id = o.id "
+                "LEFT JOIN tables t ON t.id = o.table_id "
+                "WHERE o.status = 'paid' AND o.created_at >= ? AND o.created_at < ?",
+        "order": "o.created_at, o.id, oi.id",
+        "timestamps": True,
+        "history": True,
+    },
+}
+REPORT_BATCH_SIZE = 1000
+
+def _report_query(report, start, end):
+    # end is exclusive
+    spec = REPORTS[report]
+    fmt = '%Y-%m-%d %H:%M:%S' if spec.get("timestamps") else '%Y-%m-%d'
+    params = (start.strftime(fmt), end.strftime(fmt))
+    if not spec.get("history"):
+        select = ", ".join(expression for _, expression, _ in spec["columns"])
+        return f"SELECT {select} FROM {spec['from']} ORDER BY {spec['order']}", params
+    
+    # Order history: the query runs once per database (see archive.py) and
+    # the halves are merged on sort keys carried as extra columns. SQLite
+    # only merges when the outer query selects every column; _report_chunks
+    # writes the report columns and ignores the keys after them.
+    columns = [f"{expression} AS c{i}" for i, (_, expression, _) in enumerate(spec["columns"])]
+    keys = [f"{expression} AS k{i}" for i, expression in enumerate(spec["order"].split(", "))]
+    rows, params = archive.spanning(f"SELECT {', '.join(columns + keys)} FROM {spec['from']}", params)
+    order = ", ".join(f"k{i}" for i in range(len(keys)))
+    return f"SELECT * FROM ({rows}) ORDER BY {order}", params
+
+async def _report_chunks(db, report, start, end, gzip_output, empty_row=None):
+    spec = REPORTS[report]
+    formats = [fmt for _, _, fmt in spec["columns"]]
+    query, params = _report_query(report, start, end)
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if gzip_output else None  # 31: gzip container
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    
+    def take():
+        data = buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+        return compressor.compress(data) if compressor else data
+    
+    writer.writerow([header for header, _, _ in spec["columns"]])
+    rows_written = 0
+    async for rows in db.stream(query, params, REPORT_BATCH_SIZE):
+        writer.writerows(
+            [value if fmt is None else fmt(value) for value, fmt in zip(row, formats)]
+            for row in rows
+        )
+        rows_written += len(rows)
+        chunk = take()
+        if chunk:
+            yield chunk
+    
+    if not rows_written and empty_row:
+        writer.writerow(empty_row)
+    chunk = take()
+    if compressor:
+        chunk += compressor.flush()
+    if chunk:
+        yield chunk
+
+def _report_response(request, chunks_for, filename):
+    # Compressed on the fly when the client accepts gzip; the compression
+    # middleware leaves streams alone
+    gzip_output = "gzip" in accepted_encodings(request.headers.get("accept-encoding", ""))
+    headers = {"Content-Disposition": f"attachment; filename={filename}", "Vary": "Accept-Encoding"}
+    if gzip_output:
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(chunks_for(gzip_output), media_type="text/csv", headers=headers)
+
+@router.get("/report", dependencies=[Depends(check_role(["admin", "manager"]))])
+async def download_sales_report(
+    request: Request,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    group: str = "day_item",
+    db: Database = Depends(get_db)
+):
+    """
+    Stream paid sales between start and end (inclusive, YYYY-MM-DD;
+    defaults to the last 30 days) as CSV, one row per: day_item, item, day,
+    table, day_table, or line (every paid order line).
+    """
+    if group not in REPORTS:
+        raise HTTPException(status_code=400, detail=f"group must be one of: {', '.join(REPORTS)}")
+    
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    end_date = _parse_date(end, "end") if end else today
+    start_date = _parse_date(start, "start") if start else end_date - timedelta(days=29)
+    if start_date > end_date:
+        raise HTTPException(status_code=400, detail="start must not be after end")
+    if (end_date - start_date).days >= ANALYTICS_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"Date range is limited to {ANALYTICS_MAX_DAYS} days")
+    
+    first, last = start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d')
+    return _report_response(
+        request,
+        lambda gzip_output: _report_chunks(db, group, start_date, end_date + timedelta(days=1), gzip_output),
+        f"sales_report_{group}_{first}_{last}.csv"
+    )
+
 @router.get("/daily-report", dependencies=[Depends(check_role(["admin", "manager"]))])
-async def download_daily_report(date: str = None):
+async def download_daily_report(request: Request, date: str = None, db: Database = Depends(get_db)):
     """
     Download daily sales report as CSV showing sales per item.
     Date format: YYYY-MM-DD (defaults to today)
     """
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
     # Parse date or use today
     if date:
         try:
@@ -100,65 +457,14 @@ async def download_daily_report(date: str = None):
     # Get start and end of the day
     start_of_day = report_date.replace(hour=0, minute=0, second=0, microsecond=0)
     end_of_day = start_of_day + timedelta(days=1)
-    
-    # Fetch paid orders for the day
-    cursor.execute(
-        "SELECT items, total_amount, created_at FROM orders WHERE status = 'paid' AND created_at >= ? AND created_at < ?",
-        (start_of_day.strftime('%Y-%m-%d %H:%M:%S'), end_of_day.strftime('%Y-%m-%d %H:%M:%S'))
-    )
-    orders = cursor.fetchall()
-    
-    # Aggregate items
-    item_sales = {}
-    
-    for order in orders:
-        items = json.loads(order['items'])
-        for item in items:
-            name = item['name']
-            quantity = item['quantity']
-            price = item['price']
-            revenue = quantity * price
-            
-            if name in item_sales:
-                item_sales[name]['quantity'] += quantity
-                item_sales[name]['revenue'] += revenue
-            else:
-                item_sales[name] = {
-                    'quantity': quantity,
-                    'revenue': revenue
-                }
-    
-    conn.close()
-    
-    # Generate CSV
-    output = io.StringIO()
-    writer = csv.writer(output)
-    
-    # Write header
-    writer.writerow(['Date', 'Item Name', 'Quantity Sold', 'Revenue (₹)'])
-    
-    # Write data
     date_str = report_date.strftime('%Y-%m-%d')
-    for item_name, data in sorted(item_sales.items()):
-        writer.writerow([
-            date_str,
-            item_name,
-            data['quantity'],
-            f"{data['revenue']:.2f}"
-        ])
-    
-    # If no data, add a note
-    if not item_sales:
-        writer.writerow([date_str, 'No sales data', 0, '0.00'])
-    
-    # Prepare CSV for download
-    output.seek(0)
-    
-    # Create filename
-    filename = f"sales_report_{date_str}.csv"
-    
-    return StreamingResponse(
-        iter([output.getvalue()]),
-        media_type="text/csv",
-        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    
+    # One day of the day_item report; say so when nothing was sold
+    return _report_response(
+        request,
+        lambda gzip_output: _report_chunks(
+            db, "day_item", start_of_day, end_of_day, gzip_output,
+            empty_row=[date_str, 'No sales data', 0, '0.00']
+        ),
+        f"sales_report_{date_str}.csv"
     )
@@ -1,8 +1,9 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from pydantic import BaseModel
 from typing import List, Optional
 from middleware.auth import check_role, get_current_active_user
-from database import get_db_connection
+from database import Database, get_db
+import bulk
 
 router = APIRouter(prefix="/api/tables", tags=["tables"])
 
@@ -15,64 +16,46 @@ class TableUpdate(BaseModel):
     status: Optional[str] = None # available, occupied, reserved
 
 @router.get("/")
-async def get_tables():
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM tables")
-    tables = [dict(row) for row in cursor.fetchall()]
-    conn.close()
-    return tables
+async def get_tables(db: Database = Depends(get_db)):
+    return await db.fetchall("SELECT * FROM tables")
 
 @router.post("/", dependencies=[Depends(check_role(["admin", "manager"]))])
-async def create_table(table: TableCreate):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
+async def create_table(table: TableCreate, db: Database = Depends(get_db)):
     try:
-        cursor.execute(
+        table_id, _ = await db.execute(
             "INSERT INTO tables (table_number, capacity) VALUES (?, ?)",
             (table.table_number, table.capacity)
         )
-        conn.commit()
-        table_id = cursor.lastrowid
     except Exception:
-        conn.close()
         raise HTTPException(status_code=400, detail="Table number already exists")
         
-    conn.close()
     return {**table.dict(), "id": table_id, "status": "available"}
 
+@router.post("/bulk", dependencies=[Depends(check_role(["admin", "manager"]))])
+async def bulk_upsert_tables(request: Request, upsert: bool = True, db: Database = Depends(get_db)):
+    # JSON array or CSV of TableCreate rows, matched on table_number; see
+    # bulk.py
+    return await bulk.import_rows(request, db, "tables", "table_number", TableCreate, upsert)
+
 @router.put("/{table_id}", dependencies=[Depends(check_role(["admin", "manager", "staff"]))])
-async def update_table(table_id: int, table: TableUpdate):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
+async def update_table(table_id: int, table: TableUpdate, db: Database = Depends(get_db)):
     update_data = table.dict(exclude_unset=True)
     if not update_data:
-        conn.close()
         return {"message": "No changes provided"}
         
     set_clause = ", ".join([f"{key} = ?" for key in update_data.keys()])
     values = list(update_data.values())
     values.append(table_id)
     
-    cursor.execute(f"UPDATE tables SET {set_clause} WHERE id = ?", values)
-    if cursor.rowcount == 0:
-        conn.close()
+    _, rowcount = await db.execute(f"UPDATE tables SET {set_clause} WHERE id = ?", values)
+    if rowcount == 0:
         raise HTTPException(status_code=404, detail="Table not found")
         
-    conn.commit()
-    conn.close()
     return {"message": "Table updated"}
 
 @router.delete("/{table_id}", dependencies=[Depends(check_role(["admin", "manager"]))])
-async def delete_table(table_id: int):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM tables WHERE id = ?", (table_id,))
-    if cursor.rowcount == 0:
-        conn.close()
+async def delete_table(table_id: int, db: Database = Depends(get_db)):
+    _, rowcount = await db.execute("DELETE FROM tables WHERE id = ?", (table_id,))
+    if rowcount == 0:
         raise HTTPException(status_code=404, detail="Table not found")
-    conn.commit()
-    conn.close()
     return {"message": "Table deleted"}
@@ -0,0 +1,148 @@
+"""Daily/hourly sales rollups.
+
+The rollup tables are maintained in the same transaction that marks an order
+'paid', so dashboard stats and top-items read a handful of rows per day
+instead of scanning order history. Orders are bucketed by their created_at,
+matching how sales have always been reported; categories are taken from
+the menu at the time the order is paid.
+
+Rebuild everything from orders/order_items with:
+
+    python sales_rollup.py
+"""
+import archive
+
+def record_paid_order(conn, order_id, sign=1):
+    # sign=-1 takes a previously paid order back out of the rollups
+    conn.execute(
+        """
+        INSERT INTO sales_daily (day, revenue, order_count)
+        SELECT date(created_at), ? * total_amount, ? FROM orders WHERE id = ?
+        ON CONFLICT (day) DO UPDATE SET
+            revenue = revenue + excluded.revenue,
+            order_count = order_count + excluded.order_count
+        """,
+        (sign, sign, order_id)
+    )
+    conn.execute(
+        """
+        INSERT INTO sales_hourly (day, hour, revenue, order_count)
+        SELECT date(created_at), CAST(strftime('%H', created_at) AS INTEGER), ? * total_amount, ?
+        FROM orders WHERE id = ?
+        ON CONFLICT (day, hour) DO UPDATE SET
+            revenue = revenue + excluded.revenue,
+            order_count = order_count + excluded.order_count
+        """,
+        (sign, sign, order_id)
+    )
+    conn.execute(
+        """
+        INSERT INTO sales_item_daily (day, name, quantity, revenue)
+        SELECT date(o.created_at), oi.name, ? * SUM(oi.quantity), ? * SUM(oi.quantity * oi.price)
+        FROM orders o
+        JOIN order_items oi ON oi.order_id = o.id
+        WHERE o.id = ?
+        GROUP BY oi.name
+        ON CONFLICT (day, name) DO UPDATE SET
+            quantity = quantity + excluded.quantity,
+            revenue = revenue + excluded.revenue
+        """,
+        (sign, sign, order_id)
+    )
+    conn.execute(
+        """
+        INSERT INTO sales_table_daily (day, table_id, revenue, order_count)
+        SELECT date(created_at), COALESCE(table_id, 0), ? * total_amount, ? FROM orders WHERE id = ?
+        ON CONFLICT (day, table_id) DO UPDATE SET
+            revenue = revenue + excluded.revenue,
+            order_count = order_count + excluded.order_count
+        """,
+        (sign, sign, order_id)
+    )
+    conn.execute(
+        """
+        INSERT INTO sales_category_daily (day, category, revenue, quantity, order_count)
+        SELECT date(o.created_at), COALESCE(mi.category, 'Uncategorized'),
+               ? * SUM(oi.quantity * oi.price), ? * SUM(oi.quantity), ?
+        FROM orders o
+        JOIN order_items oi ON oi.order_id = o.id
+        LEFT JOIN menu_items mi ON mi.id = oi.menu_item_id
+        WHERE o.id = ?
+        GROUP BY 1, 2
+        ON CONFLICT (day, category) DO UPDATE SET
+            revenue = revenue + excluded.revenue,
+            quantity = quantity + excluded.quantity,
+            order_count = order_count + excluded.order_count
+        """,
+        (sign, sign, sign, order_id)
+    )
+
+# Paid orders and their lines, read from {db}.orders/{db}.order_items so
+# the rebuild can span the archive (see archive.spanning)
+PAID_ORDERS = "SELECT o.id, o.table_id, o.total_amount, o.created_at FROM {db}.orders o WHERE o.status = 'paid'"
+PAID_LINES = (
+    "SELECT o.id AS order_id, o.created_at, oi.menu_item_id, oi.name, oi.quantity, oi.price "
+    "FROM {db}.orders o JOIN {db}.order_items oi ON oi.order_id = o.id WHERE o.status = 'paid'"
+)
+
+# How each rollup table is rebuilt from paid orders
+BACKFILL_SQL = {
+    "sales_daily": """
+        INSERT INTO sales_daily (day, revenue, order_count)
+        SELECT date(created_at), SUM(total_amount), COUNT(*)
+        FROM ({paid_orders})
+        GROUP BY date(created_at)
+    """,
+    "sales_hourly": """
+        INSERT INTO sales_hourly (day, hour, revenue, order_count)
+        SELECT date(created_at), CAST(strftime('%H', created_at) AS INTEGER), SUM(total_amount), COUNT(*)
+        FROM ({paid_orders})
+        GROUP BY 1, 2
+    """,
+    "sales_item_daily": """
+        INSERT INTO sales_item_daily (day, name, quantity, revenue)
+        SELECT date(created_at), name, SUM(quantity), SUM(quantity * price)
+        FROM ({paid_lines})
+        GROUP BY 1, 2
+    """,
+    "sales_table_daily": """
+        INSERT INTO sales_table_daily (day, table_id, revenue, order_count)
+        SELECT date(created_at), COALESCE(table_id, 0), SUM(total_amount), COUNT(*)
+        FROM ({paid_orders})
+        GROUP BY 1, 2
+    """,
+    "sales_category_daily": """
+        INSERT INTO sales_category_daily (day, category, revenue, quantity, order_count)
+        SELECT date(l.created_at), COALESCE(mi.category, 'Uncategorized'),
+               SUM(l.quantity * l.price), SUM(l.quantity), COUNT(DISTINCT l.order_id)
+        FROM ({paid_lines}) l
+        LEFT JOIN menu_items mi ON mi.id = l.menu_item_id
+        GROUP BY 1, 2
+    """,
+}
+
+def backfill(conn, tables=None):
+    # Recompute rollups from scratch; safe to re-run at any time. Migrations
+    # pass the tables they create, the command line rebuilds all of them.
+    # Archived orders count too when the archive is attached.
+    if archive.is_attached(conn):
+        sources = {
+            "paid_orders": archive.spanning(PAID_ORDERS)[0],
+            "paid_lines": archive.spanning(PAID_LINES)[0],
+        }
+    else:
+        sources = {"paid_orders": PAID_ORDERS.format(db="main"), "paid_lines": PAID_LINES.format(db="main")}
+    cursor = conn.cursor()
+    for table in tables or BACKFILL_SQL:
+        cursor.execute(f"DELETE FROM {table}")
+        cursor.execute(BACKFILL_SQL[table].format(**sources))
+
+if __name__ == "__main__":
+    from database import init_db, pool
+
+    init_db()
+    with pool.connection() as conn:
+        backfill(conn)
+        conn.commit()
+        days = conn.execute("SELECT COUNT(*) FROM sales_daily").fetchone()[0]
+    print(f"Sales rollups rebuilt for {days} days.")
@@ -0,0 +1,201 @@
+"""Per-statement SQL timing with a slow-query log.
+
+Every connection from get_db_connection() gets two SQLite callbacks: the
+trace callback, which fires as each statement starts, and a progress
+handler, which fires every TRACE_PROGRESS_OPS virtual machine steps while
+one runs. A statement's time runs from its start to the last progress tick
+seen before the next statement starts or the connection goes idle, so
+fetching rows counts but the gaps while Python handles them mostly do not.
+The resolution is one tick: a statement that finishes in fewer steps (a
+keyed lookup, BEGIN, COMMIT) is counted with no time, which is fine for a
+log that is after the expensive ones.
+
+Statements are aggregated by their normalized text (literals and IN lists
+folded into ``?``), per process. One that runs for SLOW_QUERY_MS or longer
+is logged with its EXPLAIN QUERY PLAN once its connection is idle; the plan
+is taken with the real values, but only the normalized text is logged or
+kept, so no password hash or token ends up in a log line.
+"""
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+
+SQL_TRACE = os.environ.get("DB_TRACE", "1") != "0"
+SLOW_QUERY_MS = float(os.environ.get("DB_SLOW_QUERY_MS", "100"))
+# Steps between progress ticks. A Python callback every 1000 steps costs
+# nothing measurable; every 100 made a full scan ~20% slower.
+TRACE_PROGRESS_OPS = 1000
+# Distinct statements tracked; anything beyond is counted in ``dropped``
+TRACE_MAX_STATEMENTS = 1000
+
+logger = logging.getLogger(__name__)
+
+# String literals and numbers that are not part of a name
+_LITERAL = re.compile(r"'(?:[^']|'')*'|(?<![\w.])\d+(?:\.\d+)?(?:[eE][-+]?\d+)?")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACE = re.compile(r"\s+")
+
+@lru_cache(maxsize=4096)
+def normalize(sql):
+    # The trace callback sees statements with their parameters filled in,
+    # so literals are folded back to placeholders
+    sql = _LITERAL.sub("?", sql)
+    if "IN (" in sql:
+        sql = _IN_LIST.sub("(?, ...)", sql)
+    if "\n" in sql or "  " in sql:
+        sql = _SPACE.sub(" ", sql).strip()
+    return sql
+
+class StatementStats:
+    __slots__ = ("calls", "total", "max", "slow", "plan")
+
+    def __init__(self):
+        self.calls = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.slow = 0
+        self.plan = None
+
+class SQLStats:
+    """Aggregates per normalized statement, shared by every connection.
+
+    Connections record from whichever executor thread is using them, so
+    updates take the lock; it is held for a dict lookup and a few
+    additions.
+    """
+
+    def __init__(self, slow_ms=SLOW_QUERY_MS, max_statements=TRACE_MAX_STATEMENTS):
+        self.slow_seconds = slow_ms / 1000
+        self.max_statements = max_statements
+        self.dropped = 0
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def record(self, sql, seconds):
+        # Returns the normalized statement when the call was slow
+        key = normalize(sql)
+        slow = seconds >= self.slow_seconds
+        with self._lock:
+            entry = self._stats.get(key)
+            if entry is None:
+                if len(self._stats) >= self.max_statements:
+                    self.dropped += 1
+                    return key if slow else None
+                entry = self._stats[key] = StatementStats()
+            entry.calls += 1
+            entry.total += seconds
+            if seconds > entry.max:
+                entry.max = seconds
+            if slow:
+                entry.slow += 1
+        return key if slow else None
+
+    def set_plan(self, key, plan):
+        with self._lock:
+            entry = self._stats.get(key)
+            if entry is not None:
+                entry.plan = plan
+
+    def top(self, limit=20, by="total"):
+        with self._lock:
+            rows = [
+                {
+                    "statement": key,
+                    "calls": entry.calls,
+                    "total_ms": round(entry.total * 1000, 3),
+                    "mean_ms": round(entry.total * 1000 / entry.calls, 3),
+                    "max_ms": round(entry.max * 1000, 3),
+                    "slow_calls": entry.slow,
+                    "plan": entry.plan,
+                }
+                for key, entry in self._stats.items()
+            ]
+        rows.sort(key=lambda row: row[f"{by}_ms"] if by != "calls" else row["calls"], reverse=True)
+        return rows[:limit]
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+            self.dropped = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "statements": len(self._stats),
+                "calls": sum(entry.calls for entry in self._stats.values()),
+                "slow_calls": sum(entry.slow for entry in self._stats.values()),
+                "dropped": self.dropped,
+                "slow_query_ms": self.slow_seconds * 1000,
+            }
+
+sql_stats = SQLStats()
+
+class TracedConnection(sqlite3.Connection):
+    """sqlite3 connection that times its statements into ``sql_stats``.
+
+    Pass as ``factory`` to sqlite3.connect(). Slow statements wait in
+    ``_slow`` until ``flush_trace()`` is called with the connection idle,
+    since a connection cannot run EXPLAIN from inside its own callbacks.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._statement = None
+        self._started = self._last = 0.0
+        self._slow = []
+        self._explaining = False
+        self.set_trace_callback(self._on_statement)
+        self.set_progress_handler(self._on_progress, TRACE_PROGRESS_OPS)
+
+    def _on_statement(self, sql):
+        if self._explaining or sql.startswith("--"):
+            # Our own EXPLAINs, and trigger bodies, which run inside the
+            # statement that fired them
+            return
+        now = time.perf_counter()
+        self._finish()
+        self._statement = sql
+        self._started = self._last = now
+
+    def _on_progress(self):
+        self._last = time.perf_counter()
+        return 0
+
+    def _finish(self):
+        if self._statement is None:
+            return
+        seconds = self._last - self._started
+        key = sql_stats.record(self._statement, seconds)
+        if key is not None:
+            self._slow.append((key, self._statement, seconds))
+        self._statement = None
+
+    def flush_trace(self):
+        # Close out the last statement and log any slow ones with their
+        # plans. Called by the pool and the writer with no statement open.
+        self._finish()
+        if not self._slow:
+            return
+        slow, self._slow = self._slow, []
+        self._explaining = True
+        try:
+            for key, sql, seconds in slow:
+                try:
+                    plan = [row[3] for row in self.execute(f"EXPLAIN QUERY PLAN {sql}")]
+                except sqlite3.Error as exc:
+                    plan = [f"(no plan: {exc})"]
+                sql_stats.set_plan(key, plan)
+                logger.warning("slow query %.1f ms: %s | plan: %s", seconds * 1000, key, "; ".join(plan) or "-")
+        finally:
+            self._explaining = False
+
+def connection_factory():
+    return TracedConnection if SQL_TRACE else sqlite3.Connection
+
+def flush(conn):
+    if isinstance(conn, TracedConnection):
+        conn.flush_trace()
@@ -0,0 +1,128 @@
+"""Recipe-based stock deduction.
+
+A recipe row says how much of an inventory item one unit of a menu item
+uses. When a KOT is created its lines are deducted in the same transaction:
+quantities are summed per ingredient first, so a ticket costs one UPDATE
+per distinct ingredient however many lines share it. Stock is allowed to go
+negative; the kitchen has already been told to cook.
+
+The low-stock set is the partial index idx_inventory_low_stock (rows where
+quantity <= low_stock_threshold), which SQLite keeps up to date on every
+write. Callers get back the items whose level crossed the threshold, in
+either direction, so an event goes out only on the crossing and not on
+every deduction below it.
+"""
+
+def _crossing(row, was_low):
+    # "low" when a change took the item to or under its threshold,
+    # "restocked" when one lifted it back over
+    is_low = row["quantity"] <= row["low_stock_threshold"]
+    if was_low == is_low:
+        return None
+    return {
+        "type": "inventory.low_stock" if is_low else "inventory.restocked",
+        "item": {
+            "id": row["id"],
+            "item_name": row["item_name"],
+            "quantity": row["quantity"],
+            "unit": row["unit"],
+            "low_stock_threshold": row["low_stock_threshold"],
+        },
+    }
+
+def deduct_for_items(conn, items):
+    # ``items`` are order lines (menu_item_id, quantity); returns the
+    # threshold crossings caused by deducting them
+    ordered = {}
+    for item in items:
+        ordered[item["menu_item_id"]] = ordered.get(item["menu_item_id"], 0) + item["quantity"]
+    if not ordered:
+        return []
+
+    placeholders = ", ".join("?" * len(ordered))
+    needed = {}
+    for row in conn.execute(
+        f"SELECT menu_item_id, inventory_item_id, quantity FROM recipes WHERE menu_item_id IN ({placeholders})",
+        list(ordered)
+    ):
+        amount = row["quantity"] * ordered[row["menu_item_id"]]
+        needed[row["inventory_item_id"]] = needed.get(row["inventory_item_id"], 0) + amount
+
+    crossings = []
+    for inventory_item_id, amount in needed.items():
+        # RETURNING gives the level after this write under the write lock,
+        # so the level before is exact even with other writers about
+        rows = conn.execute(
+            "UPDATE inventory SET quantity = quantity - ?, last_updated = CURRENT_TIMESTAMP WHERE id = ? "
+            "RETURNING id, item_name, quantity, unit, low_stock_threshold",
+            (amount, inventory_item_id)
+        ).fetchall()
+        for row in rows:
+            crossing = _crossing(row, row["quantity"] + amount <= row["low_stock_threshold"])
+            if crossing:
+                crossings.append(crossing)
+    return crossings
+
+def update_item(conn, item_id, set_clause, values):
+    # Manual edits: apply ``set_clause`` to one inventory row and return
+    # (found, crossing). The old level is read in the same transaction.
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        before = conn.execute(
+            "SELECT quantity, low_stock_threshold FROM inventory WHERE id = ?", (item_id,)
+        ).fetchone()
+        if before is None:
+            conn.rollback()
+            return False, None
+        row = conn.execute(
+            f"UPDATE inventory SET {set_clause} WHERE id = ? "
+            "RETURNING id, item_name, quantity, unit, low_stock_threshold",
+            list(values) + [item_id]
+        ).fetchall()[0]
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    # A threshold change counts too, so compare against the old level and
+    # the old threshold
+    return True, _crossing(row, before["quantity"] <= before["low_stock_threshold"])
+
+def insert_item(conn, values):
+    # New inventory row from ``values``; returns (id, crossing). An item
+    # that starts at or under its threshold is a crossing into low stock.
+    columns = list(values)
+    row = conn.execute(
+        f"INSERT INTO inventory ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))}) "
+        # An INSERT's RETURNING hands back whole amounts as int; reads of
+        # the REAL columns give floats
+        "RETURNING id, item_name, CAST(quantity AS REAL) AS quantity, unit, "
+        "CAST(low_stock_threshold AS REAL) AS low_stock_threshold",
+        list(values.values())
+    ).fetchall()[0]
+    conn.commit()
+    return row["id"], _crossing(row, False)
+
+def _low_stock_ids(conn):
+    # Served from idx_inventory_low_stock, so it stays cheap
+    return {row[0] for row in conn.execute("SELECT id FROM inventory WHERE quantity <= low_stock_threshold")}
+
+def watch_crossings(conn):
+    # For writes that touch many rows at once (bulk imports): call under
+    # the write lock before writing; the returned function, called before
+    # the commit, gives the crossings between the two low-stock sets
+    was_low = _low_stock_ids(conn)
+
+    def crossings(conn):
+        changed = list(was_low ^ _low_stock_ids(conn))
+        found = []
+        for start in range(0, len(changed), 500):
+            chunk = changed[start:start + 500]
+            placeholders = ", ".join("?" * len(chunk))
+            for row in conn.execute(
+                f"SELECT id, item_name, quantity, unit, low_stock_threshold FROM inventory WHERE id IN ({placeholders}) ORDER BY id",
+                chunk
+            ):
+                found.append(_crossing(row, row["id"] in was_low))
+        return found
+
+    return crossings